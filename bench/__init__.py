@@ -0,0 +1,14 @@
+"""
+🧪 AutoDrop benchmarks
+======================
+
+Offline benchmarks and simulations behind `python main.py bench|simulate|bench-*`.
+They drive the real handlers in main.py against fake Bot API backends and swap
+main's module globals (state, limiter, clock) per run - see harness.patched().
+
+- handlers   bench: handler latency and throughput against a FakeBot
+- simulate   simulate: hours of timer traffic on a virtual clock
+- transport  bench-http, bench-bots: sends through the real HTTP stack
+- loops      bench-loop: asyncio vs uvloop
+- shards     bench-shards: shard worker processes against the state service
+"""
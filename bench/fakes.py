@@ -0,0 +1,191 @@
+"""Fake Telegram backends: an in-process FakeBot and a local HTTP FakeBotAPIServer"""
+
+import asyncio
+import json
+import time
+import urllib.parse
+from collections import deque
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import main
+
+
+class FakeBot:
+    """In-process stand-in for telegram.Bot that records outgoing messages
+    
+    Optionally simulates per-request latency and a global send rate limit
+    (requests beyond the budget wait for their slot, like server-side throttling).
+    """
+    
+    def __init__(self, latency: float = 0.0, rate_limit: float = 0.0):
+        self.latency = latency
+        self.rate_limit = rate_limit  # Messages per second, 0 = unlimited
+        self.next_slot = 0.0
+        self.sent: List[Tuple[float, int, str]] = []  # (clock.monotonic(), chat_id, text)
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        delay = self.latency
+        if self.rate_limit:
+            now = main.clock.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1 / self.rate_limit
+            delay += slot - now
+        if delay:
+            await main.clock.sleep(delay)
+        self.sent.append((main.clock.monotonic(), chat_id, text))
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+class FakeMessage:
+    """Incoming message whose replies go to a FakeBot"""
+    
+    def __init__(self, bot: FakeBot, chat_id: int, text: str = ""):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.reply_markup = None
+    
+    async def reply_text(self, text: str, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, **kwargs)
+
+class FakeCallbackQuery:
+    """Button press whose answers and edits go to a FakeBot"""
+    
+    def __init__(self, bot: FakeBot, user_id: int, data: str, message: Optional[FakeMessage] = None):
+        self.bot = bot
+        self.from_user = SimpleNamespace(id=user_id, first_name="Bench")
+        self.message = message or FakeMessage(bot, user_id)
+        self.data = data
+    
+    def get_bot(self):
+        return self.bot
+    
+    async def answer(self, *args, **kwargs):
+        return True
+    
+    async def edit_message_text(self, text: str, **kwargs):
+        # Like Telegram, the edited message now shows the new view
+        self.message.text = text.strip()
+        self.message.reply_markup = kwargs.get("reply_markup")
+        return await self.bot.send_message(self.message.chat_id, text, **kwargs)
+
+def fake_update(bot: FakeBot, user_id: int, text: str = "") -> SimpleNamespace:
+    """Build an Update-like object for a private chat"""
+    return SimpleNamespace(
+        message=FakeMessage(bot, user_id, text),
+        callback_query=None,
+        effective_user=SimpleNamespace(id=user_id, first_name="Bench"),
+        effective_chat=SimpleNamespace(id=user_id)
+    )
+
+def fake_context(bot: FakeBot, args: Optional[List[str]] = None) -> SimpleNamespace:
+    """Build a CallbackContext-like object"""
+    return SimpleNamespace(bot=bot, args=args or [], application=SimpleNamespace(bot=bot))
+
+class FakeBotAPIServer:
+    """Local HTTP/1.1 keep-alive server answering getMe and sendMessage like the Bot API
+    
+    Serves any number of tokens. Optionally enforces a per-token sends-per-second limit
+    with 429 flood waits, and answers 403 where forbidden(token, chat_id) says the
+    receiver never started that bot.
+    """
+    
+    def __init__(self, latency: float = 0.02, host: str = "127.0.0.1", rate_limit: float = 0,
+                 forbidden: Optional[Callable[[str, int], bool]] = None):
+        self.latency = latency
+        self.host = host
+        self.rate_limit = rate_limit
+        self.forbidden = forbidden
+        self.port = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.requests = 0
+        self.connections = 0
+        self.sent: List[Tuple[float, int]] = []  # (time.monotonic(), chat_id) per sendMessage
+        self.sent_by_token: Dict[str, int] = {}
+        self.recent: Dict[str, deque] = {}  # token -> send times in the last second
+        self.flood_waits = 0
+        self.forbidden_sends = 0
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until the client closes it"""
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                token_path, _, method = request_line.split()[1].decode().rpartition("/")
+                token = token_path.rsplit("/", 1)[-1][len("bot"):]
+                
+                await asyncio.sleep(self.latency)
+                self.requests += 1
+                status, response = self.respond(token, method, headers, body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    b"HTTP/1.1 %s\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n%s" % (status.encode(), len(payload), payload)
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    def respond(self, token: str, method: str, headers: dict, body: bytes) -> Tuple[str, dict]:
+        """HTTP status and Bot API response for a request"""
+        if method == "getMe":
+            bot = int(main.bot_id(token)) if main.bot_id(token).isdigit() else 1
+            return "200 OK", {"ok": True, "result": {
+                "id": bot, "is_bot": True, "first_name": "Bench", "username": f"bench_{bot}_bot",
+            }}
+        if headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {key: values[0] for key, values in urllib.parse.parse_qs(body.decode()).items()}
+        chat_id = int(params.get("chat_id", 0))
+        
+        if self.forbidden and self.forbidden(token, chat_id):
+            self.forbidden_sends += 1
+            return "403 Forbidden", {
+                "ok": False, "error_code": 403, "description": "Forbidden: bot can't initiate conversation with a user",
+            }
+        if self.rate_limit:
+            now = time.monotonic()
+            recent = self.recent.setdefault(token, deque())
+            while recent and recent[0] <= now - 1:
+                recent.popleft()
+            if len(recent) >= self.rate_limit:
+                self.flood_waits += 1
+                return "429 Too Many Requests", {
+                    "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            recent.append(now)
+        
+        self.sent.append((time.monotonic(), chat_id))
+        self.sent_by_token[token] = self.sent_by_token.get(token, 0) + 1
+        return "200 OK", {"ok": True, "result": {
+            "message_id": self.requests,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }}
@@ -0,0 +1,165 @@
+"""`bench`: the real handlers against an in-process FakeBot"""
+
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import main
+from bench.fakes import FakeBot, FakeCallbackQuery, FakeMessage, fake_context, fake_update
+from bench.harness import build_benchmark_state, fresh_send_limiter, patched, percentile, synthetic_ip, write_report
+
+
+async def bench_message_handler(args, bot: FakeBot, rng: random.Random) -> List[float]:
+    """Sender pushes batches of IPs"""
+    latencies = []
+    base = args.ips + args.receivers * args.history
+    for op in range(args.ops):
+        text = "\n".join(synthetic_ip(base + op * args.push_size + i) for i in range(args.push_size))
+        start = time.perf_counter()
+        await main.message_handler(fake_update(bot, 1, text), fake_context(bot))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def bench_handle_get_ip(args, bot: FakeBot, rng: random.Random) -> List[float]:
+    """Receivers press "Get IP Now\""""
+    latencies = []
+    receivers = sorted(main.bot_data.receivers)
+    for _ in range(args.ops):
+        query = FakeCallbackQuery(bot, rng.choice(receivers), "get_ip")
+        start = time.perf_counter()
+        await main.handle_get_ip(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def bench_get_command(args, bot: FakeBot, rng: random.Random) -> List[float]:
+    """Receivers (re)start their timers with /get"""
+    latencies = []
+    receivers = sorted(main.bot_data.receivers)
+    try:
+        for _ in range(args.ops):
+            user_id = rng.choice(receivers)
+            start = time.perf_counter()
+            await main.get_command(fake_update(bot, user_id, "/get 300"), fake_context(bot, ["300"]))
+            latencies.append(time.perf_counter() - start)
+    finally:
+        for task in main.user_timers.values():
+            task.cancel()
+        await asyncio.gather(*main.user_timers.values(), return_exceptions=True)
+        main.user_timers.clear()
+    return latencies
+
+async def bench_button_storm(args, bot: FakeBot, rng: random.Random) -> List[float]:
+    """A few receivers mash "My Status", "Status" and "Get IP Now" (throttled, cached views)"""
+    main.user_throttle.window = main.THROTTLE_WINDOW
+    latencies = []
+    receivers = sorted(main.bot_data.receivers)[:max(1, args.ops // 50)]
+    messages = {user_id: FakeMessage(bot, user_id) for user_id in receivers}
+    for _ in range(args.ops):
+        user_id = rng.choice(receivers)
+        query = FakeCallbackQuery(bot, user_id, rng.choice(("my_status", "status", "get_ip")), messages[user_id])
+        update = SimpleNamespace(
+            message=None,
+            callback_query=query,
+            effective_user=query.from_user,
+            effective_chat=SimpleNamespace(id=user_id)
+        )
+        start = time.perf_counter()
+        await main.button_handler(update, fake_context(bot))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def bench_start_user_timer(args, bot: FakeBot, rng: random.Random) -> List[float]:
+    """Timer deliveries with a zero interval until --ops IPs were sent"""
+    app = SimpleNamespace(bot=bot)
+    # Roughly ten cycles per timer so cycle latency has samples
+    timer_users = sorted(main.bot_data.receivers)[:max(1, args.ops // 10)]
+    for user_id in timer_users:
+        main.bot_data.active_timers[user_id] = True
+    tasks = [asyncio.create_task(main.start_user_timer(user_id, 0, app)) for user_id in timer_users]
+    
+    while len(bot.sent) < args.ops and not all(task.done() for task in tasks):
+        await asyncio.sleep(0)
+    for user_id in timer_users:
+        main.bot_data.active_timers[user_id] = False
+    await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # Latency of a timer cycle = gap between consecutive sends to the same receiver
+    latencies = []
+    last_sent: Dict[int, float] = {}
+    for sent_at, chat_id, _ in bot.sent:
+        if chat_id in last_sent:
+            latencies.append(sent_at - last_sent[chat_id])
+        last_sent[chat_id] = sent_at
+    return latencies
+
+BENCHMARK_SCENARIOS = {
+    "message_handler": bench_message_handler,
+    "handle_get_ip": bench_handle_get_ip,
+    "get_command": bench_get_command,
+    "button_storm": bench_button_storm,
+    "start_user_timer": bench_start_user_timer,
+}
+
+def run_benchmark_scenario(name: str, args, data_file: Optional[str], trace_memory: bool) -> dict:
+    """Run one scenario against fresh synthetic state"""
+    rng = random.Random(args.seed)
+    if trace_memory:
+        tracemalloc.start()
+    main.render_cache.clear()
+    bot = FakeBot()
+    
+    # Scenarios measure the handlers themselves unless they opt back into throttling
+    with patched(bot_data=build_benchmark_state(args, data_file), user_throttle=main.UserThrottle(window=0),
+                 send_limiter=fresh_send_limiter()):
+        start = time.perf_counter()
+        latencies = asyncio.run(BENCHMARK_SCENARIOS[name](args, bot, rng))
+        elapsed = time.perf_counter() - start
+    
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    ops = len(bot.sent) if name == "start_user_timer" else len(latencies)
+    return {
+        "ops": ops,
+        "seconds": elapsed,
+        "throughput_per_s": ops / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_memory_bytes": peak,
+        "messages_sent": len(bot.sent),
+    }
+
+def run_benchmark_suite(args):
+    """Drive the real handlers against a fake Bot and write JSON results"""
+    logging.getLogger().setLevel(args.log_level)
+    scenarios = args.scenarios.split(",") if args.scenarios else list(BENCHMARK_SCENARIOS)
+    unknown = [name for name in scenarios if name not in BENCHMARK_SCENARIOS]
+    if unknown:
+        print(f"❌ Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(BENCHMARK_SCENARIOS)})")
+        return
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file = os.path.join(tmp_dir, "bench_data.json") if args.persist else None
+        for name in scenarios:
+            print(f"⏱️  {name} ...", flush=True)
+            # Timing pass without tracing overhead, then a memory pass
+            result = run_benchmark_scenario(name, args, data_file, trace_memory=False)
+            result["peak_memory_bytes"] = run_benchmark_scenario(
+                name, args, data_file, trace_memory=True
+            )["peak_memory_bytes"]
+            results[name] = result
+            print(
+                f"   {result['throughput_per_s']:.1f} ops/s, "
+                f"p50 {result['p50_ms']:.3f}ms, p99 {result['p99_ms']:.3f}ms, "
+                f"peak {result['peak_memory_bytes'] / 1048576:.1f} MiB"
+            )
+    
+    write_report(args, results)
@@ -0,0 +1,90 @@
+"""Shared benchmark plumbing: synthetic state, global swapping, statistics and reports"""
+
+import json
+import platform
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+import main
+
+
+def synthetic_ip(n: int) -> str:
+    """Deterministic IPv4 address for index n"""
+    return main.int_to_ip(0x0A000000 + n)  # Start at 10.0.0.0
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def jain_fairness(values: List[float]) -> float:
+    """Jain's fairness index (1.0 = perfectly even)"""
+    if not values or not any(values):
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
+
+def build_benchmark_state(args, data_file: Optional[str]) -> "main.BotData":
+    """Generate a synthetic BotData workload"""
+    data = main.BotData(data_file=None)
+    data.senders = {1}
+    data.receivers = set(range(1000, 1000 + args.receivers))
+    data.ip_queue = [synthetic_ip(i) for i in range(args.ips)]
+    # Prior history from a disjoint range so lookups scan realistic lists
+    history_base = args.ips
+    for offset, user_id in enumerate(sorted(data.receivers)):
+        start = history_base + offset * args.history
+        data.distributed_ips[user_id] = [synthetic_ip(start + i) for i in range(args.history)]
+    data.sending_active = True
+    data.data_file = data_file
+    return data
+
+def fresh_send_limiter() -> "main.SendLimiter":
+    """Send limiter for one event loop - limiter waiters are bound to the loop they were created on"""
+    return main.SendLimiter(main.SEND_CONCURRENCY or main.HTTP_POOL_SIZE)
+
+@contextmanager
+def patched(**values):
+    """Swap main's module globals (bot_data=..., send_limiter=...) for one run, restoring them afterwards"""
+    original = {name: getattr(main, name) for name in values}
+    for name, value in values.items():
+        setattr(main, name, value)
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(main, name, value)
+
+def write_report(args, results: dict) -> dict:
+    """Write the JSON results file, then compare it against --baseline when given"""
+    report = {
+        "bot_version": main.__version__,
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(),
+        "params": {key: value for key, value in vars(args).items() if key != "command"},
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+    
+    if getattr(args, "baseline", None):
+        compare_benchmark_results(args.baseline, report)
+    return report
+
+def compare_benchmark_results(baseline_file: str, report: dict):
+    """Print throughput and latency deltas against an earlier results file"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    print(f"\n📊 Compared to {baseline_file} (v{baseline.get('bot_version', '?')}):")
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            print(f"   {name}: no baseline")
+            continue
+        throughput_delta = (result["throughput_per_s"] / previous["throughput_per_s"] - 1) * 100 if previous["throughput_per_s"] else 0.0
+        p99_delta = (result["p99_ms"] / previous["p99_ms"] - 1) * 100 if previous["p99_ms"] else 0.0
+        print(f"   {name}: throughput {throughput_delta:+.1f}%, p99 {p99_delta:+.1f}%")
@@ -0,0 +1,125 @@
+"""`bench-loop`: the same timer and handler workload on each event loop implementation"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Dict, List
+
+import main
+from bench.fakes import FakeBotAPIServer, FakeCallbackQuery
+from bench.harness import build_benchmark_state, fresh_send_limiter, patched, percentile, write_report
+
+
+def new_event_loop(name: str) -> asyncio.AbstractEventLoop:
+    """Create an event loop of the given kind ("asyncio" or "uvloop")"""
+    if name == "uvloop":
+        import uvloop
+        return uvloop.new_event_loop()
+    return asyncio.SelectorEventLoop() if sys.platform != "win32" else asyncio.new_event_loop()
+
+async def bench_event_loop(args) -> dict:
+    """Timer jitter, loop lag and "Get IP Now" throughput on the running loop against a fake Bot API"""
+    server = FakeBotAPIServer(latency=args.latency)
+    await server.start()
+    app = main.build_application("123456:BENCH", main.HTTP_POOL_SIZE, server.base_url).build()
+    await app.initialize()
+    loop = asyncio.get_running_loop()
+    lags: List[float] = []
+    
+    async def sample_lag(interval: float = 0.01):
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - start - interval))
+    
+    sampler = asyncio.create_task(sample_lag())
+    try:
+        # Phase 1: receiver timers firing every args.interval
+        timer_users = sorted(main.bot_data.receivers)[:args.timers]
+        for user_id in timer_users:
+            main.bot_data.active_timers[user_id] = True
+        timers = [asyncio.create_task(main.start_user_timer(user_id, args.interval, app)) for user_id in timer_users]
+        await asyncio.sleep(args.seconds)
+        for task in timers:
+            task.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+        timer_lags, lags[:] = lags[:], []
+        timer_deliveries = len(server.sent)
+        
+        jitter = []
+        last_sent: Dict[int, float] = {}
+        for sent_at, chat_id in server.sent:
+            if chat_id in last_sent:
+                jitter.append(max(0.0, sent_at - last_sent[chat_id] - args.interval))
+            last_sent[chat_id] = sent_at
+        
+        # Phase 2: concurrent button presses (IP send + message edit each)
+        receivers = sorted(main.bot_data.receivers)
+        latencies = []
+        
+        async def press(n: int):
+            start = time.perf_counter()
+            await main.handle_get_ip(FakeCallbackQuery(app.bot, receivers[n % len(receivers)], "get_ip"))
+            latencies.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(press(n) for n in range(args.ops)))
+        elapsed = time.perf_counter() - start
+    finally:
+        sampler.cancel()
+        await app.shutdown()
+        await server.stop()
+    
+    return {
+        "timer_deliveries": timer_deliveries,
+        "timer_jitter_p50_ms": percentile(jitter, 0.50) * 1000,
+        "timer_jitter_p99_ms": percentile(jitter, 0.99) * 1000,
+        "timer_loop_lag_p99_ms": percentile(timer_lags, 0.99) * 1000,
+        "ops": args.ops,
+        "seconds": elapsed,
+        "throughput_per_s": args.ops / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "handler_loop_lag_p99_ms": percentile(lags, 0.99) * 1000,
+    }
+
+def run_loop_benchmark(args):
+    """Run the same timer and handler workload on each event loop implementation"""
+    logging.getLogger().setLevel(args.log_level)
+    args.ips = args.ips or int(args.timers * args.seconds / args.interval) * 2 + args.ops
+    results = {}
+    
+    for name in args.loops:
+        if name == "uvloop":
+            try:
+                import uvloop  # noqa: F401
+            except ImportError:
+                print("⏭️  uvloop is not installed (pip install uvloop), skipped")
+                continue
+        print(f"⏱️  {name} ...", flush=True)
+        loop = new_event_loop(name)
+        asyncio.set_event_loop(loop)
+        try:
+            with patched(bot_data=build_benchmark_state(args, None), send_limiter=fresh_send_limiter()):
+                result = loop.run_until_complete(bench_event_loop(args))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        results[name] = result
+        print(
+            f"   timers: {result['timer_deliveries']} deliveries, jitter p50 {result['timer_jitter_p50_ms']:.2f}ms, "
+            f"p99 {result['timer_jitter_p99_ms']:.2f}ms, loop lag p99 {result['timer_loop_lag_p99_ms']:.2f}ms"
+        )
+        print(
+            f"   get_ip: {result['throughput_per_s']:.1f} ops/s, p50 {result['p50_ms']:.2f}ms, "
+            f"p99 {result['p99_ms']:.2f}ms, loop lag p99 {result['handler_loop_lag_p99_ms']:.2f}ms"
+        )
+    
+    if "asyncio" in results and "uvloop" in results:
+        base, fast = results["asyncio"], results["uvloop"]
+        speedup = fast["throughput_per_s"] / base["throughput_per_s"] if base["throughput_per_s"] else 0.0
+        print(f"📊 uvloop vs asyncio: handler throughput x{speedup:.2f}, "
+              f"timer jitter p99 {fast['timer_jitter_p99_ms']:.2f}ms vs {base['timer_jitter_p99_ms']:.2f}ms")
+    
+    write_report(args, results)
@@ -0,0 +1,154 @@
+"""`bench-shards`: timer delivery throughput of 1..n real shard workers against the primary's state service
+
+Each worker is main.run_shard_worker in its own process - assignments, sync_shard_timers,
+start_user_timer and real Bot API sends through the HTTP stack - pointed at a
+FakeBotAPIServer running in a process of its own. The receivers, their timer interval and
+the total number of in-flight sends stay the same for every worker count (the send slots
+are split between the workers), so a throughput gain comes from the added processes and
+not from more sends in the air. The per-send work is the real client stack's CPU time, so
+expect scaling only up to the host's free cores.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import main
+from bench.fakes import FakeBotAPIServer
+from bench.harness import patched, percentile, synthetic_ip, write_report
+
+BENCH_TOKEN = "123456:SHARDS"
+
+
+def serve_fake_bot_api(latency: float, ports: multiprocessing.Queue):
+    """Entry point of the fake Bot API process (runs until terminated)"""
+    async def serve():
+        server = FakeBotAPIServer(latency=latency)
+        await server.start()
+        ports.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def run_bench_shard_worker(shard_index: int, shard_count: int, tmp_dir: str, base_url: str, args):
+    """Entry point of one benchmark worker process: main.run_shard_worker pointed at the fakes"""
+    # STATE_SOCKET_PATH and LOG_FILE are relative, so the socket and worker logs resolve in tmp_dir
+    os.chdir(tmp_dir)
+    build_application = main.build_application
+    send_slots = max(1, args.concurrency // shard_count)
+    with patched(
+        build_application=lambda: build_application(BENCH_TOKEN, send_slots, base_url),
+        send_limiter=main.SendLimiter(send_slots),
+        LOG_LEVEL=args.log_level,
+    ):
+        main.run_shard_worker(shard_index, shard_count)
+
+class BenchStateService(main.StateService):
+    """State service that also timestamps each commit and its delay behind the timer tick"""
+
+    def __init__(self, path: str, save_interval: float):
+        super().__init__(path, save_interval)
+        self.commits = []  # (time.perf_counter(), delay)
+
+    def handle_request(self, request: dict) -> dict:
+        if request.get("op") == "commit":
+            self.commits.append((time.perf_counter(), request.get("delay") or 0.0))
+        return super().handle_request(request)
+
+def build_shard_state(args, path: str) -> "main.BotData":
+    """Receivers with active timers at args.interval and a queue deep enough for the run"""
+    data = main.BotData(path, "snapshot", autoload=False)
+    data.receivers = set(range(1000, 1000 + args.receivers))
+    data.user_intervals = {user_id: args.interval for user_id in data.receivers}
+    data.active_timers = {user_id: True for user_id in data.receivers}
+    data.ip_queue = [synthetic_ip(n) for n in range(args.ips)]
+    data.sending_active = True
+    data.save_data()
+    return data
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+async def bench_workers(args, tmp_dir: str, base_url: str, workers: int) -> dict:
+    """Run workers shard processes for args.warmup + args.seconds against a fresh state service"""
+    data = build_shard_state(args, os.path.join(tmp_dir, f"state{workers}.snap"))
+    service = BenchStateService(os.path.join(tmp_dir, main.STATE_SOCKET_PATH), save_interval=args.save_interval)
+    ctx = multiprocessing.get_context("spawn")
+    saves = main.metrics.counters.get("saves_total", {}).get((), 0)
+    cpu = children_cpu_seconds()
+
+    with patched(bot_data=data):
+        await service.start()
+        processes = [
+            ctx.Process(target=run_bench_shard_worker, args=(shard_index, workers, tmp_dir, base_url, args), daemon=True)
+            for shard_index in range(workers)
+        ]
+        try:
+            for process in processes:
+                process.start()
+            # Spawn, import and the first timer ticks fall into the warmup
+            await asyncio.sleep(args.warmup)
+            window_start = time.perf_counter()
+            await asyncio.sleep(args.seconds)
+            window_end = time.perf_counter()
+        finally:
+            # SIGTERM makes each worker drain its in-flight sends, committing through the service
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                await asyncio.to_thread(process.join, main.SHUTDOWN_DRAIN_TIMEOUT + 5)
+            await service.stop()
+
+    measured = [delay for at, delay in service.commits if window_start <= at < window_end]
+    worker_cpu = children_cpu_seconds() - cpu
+    return {
+        "workers": workers,
+        "send_slots_per_worker": max(1, args.concurrency // workers),
+        "deliveries": len(measured),
+        "seconds": args.seconds,
+        "throughput_per_s": len(measured) / args.seconds,
+        # Commit time behind the timer tick: how far the workers fall behind their schedule
+        "p50_ms": percentile(measured, 0.50) * 1000,
+        "p99_ms": percentile(measured, 0.99) * 1000,
+        "worker_cpu_ms_per_delivery": worker_cpu * 1000 / len(service.commits) if service.commits else 0.0,
+        "saves": main.metrics.counters.get("saves_total", {}).get((), 0) - saves,
+        "queue_left": len(data.ip_queue),
+    }
+
+def run_shard_benchmark(args):
+    """Measure timer deliveries per second as shard workers are added"""
+    logging.getLogger().setLevel(args.log_level)
+    offered = args.receivers / args.interval
+    print(f"📨 {args.receivers} timers every {args.interval}s offer {offered:.0f} deliveries/s, "
+          f"{args.concurrency} send slots in total")
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    ports = ctx.Queue()
+    api_server = ctx.Process(target=serve_fake_bot_api, args=(args.latency, ports), daemon=True)
+    api_server.start()
+
+    try:
+        base_url = f"http://127.0.0.1:{ports.get(timeout=30)}/bot"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for workers in args.workers:
+                print(f"⏱️  {workers} workers ...", flush=True)
+                result = asyncio.run(bench_workers(args, tmp_dir, base_url, workers))
+                results[f"workers_{workers}"] = result
+                print(
+                    f"   {result['throughput_per_s']:.1f} deliveries/s, behind schedule p50 {result['p50_ms']:.1f}ms, "
+                    f"p99 {result['p99_ms']:.1f}ms, {result['worker_cpu_ms_per_delivery']:.2f} worker CPU ms/delivery, "
+                    f"{result['saves']} saves"
+                )
+                if not result["queue_left"]:
+                    print("   ⚠️ Queue ran dry, raise --ips for a full measurement")
+    finally:
+        api_server.terminate()
+        api_server.join()
+
+    print(f"   Host CPUs: {os.cpu_count()} - throughput stops scaling once the workers, the state service and the fake API share them all")
+    write_report(args, results)
@@ -0,0 +1,163 @@
+"""`simulate`: hours of receiver timer traffic fast-forwarded on a virtual clock"""
+
+import asyncio
+import logging
+import random
+import selectors
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import main
+from bench.fakes import FakeBot
+from bench.harness import build_benchmark_state, fresh_send_limiter, jain_fairness, patched, percentile, write_report
+
+
+class VirtualClock(main.Clock):
+    """Clock of a VirtualTimeLoop, wall time starts at `epoch`"""
+    
+    def __init__(self, loop: "VirtualTimeLoop", epoch: float = 0.0):
+        self.loop = loop
+        self.epoch = epoch
+    
+    def monotonic(self) -> float:
+        return self.loop.time()
+    
+    def time(self) -> float:
+        return self.epoch + self.loop.time()
+
+class FastForwardSelector(selectors.DefaultSelector):
+    """Selector that skips idle waits by advancing its loop's virtual clock"""
+    
+    def __init__(self):
+        super().__init__()
+        self.loop: Optional["VirtualTimeLoop"] = None
+    
+    def select(self, timeout: Optional[float] = None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            # Nothing scheduled - only real I/O can make progress
+            return super().select(None)
+        self.loop.advance(timeout)
+        return []
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next scheduled callback when idle
+    
+    Deterministic for code that only waits on timers (asyncio.sleep, call_later),
+    which lets hours of timer traffic run in seconds.
+    """
+    
+    def __init__(self):
+        self.virtual_now = 0.0
+        selector = FastForwardSelector()
+        super().__init__(selector)
+        selector.loop = self
+    
+    def time(self) -> float:
+        return self.virtual_now
+    
+    def advance(self, seconds: float):
+        """Move the virtual clock forward"""
+        self.virtual_now += seconds
+
+def run_virtual(coro, epoch: float = 0.0):
+    """Run a coroutine on a VirtualTimeLoop with main's clock and send limiter switched to it"""
+    loop = VirtualTimeLoop()
+    with patched(clock=VirtualClock(loop, epoch), send_limiter=fresh_send_limiter()):
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(coro)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+async def simulate_timer_traffic(args, bot: FakeBot, rng: random.Random) -> dict:
+    """Run receiver timers for args.hours of virtual time"""
+    app = SimpleNamespace(bot=bot)
+    duration = args.hours * 3600
+    low, high = args.interval_range
+    intervals = {user_id: rng.randint(low, high) for user_id in main.bot_data.receivers}
+    offsets = {user_id: rng.uniform(0, intervals[user_id]) for user_id in main.bot_data.receivers}
+    
+    async def staggered_timer(user_id: int):
+        await main.clock.sleep(offsets[user_id])
+        await main.start_user_timer(user_id, intervals[user_id], app)
+    
+    for user_id in main.bot_data.receivers:
+        main.bot_data.active_timers[user_id] = True
+    tasks = [asyncio.create_task(staggered_timer(user_id)) for user_id in main.bot_data.receivers]
+    
+    await main.clock.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # Dispatch lag: how late each delivery was relative to its timer's schedule
+    lags = []
+    per_user: Dict[int, int] = {}
+    per_second: Dict[int, int] = {}
+    last_sent: Dict[int, float] = {}
+    for sent_at, chat_id, _ in bot.sent:
+        expected = last_sent.get(chat_id, offsets[chat_id]) + intervals[chat_id]
+        lags.append(max(0.0, sent_at - expected))
+        last_sent[chat_id] = sent_at
+        per_user[chat_id] = per_user.get(chat_id, 0) + 1
+        per_second[int(sent_at)] = per_second.get(int(sent_at), 0) + 1
+    
+    mean_per_second = len(bot.sent) / duration if duration else 0.0
+    variance = sum(
+        (per_second.get(second, 0) - mean_per_second) ** 2 for second in range(int(duration))
+    ) / max(1, int(duration))
+    # Fairness over deliveries relative to what each receiver's interval allows
+    normalised = [per_user.get(user_id, 0) * intervals[user_id] / duration for user_id in main.bot_data.receivers]
+    
+    return {
+        "virtual_seconds": duration,
+        "deliveries": len(bot.sent),
+        "dispatch_lag_s": {
+            "p50": percentile(lags, 0.50),
+            "p99": percentile(lags, 0.99),
+            "max": max(lags) if lags else 0.0,
+        },
+        "burstiness": {
+            "mean_per_s": mean_per_second,
+            "peak_per_s": max(per_second.values()) if per_second else 0,
+            "cv": variance ** 0.5 / mean_per_second if mean_per_second else 0.0,
+        },
+        "fairness_jain": jain_fairness(normalised),
+    }
+
+def run_timer_simulation(args):
+    """Fast-forward receiver timers on virtual time and report lag, burstiness and fairness"""
+    logging.getLogger().setLevel(args.log_level)
+    rng = random.Random(args.seed)
+    low, high = args.interval_range
+    expected = int(args.receivers * args.hours * 3600 / low) + args.receivers
+    
+    args.ips = args.ips or expected
+    args.history = 0
+    bot = FakeBot(latency=args.send_latency, rate_limit=args.rate_limit)
+    
+    start = time.perf_counter()
+    with patched(bot_data=build_benchmark_state(args, None)):
+        result = run_virtual(simulate_timer_traffic(args, bot, rng))
+    wall = time.perf_counter() - start
+    
+    result["wall_seconds"] = wall
+    result["speedup"] = result["virtual_seconds"] / wall if wall else 0.0
+    
+    print(f"🕒 Simulated {args.hours}h for {args.receivers} receivers in {wall:.1f}s ({result['speedup']:.0f}x)")
+    print(f"   Deliveries: {result['deliveries']}")
+    print(
+        f"   Dispatch lag: p50 {result['dispatch_lag_s']['p50']:.3f}s, "
+        f"p99 {result['dispatch_lag_s']['p99']:.3f}s, max {result['dispatch_lag_s']['max']:.3f}s"
+    )
+    print(
+        f"   Burstiness: mean {result['burstiness']['mean_per_s']:.2f}/s, "
+        f"peak {result['burstiness']['peak_per_s']}/s, CV {result['burstiness']['cv']:.2f}"
+    )
+    print(f"   Fairness (Jain): {result['fairness_jain']:.4f}")
+    write_report(args, {"timer_simulation": result})
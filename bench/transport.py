@@ -0,0 +1,147 @@
+"""`bench-http` and `bench-bots`: deliveries through the real HTTP stack against a FakeBotAPIServer"""
+
+import asyncio
+import logging
+import time
+
+import main
+from bench.fakes import FakeBotAPIServer
+from bench.harness import patched, percentile, synthetic_ip, write_report
+
+BENCH_PRIMARY_TOKEN = "100000:PRIMARY"
+
+
+async def bench_http_pool(args, server: FakeBotAPIServer, pool_size: int) -> dict:
+    """Push args.sends deliveries through a real Bot with a pool of pool_size"""
+    app = main.build_application("123456:BENCH", pool_size, server.base_url).build()
+    await app.initialize()
+    latencies = []
+    
+    async def deliver(n: int):
+        start = time.perf_counter()
+        await main.send_message(app.bot, 1 + n % args.receivers, synthetic_ip(n), kind="ip")
+        latencies.append(time.perf_counter() - start)
+    
+    connections = server.connections
+    start = time.perf_counter()
+    try:
+        with patched(send_limiter=main.SendLimiter(pool_size)):
+            await asyncio.gather(*(deliver(n) for n in range(args.sends)))
+    finally:
+        await app.shutdown()
+    elapsed = time.perf_counter() - start
+    
+    return {
+        "pool_size": pool_size,
+        "sends": args.sends,
+        "seconds": elapsed,
+        "throughput_per_s": args.sends / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "connections_opened": server.connections - connections,
+    }
+
+def run_transport_benchmark(args):
+    """Measure deliveries per second through the HTTP stack at several pool sizes"""
+    logging.getLogger().setLevel(args.log_level)
+    results = {}
+    
+    async def run_all():
+        server = FakeBotAPIServer(latency=args.latency)
+        await server.start()
+        try:
+            for pool_size in args.pool_sizes:
+                print(f"⏱️  pool {pool_size} ...", flush=True)
+                result = await bench_http_pool(args, server, pool_size)
+                results[f"pool_{pool_size}"] = result
+                print(
+                    f"   {result['throughput_per_s']:.1f} deliveries/s, "
+                    f"p50 {result['p50_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms, "
+                    f"{result['connections_opened']} connections"
+                )
+        finally:
+            await server.stop()
+    
+    asyncio.run(run_all())
+    write_report(args, results)
+
+async def bench_delivery_bots(args, server: FakeBotAPIServer, count: int) -> dict:
+    """Push args.sends deliveries through the primary bot plus count delivery bots"""
+    pool = main.DeliveryBotPool(
+        [f"{200000 + n}:DELIVERY" for n in range(count)], rate=args.budget, primary_rate=args.budget,
+    )
+    app = main.build_application(BENCH_PRIMARY_TOKEN, main.HTTP_POOL_SIZE, server.base_url).build()
+    await app.initialize()
+    await pool.start(server.base_url)
+    latencies = []
+    
+    async def deliver(n: int):
+        start = time.perf_counter()
+        while True:
+            try:
+                await main.send_message(app.bot, 1 + n % args.receivers, synthetic_ip(n), kind="ip")
+                break
+            except main.RetryAfter as e:
+                await asyncio.sleep(main.retry_delay(1, e))
+        latencies.append(time.perf_counter() - start)
+    
+    flood_waits, forbidden = server.flood_waits, server.forbidden_sends
+    sent_before = dict(server.sent_by_token)
+    fallbacks_before = dict(main.metrics.counters.get("delivery_bot_fallbacks_total", {}))
+    start = time.perf_counter()
+    try:
+        with patched(send_limiter=main.SendLimiter(main.HTTP_POOL_SIZE), delivery_bots=pool):
+            await asyncio.gather(*(deliver(n) for n in range(args.sends)))
+    finally:
+        await pool.stop()
+        await app.shutdown()
+    elapsed = time.perf_counter() - start
+    fallbacks = {
+        dict(key)["reason"]: value - fallbacks_before.get(key, 0)
+        for key, value in main.metrics.counters.get("delivery_bot_fallbacks_total", {}).items()
+    }
+    
+    return {
+        "delivery_bots": count,
+        "sends": args.sends,
+        "seconds": elapsed,
+        "throughput_per_s": args.sends / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "flood_waits": server.flood_waits - flood_waits,
+        "forbidden": server.forbidden_sends - forbidden,
+        "fallbacks": fallbacks,
+        "sends_by_bot": {
+            main.bot_id(token): sends - sent_before.get(token, 0) for token, sends in server.sent_by_token.items()
+            if sends > sent_before.get(token, 0)
+        },
+    }
+
+def run_delivery_bots_benchmark(args):
+    """Measure rate-limited delivery throughput with 0..n delivery bots next to the primary"""
+    logging.getLogger().setLevel(args.log_level)
+    results = {}
+    
+    def forbidden(token: str, chat_id: int) -> bool:
+        # A stable args.forbidden_percent of receivers never started each delivery bot
+        return token != BENCH_PRIMARY_TOKEN and main.ring_hash(f"{token}/{chat_id}") % 100 < args.forbidden_percent
+    
+    async def run_all():
+        server = FakeBotAPIServer(latency=args.latency, rate_limit=args.rate_limit, forbidden=forbidden)
+        await server.start()
+        try:
+            for count in args.bots:
+                print(f"⏱️  {count} delivery bots ...", flush=True)
+                result = await bench_delivery_bots(args, server, count)
+                results[f"bots_{count}"] = result
+                print(
+                    f"   {result['throughput_per_s']:.1f} deliveries/s, "
+                    f"p50 {result['p50_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms, "
+                    f"{result['flood_waits']} flood waits, fallbacks {result['fallbacks'] or 0}"
+                )
+                print(f"   sends per bot: {result['sends_by_bot']}")
+        finally:
+            await server.stop()
+    
+    asyncio.run(run_all())
+    write_report(args, results)
@@ -7,9 +7,14 @@ Features:
 - Dynamic sender/receiver registration (no hardcoded IDs)
 - Individual IP distribution (no conflicts between users)
 - Timer-based automatic IP delivery (/get interval)
+- Reliable delivery: IPs are only committed once sent, failed sends are retried or requeued
+- Optional per-push TTL: expired IPs are purged in the background and never delivered
+- Admission control: update bursts are queued by priority, status/help views shed under overload
+- Optional delivery bots: IPs spread over extra bot tokens by consistent hashing, each within its own rate budget
 - User-friendly interface with buttons
 - Data persistence (survives restarts)
 - Real-time status tracking
+- Optional sharded mode: timers and sends spread over worker processes
 
 Usage:
 1. Get bot token from @BotFather
@@ -21,69 +26,1980 @@ Commands:
 - /get <seconds> - Start automatic IP delivery
 - /stop_timer - Stop automatic delivery
 - /status - Quick status
+- /tier <user_id> [tier] - Show or set a receiver's delivery tier (senders)
 - /help - Help information
+- /metrics - Latency, counters and gauges (admins)
+- /profile [seconds] - Time-boxed CPU/allocation profile (admins, or SIGUSR1)
+- /who_got <ip>, /history <user_id> - Delivery audit log lookups (admins)
+
+Benchmarks:
+- python main.py bench --ips 100000 --receivers 10000 --output results.json
+- python main.py simulate --receivers 50000 --hours 24 (virtual time)
+- python main.py bench-http --pool-sizes 1,8,32 (local fake Bot API)
+- python main.py bench-bots --bots 0,1,2,4 (rate-limited fake Bot API)
+- python main.py bench-shards --workers 1,2,4 [--save-interval 0] (shard worker scaling)
+- python main.py bench-loop --loops asyncio,uvloop (local fake Bot API)
+- python main.py --startup-profile (time per startup phase)
+
+Backup / migration:
+- python main.py export --output backup.ndjson.gz
+- python main.py import --input backup.ndjson.gz [--replace]
 
 Author: Kiro AI Assistant
 Version: 2.0
 """
 
+from __future__ import annotations  # Annotations may name telegram types before import_telegram()
+
+__version__ = "2.0"
+
+import argparse
+import array
 import asyncio
+import bisect
+import cProfile
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import logging
+import logging.handlers
+import mmap
+import multiprocessing
 import os
+import pstats
+import queue
+import re
 import signal
+import socket
+import struct
 import sys
-from typing import Dict, List, Set, Optional
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import zlib
+from collections import deque
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Callable, Collection, Dict, Iterator, List, Set, Optional, Tuple
 from datetime import datetime
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import Conflict, TelegramError
-from telegram.ext import (
-    Application,
-    ApplicationBuilder,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    ContextTypes,
-    filters,
-)
+
+# Module body starts here (startup profile "module import" phase)
+IMPORT_STARTED = time.perf_counter()
+
+def import_telegram():
+    """Import the telegram stack (most of the import time) into module globals
+    
+    Only the bot, its shard workers and the benchmarks need it, so export/import and
+    snapshot conversion start without it. Called by those entry points before any
+    handler runs; repeat calls are cheap.
+    """
+    global Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+    global BadRequest, Conflict, Forbidden, RetryAfter, TelegramError, HTTPXRequest
+    global Application, ApplicationBuilder, BaseUpdateProcessor, CommandHandler
+    global MessageHandler, CallbackQueryHandler, ContextTypes, filters
+    
+    from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram.error import BadRequest, Conflict, Forbidden, RetryAfter, TelegramError
+    from telegram.request import HTTPXRequest
+    from telegram.ext import (
+        Application,
+        ApplicationBuilder,
+        BaseUpdateProcessor,
+        CommandHandler,
+        MessageHandler,
+        CallbackQueryHandler,
+        ContextTypes,
+        filters,
+    )
+
+# ==============================
+# 🔧 CONFIGURATION
+# ==============================
+
+# Set your bot token here (get from @BotFather)
+BOT_TOKEN = "8222403305:AAHJ9ewwYYNa3lWFm3fZhgBplCP65e6g054"
+
+# Data file for persistence
+DATA_FILE = "bot_data.json"
+
+# State format: "json" (DATA_FILE) or "snapshot" (binary SNAPSHOT_FILE, mmap-loaded)
+DATA_FORMAT = "json"
+SNAPSHOT_FILE = "bot_data.snap"
+STATE_FILE = SNAPSHOT_FILE if DATA_FORMAT == "snapshot" else DATA_FILE
+
+# NDJSON import batch size (records applied to BotData at a time)
+IMPORT_BATCH_SIZE = 10000
+
+# IP expiry: a push may include a "ttl <n>[s|m|h|d]" line, expired IPs are never delivered
+DEFAULT_IP_TTL = 0           # Seconds for pushes without a ttl line (0 = never expire)
+IP_PURGE_INTERVAL = 30       # Seconds between background purges of expired IPs
+IP_PURGE_CHUNK = 1000        # Expired IPs collected per step, the event loop runs between steps
+IP_COMPACT_CHUNK = 50000     # Queue entries scanned per step when removing them from the queue
+
+# Timer limits
+MIN_INTERVAL = 30      # Minimum 30 seconds
+MAX_INTERVAL = 86400   # Maximum 24 hours
+
+# Delivery retries (a failed send keeps its IP reserved for the receiver and is retried)
+DELIVERY_MAX_ATTEMPTS = 5        # Attempts before the IP goes back to the queue for other receivers
+DELIVERY_RETRY_BASE_DELAY = 2    # Seconds before the first retry, doubled on each failure
+DELIVERY_RETRY_MAX_DELAY = 300   # Backoff cap (flood waits use Telegram's retry_after)
+
+# Receiver tiers: higher priority sends are dispatched first while the send limiter is
+# saturated; sla = seconds a delivery may land after its scheduled time before it counts as late
+RECEIVER_TIERS = {
+    "premium": {"priority": 2, "sla": 2},
+    "standard": {"priority": 1, "sla": 10},
+    "basic": {"priority": 0, "sla": 60},
+}
+DEFAULT_TIER = "standard"  # Receivers without an explicit tier (and all non-receiver messages)
+
+# Event loop: "asyncio" (default), "uvloop" (opt-in, pip install uvloop, falls back to asyncio) or "auto" (uvloop if installed)
+EVENT_LOOP = "asyncio"
+
+# Bot API transport: separate pools for sends and for getUpdates long polling
+BOT_API_BASE_URL = "https://api.telegram.org/bot"
+HTTP_VERSION = "1.1"           # "2" is opt-in: needs python-telegram-bot[http2] (h2), otherwise falls back to "1.1"
+HTTP_POOL_SIZE = 32            # Connections for sends
+HTTP_KEEPALIVE_EXPIRY = 30     # Seconds an idle connection stays open for reuse
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 10
+HTTP_WRITE_TIMEOUT = 10
+HTTP_POOL_TIMEOUT = 5          # Seconds a request may wait for a free connection
+UPDATES_POOL_SIZE = 2          # Connections for getUpdates
+UPDATES_READ_TIMEOUT = 40      # Must exceed the long-polling timeout
+SEND_CONCURRENCY = 0           # In-flight sends (0 = HTTP_POOL_SIZE), extra sends queue in-process
+
+# Delivery bots: extra tokens that send IPs on behalf of BOT_TOKEN (updates stay on BOT_TOKEN).
+# Receivers are spread over them by consistent hashing and must press Start in their delivery
+# bot once - until they do, their IPs fall back to the primary bot.
+DELIVERY_BOT_TOKENS: List[str] = []
+DELIVERY_BOT_RATE = 25                 # Sends per second per delivery bot (Telegram allows about 30)
+BOT_SEND_RATE = 0                      # Sends per second for BOT_TOKEN (0 = unlimited, flood waits only)
+DELIVERY_BOT_POOL_SIZE = 8             # Connections per delivery bot
+DELIVERY_RING_REPLICAS = 100           # Hash ring points per delivery bot
+DELIVERY_BOT_FORBIDDEN_TTL = 6 * 3600  # Seconds a receiver skips a delivery bot that answered Forbidden
+
+# Interactive throttling (per user) and rendered status view caching
+THROTTLE_WINDOW = 1.0           # Seconds; repeats of the same button/command by a user are dropped
+STATUS_CACHE_TTL = 5.0          # Seconds a rendered status view is reused while BotData is unchanged
+INTERACTIVE_MAX_ENTRIES = 10000 # Bound on tracked (user, action) pairs and cached views
+
+# Admission control: updates wait in bounded per-class queues and run highest priority first;
+# once the backlog stays high, sheddable classes are dropped on arrival until it clears
+ADMISSION_CONCURRENCY = 8          # Handlers running at once
+ADMISSION_OVERLOAD_BACKLOG = 100   # Queued updates that count as overload...
+ADMISSION_SHED_AFTER = 2.0         # ...once sustained for this many seconds
+ADMISSION_CLASSES = {
+    "push": {"priority": 3, "queue": 2000, "shed": False},      # Sender IP pushes (senders' text messages)
+    "delivery": {"priority": 2, "queue": 1000, "shed": False},  # /get, Get IP Now, stop timer
+    "control": {"priority": 1, "queue": 500, "shed": False},    # Menus, roles, sending switches, admin
+    "view": {"priority": 0, "queue": 200, "shed": True},        # Status and help views, anyone else's free text
+}
+
+# Receiver listing in the status view
+RECEIVER_PAGE_SIZE = 10
+
+# Shutdown: seconds in-flight sends get to finish before their timers are cancelled
+SHUTDOWN_DRAIN_TIMEOUT = 10
+
+# Sharded deployment (0 = run timers in this process)
+SHARD_WORKERS = 0                   # Number of worker processes running timers and sends
+STATE_SOCKET_PATH = "bot_state.sock"  # Unix socket of the local state service
+SHARD_SYNC_INTERVAL = 5             # Seconds between worker timer assignment refreshes
+STATE_SAVE_INTERVAL = 1.0           # Seconds the state service batches worker commits per save (0 = save each)
+
+# Metrics endpoint (Prometheus text format, shard workers use METRICS_PORT + 1 + index)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0       # 0 = disabled (opt-in, e.g. 9108)
+
+# Event-loop watchdog and health endpoints (/healthz, /readyz on the metrics port)
+WATCHDOG_INTERVAL = 0.5         # Seconds between loop heartbeats
+WATCHDOG_STALL_SECONDS = 2.0    # Heartbeat this late = loop blocked, log its stack
+HEALTH_WINDOW = 60              # Seconds of lag and timer drift history behind /healthz
+HEALTH_MAX_LAG = 1.0            # Degraded above this event-loop lag (seconds)
+HEALTH_MAX_TIMER_DRIFT = 5.0    # Degraded above this timer fire delay (seconds)
+
+# Admin user IDs for diagnostics commands (empty = diagnostics commands are disabled)
+ADMIN_IDS: Set[int] = set()
+
+# Delivery audit log (append-only segments, each sealed with an IP and a user index)
+AUDIT_DIR = "audit"
+AUDIT_SEGMENT_MAX_BYTES = 16 * 1024 * 1024  # Seal the active segment at this size...
+AUDIT_SEGMENT_MAX_AGE = 3600                # ...or after this many seconds
+AUDIT_RETENTION_DAYS = 30                   # Segments older than this are deleted
+AUDIT_COMPACT_MAX_BYTES = 1024 * 1024       # Neighbouring sealed segments below this are merged
+AUDIT_MAINTENANCE_INTERVAL = 600            # Seconds between expiry/compaction runs
+AUDIT_LOOKUP_LIMIT = 20                     # Records shown by /who_got and /history
+
+# Logging (records go through a queue, a background thread does the file I/O)
+LOG_FILE = "bot.log"
+LOG_LEVEL = "INFO"
+LOG_MAX_BYTES = 10 * 1024 * 1024   # Rotate at 10 MiB (0 = single unbounded file)
+LOG_BACKUP_COUNT = 5
+
+# Per-delivery logging: "all", "sample" (1 in DELIVERY_LOG_SAMPLE_RATE) or "aggregate"
+DELIVERY_LOG_MODE = "aggregate"
+DELIVERY_LOG_SAMPLE_RATE = 100
+DELIVERY_LOG_INTERVAL = 60         # Seconds between delivery summaries in "aggregate" mode
+
+# On-demand profiling (/profile command or SIGUSR1)
+PROFILE_DIR = "profiles"
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP_N = 25          # Entries per section in the report file
+PROFILE_SUMMARY_N = 5       # Entries per section in the chat summary
+
+# ==============================
+# 📜 LOGGING
+# ==============================
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread
+    
+    The stock QueueHandler formats every record on the calling thread, which is
+    the event loop. Log arguments in this module are immutable (ids, IPs, counts,
+    exceptions), so passing the record through unformatted is safe.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def setup_logging(log_file: str = LOG_FILE) -> logging.handlers.QueueListener:
+    """Route all logging through a queue drained by a background listener thread
+    
+    Safe to call again (shard workers re-run it with their own file): the previous
+    listener is stopped and its handlers closed before the new ones are opened.
+    """
+    global log_listener
+    
+    shutdown_logging()
+    
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if LOG_MAX_BYTES:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler, file_handler)
+    log_listener.start()
+    return log_listener
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global log_listener
+    
+    if log_listener:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+class DeliveryLog:
+    """Per-delivery logging that stays cheap under heavy traffic
+    
+    "all" logs every delivery, "sample" logs one in DELIVERY_LOG_SAMPLE_RATE, and
+    "aggregate" emits one summary line per DELIVERY_LOG_INTERVAL. Failures are
+    always counted; outside "aggregate" mode they are also logged individually.
+    """
+    
+    def __init__(self, mode: str = DELIVERY_LOG_MODE, sample_rate: int = DELIVERY_LOG_SAMPLE_RATE,
+                 interval: float = DELIVERY_LOG_INTERVAL):
+        self.mode = mode
+        self.sample_rate = max(1, sample_rate)
+        self.interval = interval
+        self.total = 0
+        self.window_delivered = 0
+        self.window_failed = 0
+        self.window_paths: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+        self.window_start = time.monotonic()
+    
+    def delivered(self, user_id: int, ip: str, path: str):
+        """Record a successful IP delivery"""
+        self.total += 1
+        self.window_delivered += 1
+        self.window_paths[path] = self.window_paths.get(path, 0) + 1
+        if self.mode == "all":
+            logger.info("Delivered IP %s to user %s via %s", ip, user_id, path)
+        elif self.mode == "sample" and self.total % self.sample_rate == 0:
+            logger.info("Delivered IP %s to user %s via %s (1 in %s sampled)", ip, user_id, path, self.sample_rate)
+    
+    def failed(self, user_id: int, error: Exception):
+        """Record a failed delivery"""
+        self.window_failed += 1
+        self.last_error = str(error)
+        if self.mode != "aggregate":
+            logger.error("Failed to deliver IP to %s: %s", user_id, error)
+    
+    def flush(self, force: bool = False):
+        """Emit the aggregate summary if the window has elapsed"""
+        elapsed = time.monotonic() - self.window_start
+        if not force and elapsed < self.interval:
+            return
+        if self.mode == "aggregate" and (self.window_delivered or self.window_failed):
+            logger.info(
+                "Deliveries in last %.0fs: %s delivered %s, %s failed (last error: %s)",
+                elapsed, self.window_delivered, self.window_paths, self.window_failed, self.last_error
+            )
+        elif self.window_failed:
+            logger.info("Deliveries in last %.0fs: %s failed", elapsed, self.window_failed)
+        self.window_delivered = 0
+        self.window_failed = 0
+        self.window_paths = {}
+        self.last_error = None
+        self.window_start = time.monotonic()
+    
+    async def run(self):
+        """Flush summaries periodically so quiet periods still get reported"""
+        while True:
+            await asyncio.sleep(min(self.interval, 5))
+            self.flush()
+
+# Listener of the active logging queue
+log_listener: Optional[logging.handlers.QueueListener] = None
+
+# Configured before anything below can log (BotData loading included)
+setup_logging()
+logger = logging.getLogger(__name__)
+delivery_log = DeliveryLog()
+
+# ==============================
+# 📈 METRICS
+# ==============================
+
+# Latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        """Record one observation"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+class Metrics:
+    """In-process counters, gauges and latency histograms"""
+    
+    def __init__(self, prefix: str = "autodrop"):
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increment a counter"""
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+    
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set a gauge to a value"""
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+    
+    def register_gauge(self, name: str, callback: Callable[[], float]):
+        """Register a gauge computed when metrics are read"""
+        self.gauge_callbacks[name] = callback
+    
+    def observe(self, name: str, value: float, **labels):
+        """Record a histogram observation"""
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+    
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time a block into a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def read_gauges(self) -> Dict[str, Dict[LabelKey, float]]:
+        """Get set gauges plus the current value of callback gauges"""
+        gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for name, callback in self.gauge_callbacks.items():
+            try:
+                gauges[name] = {(): float(callback())}
+            except Exception as e:
+                logger.error("Error reading gauge %s: %s", name, e)
+        return gauges
+    
+    @staticmethod
+    def format_labels(key: LabelKey, extra: str = "") -> str:
+        """Format a label set for the Prometheus text format"""
+        parts = [f'{name}="{value}"' for name, value in key]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+    
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            for key, value in series.items():
+                lines.append(f"{self.prefix}_{name}{self.format_labels(key)} {value}")
+        for name, series in sorted(self.read_gauges().items()):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            for key, value in series.items():
+                lines.append(f"{self.prefix}_{name}{self.format_labels(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    labels = self.format_labels(key, f'le="{bound}"')
+                    lines.append(f"{full_name}_bucket{labels} {cumulative}")
+                labels = self.format_labels(key, 'le="+Inf"')
+                lines.append(f"{full_name}_bucket{labels} {histogram.count}")
+                lines.append(f"{full_name}_sum{self.format_labels(key)} {histogram.sum}")
+                lines.append(f"{full_name}_count{self.format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+    
+    def summary_text(self) -> str:
+        """Human-readable summary for the /metrics command"""
+        text = "📈 **Metrics**\n\n**Counters:**"
+        for name, series in sorted(self.counters.items()):
+            for key, value in series.items():
+                text += f"\n• {name}{self.format_labels(key)}: {value:g}"
+        text += "\n\n**Gauges:**"
+        for name, series in sorted(self.read_gauges().items()):
+            for key, value in series.items():
+                text += f"\n• {name}{self.format_labels(key)}: {value:g}"
+        text += "\n\n**Latency (p50 / p99 / count):**"
+        for name, series in sorted(self.histograms.items()):
+            for key, histogram in series.items():
+                label = ",".join(value for _, value in key) or name
+                text += (
+                    f"\n• {label}: {histogram.quantile(0.5) * 1000:g}ms / "
+                    f"{histogram.quantile(0.99) * 1000:g}ms / {histogram.count}"
+                )
+        return text
+
+def timed(name: str, **labels):
+    """Decorator recording the latency of a sync or async function"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metrics.observe(name, time.perf_counter() - start, **labels)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+class MetricsServer:
+    """Minimal local HTTP server exposing metrics to Prometheus"""
+    
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.routes: Dict[str, Callable[[], Tuple[int, str, str]]] = {
+            "/metrics": lambda: (200, "text/plain; version=0.0.4", metrics.render_prometheus()),
+            "/healthz": lambda: watchdog.health_response(readiness=False),
+            "/readyz": lambda: watchdog.health_response(readiness=True),
+        }
+    
+    async def start(self):
+        """Start serving (a port that can't be bound is logged and skipped, the bot runs on)"""
+        try:
+            self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        except OSError as e:
+            logger.warning("Metrics endpoint disabled, cannot listen on %s:%s: %s", self.host, self.port, e)
+            return
+        logger.info("Metrics endpoint on http://%s:%s/metrics (/healthz, /readyz)", self.host, self.port)
+    
+    async def stop(self):
+        """Stop serving"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one HTTP/1.0-style request"""
+        try:
+            request_line = await reader.readline()
+            # Skip headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else "/"
+            route = self.routes.get(path)
+            if route:
+                status, content_type, body = route()
+            else:
+                status, content_type, body = 404, "text/plain", "Not Found\n"
+            payload = body.encode()
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}.get(status, "OK")
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error("Metrics endpoint error: %s", e)
+        finally:
+            writer.close()
+
+class WindowMax:
+    """Maximum of the values recorded in the last window seconds (per-second buckets)"""
+    
+    def __init__(self, window: float = HEALTH_WINDOW):
+        self.window = window
+        self.buckets: deque = deque()  # (second, max_value)
+    
+    def record(self, value: float, now: Optional[float] = None):
+        second = int(time.monotonic() if now is None else now)
+        if self.buckets and self.buckets[-1][0] == second:
+            if value > self.buckets[-1][1]:
+                self.buckets[-1] = (second, value)
+        else:
+            self.buckets.append((second, value))
+    
+    def value(self, now: Optional[float] = None) -> float:
+        cutoff = (time.monotonic() if now is None else now) - self.window
+        while self.buckets and self.buckets[0][0] < cutoff:
+            self.buckets.popleft()
+        return max((value for _, value in self.buckets), default=0.0)
+
+class Watchdog:
+    """Event-loop lag and timer drift tracking with a stall detector
+    
+    A heartbeat coroutine stamps the loop every interval and samples lag. A daemon
+    thread notices when the stamp goes stale and logs the loop thread's stack while
+    it is still blocked (once per stall), which names the slow callback.
+    """
+    
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, stall_seconds: float = WATCHDOG_STALL_SECONDS):
+        self.interval = interval
+        self.stall_seconds = stall_seconds
+        self.last_beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.lag = WindowMax()
+        self.timer_drift = WindowMax()
+        self.ready = False  # Set once startup finished, cleared when shutdown begins
+    
+    async def run(self):
+        """Heartbeat and lag sampling (runs as a task for the life of the loop)"""
+        loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                start = loop.time()
+                await asyncio.sleep(self.interval)
+                self.last_beat = time.monotonic()
+                lag = max(0.0, loop.time() - start - self.interval)
+                self.lag.record(lag)
+                metrics.set_gauge("event_loop_lag_seconds", lag)
+                metrics.observe("event_loop_lag_seconds_histogram", lag)
+        finally:
+            self.stopped.set()
+    
+    def watch(self):
+        """Stall detector thread"""
+        reported_beat = None
+        while not self.stopped.wait(self.interval):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.stall_seconds or beat == reported_beat:
+                continue
+            reported_beat = beat
+            metrics.inc("event_loop_stalls_total")
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "    (unavailable)\n"
+            logger.warning("Event loop blocked for %.1fs, loop thread is at:\n%s", blocked, stack.rstrip())
+    
+    def note_timer_drift(self, drift: float):
+        """Record how late a timer fired"""
+        self.timer_drift.record(drift)
+    
+    def health(self) -> dict:
+        """Current health summary"""
+        blocked = max(0.0, time.monotonic() - self.last_beat - self.interval) if self.thread else 0.0
+        lag = max(self.lag.value(), blocked)
+        drift = self.timer_drift.value()
+        degraded = lag > HEALTH_MAX_LAG or drift > HEALTH_MAX_TIMER_DRIFT
+        return {
+            "status": "degraded" if degraded else "ok",
+            "ready": self.ready,
+            "event_loop_lag_seconds": round(lag, 4),
+            "timer_drift_seconds": round(drift, 4),
+            "window_seconds": HEALTH_WINDOW,
+        }
+    
+    def health_response(self, readiness: bool) -> Tuple[int, str, str]:
+        """/healthz is 200 while serving (status in body), /readyz is 503 unless ready and not degraded"""
+        health = self.health()
+        ok = (health["ready"] and health["status"] == "ok") if readiness else True
+        return (200 if ok else 503), "application/json", json.dumps(health) + "\n"
+
+# Global metrics registry and watchdog
+metrics = Metrics()
+watchdog = Watchdog()
+
+# ==============================
+# 🔬 PROFILING
+# ==============================
+
+class ProfilingSession:
+    """Time-boxed CPU and allocation profiling of the running bot
+    
+    cProfile records everything running on the event loop thread while the session
+    is open; the report is restricted to this module, which holds the handlers and
+    BotData methods. tracemalloc compares snapshots taken at start and end.
+    """
+    
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def active(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def start(self, seconds: int, on_done: Optional[Callable] = None) -> bool:
+        """Start a session in the background, False if one is already running"""
+        if self.active:
+            return False
+        self.task = asyncio.create_task(self.run(seconds, on_done))
+        return True
+    
+    async def run(self, seconds: int, on_done: Optional[Callable] = None):
+        """Profile for the given number of seconds and write the report"""
+        logger.info("Profiling session started for %ss", seconds)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        before = tracemalloc.take_snapshot()
+        
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+        
+        path, summary = self.write_report(profiler, before, after, seconds)
+        logger.info("Profiling report written to %s", path)
+        if on_done:
+            await on_done(path, summary)
+    
+    def write_report(self, profiler: cProfile.Profile, before: tracemalloc.Snapshot,
+                     after: tracemalloc.Snapshot, seconds: int) -> Tuple[str, str]:
+        """Write the top-N report to disk and build a chat summary"""
+        module_filter = [tracemalloc.Filter(True, __file__)]
+        allocations = after.filter_traces(module_filter).compare_to(
+            before.filter_traces(module_filter), "lineno"
+        )
+        
+        stats = pstats.Stats(profiler)
+        own_functions = sorted(
+            ((key, value) for key, value in stats.stats.items() if key[0] == __file__),
+            key=lambda item: item[1][3],  # Cumulative time
+            reverse=True
+        )
+        
+        report = io.StringIO()
+        report.write(f"AutoDrop profile - {datetime.now().isoformat()} - {seconds}s\n\n")
+        report.write("=== CPU by cumulative time (this module) ===\n")
+        stats.stream = report
+        stats.sort_stats("cumulative").print_stats(os.path.basename(__file__), PROFILE_TOP_N)
+        report.write("\n=== CPU by own time (this module) ===\n")
+        stats.sort_stats("tottime").print_stats(os.path.basename(__file__), PROFILE_TOP_N)
+        report.write("\n=== Allocation growth (this module) ===\n")
+        for stat in allocations[:PROFILE_TOP_N]:
+            report.write(f"{stat}\n")
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        
+        summary = f"🔬 **Profile Finished ({seconds}s)**\n\n**Top CPU (cumulative):**"
+        for (_, line, name), (_, calls, _, cumulative, _) in own_functions[:PROFILE_SUMMARY_N]:
+            summary += f"\n• {name}:{line} - {cumulative * 1000:.1f}ms in {calls} calls"
+        if not own_functions:
+            summary += "\nNo calls recorded."
+        summary += "\n\n**Top allocations:**"
+        for stat in allocations[:PROFILE_SUMMARY_N]:
+            frame = stat.traceback[0]
+            summary += f"\n• line {frame.lineno}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks)"
+        if not allocations:
+            summary += "\nNo allocations recorded."
+        summary += f"\n\n📄 Report: `{path}`"
+        return path, summary
+
+class StartupProfile:
+    """Wall time of each startup phase, reported once the bot is ready
+    
+    Phases may overlap: the state file loads on a background thread while the
+    telegram stack is imported and the application connects.
+    """
+    
+    def __init__(self, started: float):
+        self.started = started
+        self.phases: List[Tuple[str, float, float]] = []  # (name, start offset, seconds)
+    
+    def record(self, name: str, start: float, end: Optional[float] = None):
+        end = time.perf_counter() if end is None else end
+        self.phases.append((name, start - self.started, end - start))
+    
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+    
+    def report(self) -> str:
+        """Phase table, in start order"""
+        lines = [f"{'phase':<28} {'start':>9} {'took':>9}"]
+        for name, offset, seconds in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<28} {offset * 1000:>7.1f}ms {seconds * 1000:>7.1f}ms")
+        lines.append(f"{'ready':<28} {(time.perf_counter() - self.started) * 1000:>7.1f}ms")
+        return "\n".join(lines)
+
+# Global profiling session and startup phase timings
+profiling_session = ProfilingSession()
+startup_profile = StartupProfile(IMPORT_STARTED)
+
+# ==============================
+# ⏱️ CLOCK
+# ==============================
+
+class Clock:
+    """Time source for the timer path
+    
+    monotonic() and sleep() follow the running event loop, so the same timer code
+    runs in real time or fast-forwarded under bench.simulate's VirtualTimeLoop.
+    """
+    
+    def monotonic(self) -> float:
+        """Seconds on the event loop clock"""
+        return asyncio.get_running_loop().time()
+    
+    def time(self) -> float:
+        """Wall-clock UNIX timestamp"""
+        return time.time()
+    
+    async def sleep(self, seconds: float):
+        """Sleep on the event loop clock"""
+        await asyncio.sleep(seconds)
+
+def install_event_loop(name: str = EVENT_LOOP) -> str:
+    """Install the configured event loop policy, returns the kind actually in use"""
+    if name in ("uvloop", "auto"):
+        try:
+            import uvloop
+        except ImportError:
+            if name == "uvloop":
+                logger.warning("uvloop is not installed (pip install uvloop), using the asyncio loop")
+            return "asyncio"
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return "uvloop"
+    asyncio.set_event_loop_policy(None)
+    return "asyncio"
+
+# Global clock used by timers
+clock = Clock()
+
+# ==============================
+# 🔌 HTTP TRANSPORT
+# ==============================
+
+@functools.lru_cache(maxsize=None)
+def resolve_http_version(version: str) -> str:
+    """HTTP/2 needs the optional h2 package, fall back to HTTP/1.1 without it"""
+    if version in ("2", "2.0"):
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 needs python-telegram-bot[http2], using HTTP/1.1")
+            return "1.1"
+    return version
+
+def build_request(pool_size: int, read_timeout: float) -> HTTPXRequest:
+    """Bot API request backend with a keep-alive connection pool of pool_size"""
+    import httpx
+    
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+        http_version=resolve_http_version(HTTP_VERSION),
+        httpx_kwargs={
+            "limits": httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            )
+        },
+    )
+
+def build_application(token: str = BOT_TOKEN, pool_size: int = HTTP_POOL_SIZE,
+                      base_url: str = BOT_API_BASE_URL) -> ApplicationBuilder:
+    """ApplicationBuilder with tuned send and getUpdates pools"""
+    return (
+        ApplicationBuilder()
+        .token(token)
+        .base_url(base_url)
+        .request(build_request(pool_size, HTTP_READ_TIMEOUT))
+        .get_updates_request(build_request(UPDATES_POOL_SIZE, UPDATES_READ_TIMEOUT))
+    )
+
+class SendLimiter:
+    """Caps in-flight sends at the pool size so bursts wait here instead of hitting pool timeouts
+    
+    Waiters are kept in a heap ordered by (priority, arrival), so when every slot is busy the
+    next free one goes to the highest receiver tier; equal priorities stay first come, first served.
+    """
+    
+    def __init__(self, limit: int, wait_metric: str = "send_slot_wait_seconds"):
+        self.limit = limit
+        self.wait_metric = wait_metric
+        self.queue: List[Tuple[int, int, asyncio.Future]] = []  # (-priority, arrival, future) heap
+        self.arrivals = itertools.count()
+        self.waiters: Set[asyncio.Task] = set()  # Tasks queued for a slot
+        self.in_flight = 0
+    
+    @property
+    def waiting(self) -> int:
+        return len(self.waiters)
+    
+    async def acquire(self, priority: int = 0):
+        """Wait for a send slot, higher priorities first"""
+        start = time.perf_counter()
+        if self.in_flight < self.limit and not self.queue:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.queue, (-priority, next(self.arrivals), future))
+            task = asyncio.current_task()
+            self.waiters.add(task)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()  # Slot was handed over as we got cancelled, pass it on
+                raise
+            finally:
+                self.waiters.discard(task)
+        metrics.observe(self.wait_metric, time.perf_counter() - start)
+    
+    def release(self):
+        """Hand the slot to the highest priority waiter, or free it"""
+        while self.queue:
+            future = heapq.heappop(self.queue)[2]
+            if not future.done():  # Cancelled waiters are skipped here
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+    
+    def slot(self, priority: int = 0) -> "SendSlot":
+        """`async with send_limiter.slot(priority):` around one send"""
+        return SendSlot(self, priority)
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+class SendSlot:
+    """One prioritised SendLimiter slot as an async context manager"""
+    
+    def __init__(self, limiter: SendLimiter, priority: int):
+        self.limiter = limiter
+        self.priority = priority
+    
+    async def __aenter__(self):
+        await self.limiter.acquire(self.priority)
+        return self.limiter
+    
+    async def __aexit__(self, *exc_info):
+        self.limiter.release()
+
+class RateBudget:
+    """Token bucket pacing one bot's sends at rate per second (bursts up to burst, default none)
+    
+    A send takes a token even when none is left and sleeps until its turn comes, so
+    concurrent senders are spaced 1/rate apart in arrival order without polling.
+    """
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or 1.0
+        self.tokens = self.burst
+        self.updated: Optional[float] = None
+    
+    async def acquire(self):
+        now = clock.monotonic()
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            try:
+                await clock.sleep(-self.tokens / self.rate)
+            except asyncio.CancelledError:
+                self.tokens += 1  # Give the unused turn back
+                raise
+
+def ring_hash(key: str) -> int:
+    """64-bit position on the delivery hash ring"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+def bot_id(token: str) -> str:
+    """Bot id part of a token - stable when a token is revoked and reissued"""
+    return token.split(":", 1)[0]
+
+class HashRing:
+    """Consistent hashing of receivers onto delivery bots
+    
+    Each bot owns replicas points on the ring and a receiver belongs to the first point
+    clockwise from its hash, so adding or removing a bot only moves the receivers on
+    the arcs that changed hands (about 1/n of them). Skipped bots pass their receivers
+    on to the next bot along the ring.
+    """
+    
+    def __init__(self, nodes: List[str], replicas: int = DELIVERY_RING_REPLICAS):
+        points = sorted((ring_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+    
+    def lookup(self, key: int, skip: Set[str] = frozenset()) -> Optional[str]:
+        """Owner of key, walking past skipped nodes (None if every node is skipped)"""
+        if not self.nodes:
+            return None
+        start = bisect.bisect(self.hashes, ring_hash(str(key)))
+        for offset in range(len(self.nodes)):
+            node = self.nodes[(start + offset) % len(self.nodes)]
+            if node not in skip:
+                return node
+        return None
+
+class DeliveryBotPool:
+    """Optional extra bots that send IPs for the primary bot, each within its own rate budget
+    
+    Receivers map to delivery bots on a HashRing keyed by bot id. A bot in a flood wait is
+    skipped until it ends, and a bot that answered Forbidden for a receiver (never started,
+    or blocked) is skipped for that receiver for DELIVERY_BOT_FORBIDDEN_TTL; either way the
+    receiver falls through to the next bot on the ring and finally to the primary.
+    """
+    
+    def __init__(self, tokens: List[str] = DELIVERY_BOT_TOKENS, rate: float = DELIVERY_BOT_RATE,
+                 primary_rate: float = BOT_SEND_RATE):
+        self.tokens = list(tokens)
+        self.rate = rate
+        self.primary_rate = primary_rate
+        self.share = 1  # Processes sending with the same tokens (primary included), budgets are split between them
+        self.bots: Dict[str, "Bot"] = {}  # bot id -> initialized Bot
+        self.ring = HashRing([])
+        self.budgets: Dict[str, Optional[RateBudget]] = {}  # token -> budget (None = unlimited)
+        self.paused_until: Dict[str, float] = {}  # bot id -> end of its flood wait (clock.monotonic)
+        self.forbidden: Dict[str, Dict[int, float]] = {}  # bot id -> {user_id: skip until}
+    
+    @property
+    def active(self) -> bool:
+        return bool(self.bots)
+    
+    async def start(self, base_url: str = BOT_API_BASE_URL, share: int = 1):
+        """Connect every delivery bot (getMe), bots that fail are left off the ring"""
+        self.share = max(1, share)
+        for token in self.tokens:
+            bot = Bot(token, base_url=base_url, request=build_request(DELIVERY_BOT_POOL_SIZE, HTTP_READ_TIMEOUT))
+            try:
+                await bot.initialize()
+            except TelegramError as e:
+                logger.error("Delivery bot %s unavailable: %s", bot_id(token), e)
+                continue
+            self.bots[bot_id(token)] = bot
+        self.ring = HashRing(list(self.bots))
+        if self.tokens:
+            logger.info("Delivery bots: %s of %s connected", len(self.bots), len(self.tokens))
+    
+    async def stop(self):
+        for bot in self.bots.values():
+            await bot.shutdown()
+        self.bots.clear()
+        self.ring = HashRing([])
+    
+    def budget(self, bot) -> Optional[RateBudget]:
+        """Rate budget of a bot (None when unlimited)"""
+        token = getattr(bot, "token", None) or "primary"
+        if token not in self.budgets:
+            rate = self.rate if bot_id(token) in self.bots else self.primary_rate
+            self.budgets[token] = RateBudget(rate / self.share) if rate > 0 else None
+        return self.budgets[token]
+    
+    def bot_for(self, user_id: int, primary):
+        """Bot that delivers to user right now"""
+        if not self.bots:
+            return primary
+        now = clock.monotonic()
+        skip = {node for node, until in self.paused_until.items() if until > now}
+        for node, users in self.forbidden.items():
+            until = users.get(user_id)
+            if until is not None:
+                if until > now:
+                    skip.add(node)
+                else:
+                    del users[user_id]
+        node = self.ring.lookup(user_id, skip)
+        return self.bots[node] if node else primary
+    
+    def pause(self, bot, seconds: float):
+        """Route around a bot for the length of its flood wait"""
+        self.paused_until[bot_id(bot.token)] = clock.monotonic() + seconds
+        metrics.inc("delivery_bot_fallbacks_total", reason="flood_wait")
+    
+    def forbid(self, bot, user_id: int):
+        """Route a receiver around a bot that may not message them"""
+        self.forbidden.setdefault(bot_id(bot.token), {})[user_id] = clock.monotonic() + DELIVERY_BOT_FORBIDDEN_TTL
+        metrics.inc("delivery_bot_fallbacks_total", reason="forbidden")
+
+# ==============================
+# 💾 SNAPSHOT STORAGE
+# ==============================
+
+# Binary snapshot layout (little-endian):
+#   header   magic(8) version(u32) flags(u32) saved_at(f64) section_count(u32) pad(u32)
+#   table    section_count x (section_id(u32) item_size(u32) offset(u64) count(u64))
+#   sections 8-byte aligned packed arrays
+# Users are int64, IPv4 addresses uint32. Delivery history is stored as a sorted
+# user id array, an offsets array (count + 1 entries) and one concatenated IP array,
+# so a single user's list can be read without touching anyone else's.
+SNAPSHOT_MAGIC = b"ADSNAP\x00\x00"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIdII")
+SNAPSHOT_SECTION = struct.Struct("<IIQQ")
+SNAPSHOT_FLAG_SENDING_ACTIVE = 1
+
+SNAPSHOT_SECTIONS = {
+    # name: (section_id, array typecode)
+    "senders": (1, "q"),
+    "receivers": (2, "q"),
+    "queue": (3, "I"),
+    "history_users": (4, "q"),
+    "history_offsets": (5, "Q"),
+    "history_ips": (6, "I"),
+    "interval_users": (7, "q"),
+    "interval_values": (8, "I"),
+    "timer_users": (9, "q"),
+    "timer_flags": (10, "B"),
+    "blocked": (11, "q"),
+    "last_delivery_users": (12, "q"),
+    "last_delivery_times": (13, "d"),
+    "tier_users": (14, "q"),
+    "tier_values": (15, "B"),  # Index into SNAPSHOT_TIERS
+    "expiry_ips": (16, "I"),
+    "expiry_times": (17, "d"),
+}
+
+# Tier names by snapshot index - append new tiers, never reorder
+SNAPSHOT_TIERS = tuple(RECEIVER_TIERS)
+
+IPV4_STRUCT = struct.Struct(">I")
+
+def ip_to_int(ip: str) -> int:
+    """Pack a dotted IPv4 address (leading zeros are normalised away)"""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        # inet_pton rejects leading zeros, which the push validation accepts
+        a, b, c, d = (int(part) for part in ip.split("."))
+        if not all(0 <= part <= 255 for part in (a, b, c, d)):
+            raise ValueError(f"Invalid IPv4 address: {ip}")
+        return (a << 24) | (b << 16) | (c << 8) | d
+
+def int_to_ip(n: int) -> str:
+    """Unpack an IPv4 address"""
+    return socket.inet_ntoa(IPV4_STRUCT.pack(n))
+
+def pack_ips(ips: List[str]) -> array.array:
+    """Pack IPv4 addresses into a uint32 array"""
+    try:
+        raw = b"".join(map(socket.inet_pton, itertools.repeat(socket.AF_INET), ips))
+    except OSError:
+        raw = b"".join(IPV4_STRUCT.pack(ip_to_int(ip)) for ip in ips)
+    values = array.array("I")
+    values.frombytes(raw)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+def unpack_ips(values) -> List[str]:
+    """Unpack a uint32 array into IPv4 addresses"""
+    return list(map(socket.inet_ntoa, map(IPV4_STRUCT.pack, values)))
+
+def is_snapshot_file(path: str) -> bool:
+    """Check a file for the snapshot magic"""
+    with open(path, 'rb') as f:
+        return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+class Snapshot:
+    """Read-only, mmap-backed view of a snapshot file"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        
+        magic, version, flags, self.saved_at, section_count, _ = SNAPSHOT_HEADER.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        self.sending_active = bool(flags & SNAPSHOT_FLAG_SENDING_ACTIVE)
+        
+        ids = {section_id: name for name, (section_id, _) in SNAPSHOT_SECTIONS.items()}
+        self.sections: Dict[str, Tuple[int, int, int]] = {}  # name -> (offset, count, item_size)
+        for i in range(section_count):
+            section_id, item_size, offset, count = SNAPSHOT_SECTION.unpack_from(
+                self.mm, SNAPSHOT_HEADER.size + i * SNAPSHOT_SECTION.size
+            )
+            if section_id in ids:  # Unknown sections from newer writers are skipped
+                self.sections[ids[section_id]] = (offset, count, item_size)
+        
+        self.history_users = self.array("history_users")
+        self.history_offsets = self.array("history_offsets")
+        self.history_ips = self.array("history_ips")
+    
+    def array(self, name: str):
+        """Zero-copy typed view of a section (empty tuple if absent)"""
+        if name not in self.sections:
+            return ()
+        offset, count, item_size = self.sections[name]
+        typecode = SNAPSHOT_SECTIONS[name][1]
+        raw = self.view[offset:offset + count * item_size]
+        if sys.byteorder == "little":
+            return raw.cast(typecode)
+        # Big-endian hosts pay for a byte-swapped copy
+        values = array.array(typecode, raw)
+        values.byteswap()
+        return values
+    
+    def history_row(self, user_id: int) -> int:
+        """Row of user in the history tables, -1 if absent"""
+        row = bisect.bisect_left(self.history_users, user_id)
+        if row < len(self.history_users) and self.history_users[row] == user_id:
+            return row
+        return -1
+    
+    def history_count(self, row: int) -> int:
+        """Number of IPs delivered to the user at row"""
+        return self.history_offsets[row + 1] - self.history_offsets[row]
+    
+    def history_slice(self, row: int):
+        """Packed IPs delivered to the user at row"""
+        return self.history_ips[self.history_offsets[row]:self.history_offsets[row + 1]]
+    
+    def close(self):
+        """Release the mapping"""
+        for name in ("history_users", "history_offsets", "history_ips"):
+            setattr(self, name, ())
+        self.view.release()
+        self.mm.close()
+
+class LazyIPHistory(MutableMapping):
+    """user_id -> delivered IPs, materialised per user from a snapshot on first access
+    
+    Users that were never touched since startup stay in the mmap as packed integers;
+    counts and saves read them straight from the offsets table.
+    """
+    
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot: Optional[Snapshot] = snapshot
+        self.loaded: Dict[int, List[str]] = {}
+        self.removed: Set[int] = set()
+        self.pending_count = len(snapshot.history_users)  # Snapshot users not yet loaded or removed
+    
+    def pending_row(self, user_id: int) -> int:
+        """Snapshot row of a user that is still only in the snapshot, else -1"""
+        if self.snapshot is None or user_id in self.loaded or user_id in self.removed:
+            return -1
+        return self.snapshot.history_row(user_id)
+    
+    def __getitem__(self, user_id: int) -> List[str]:
+        if user_id in self.loaded:
+            return self.loaded[user_id]
+        row = self.pending_row(user_id)
+        if row < 0:
+            raise KeyError(user_id)
+        ips = unpack_ips(self.snapshot.history_slice(row))
+        self.loaded[user_id] = ips
+        self.pending_count -= 1
+        return ips
+    
+    def __setitem__(self, user_id: int, ips: List[str]):
+        if self.pending_row(user_id) >= 0:
+            self.pending_count -= 1
+        self.loaded[user_id] = ips
+    
+    def __delitem__(self, user_id: int):
+        row = self.pending_row(user_id)
+        if row < 0 and user_id not in self.loaded:
+            raise KeyError(user_id)
+        if row >= 0:
+            self.pending_count -= 1
+        self.loaded.pop(user_id, None)
+        self.removed.add(user_id)
+    
+    def __contains__(self, user_id) -> bool:
+        return user_id in self.loaded or self.pending_row(user_id) >= 0
+    
+    def __iter__(self) -> Iterator[int]:
+        yield from list(self.loaded)
+        if self.snapshot is not None:
+            for user_id in self.snapshot.history_users:
+                if user_id not in self.loaded and user_id not in self.removed:
+                    yield user_id
+    
+    def __len__(self) -> int:
+        return len(self.loaded) + self.pending_count
+    
+    def clear(self):
+        self.loaded.clear()
+        self.removed.clear()
+        self.snapshot = None
+        self.pending_count = 0
+    
+    def count(self, user_id: int) -> int:
+        """Number of IPs delivered to user without materialising the list"""
+        if user_id in self.loaded:
+            return len(self.loaded[user_id])
+        row = self.pending_row(user_id)
+        return self.snapshot.history_count(row) if row >= 0 else 0
+    
+    def iter_ips(self, user_id: int) -> Iterator[str]:
+        """Stream a user's IPs without caching them"""
+        if user_id in self.loaded:
+            return iter(self.loaded[user_id])
+        return map(socket.inet_ntoa, map(IPV4_STRUCT.pack, self.packed(user_id)))
+    
+    def packed(self, user_id: int):
+        """Packed IPs of user (zero-copy for users still in the snapshot)"""
+        row = self.pending_row(user_id)
+        if row >= 0:
+            return self.snapshot.history_slice(row)
+        return pack_ips(self.loaded.get(user_id, []))
+
+class HistorySpill:
+    """Delivery history parked on disk as packed IPs while an import streams in
+    
+    Only (offset, count) extents per user stay in memory. write_snapshot appends each
+    user's spilled IPs after their existing history, reading back one extent at a time.
+    """
+    
+    def __init__(self, directory: Optional[str] = None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.extents: Dict[int, List[Tuple[int, int]]] = {}  # user_id -> [(byte offset, count)]
+        self.total = 0
+    
+    def append(self, user_id: int, ips: List[str]):
+        packed = pack_ips(ips)
+        offset = self.file.seek(0, os.SEEK_END)
+        packed.tofile(self.file)
+        self.extents.setdefault(user_id, []).append((offset, len(packed)))
+        self.total += len(packed)
+    
+    def count(self, user_id: int) -> int:
+        return sum(count for _, count in self.extents.get(user_id, ()))
+    
+    def packed(self, user_id: int) -> Iterator[array.array]:
+        for offset, count in self.extents.get(user_id, ()):
+            self.file.seek(offset)
+            values = array.array("I")
+            values.fromfile(self.file, count)
+            yield values
+    
+    def close(self):
+        self.file.close()
+
+def write_snapshot(path: str, data: "BotData", spill: Optional[HistorySpill] = None):
+    """Write BotData (plus spilled import history) as a snapshot, atomically via a temp file"""
+    history = data.distributed_ips
+    spilled = spill.extents if spill else {}
+    history_users = sorted(set(history) | set(spilled))
+    
+    def packed_history(user_id: int) -> Iterator[array.array]:
+        if isinstance(history, LazyIPHistory):
+            yield history.packed(user_id)
+        elif user_id in history:
+            yield pack_ips(history[user_id])
+        if user_id in spilled:
+            yield from spill.packed(user_id)
+    
+    offsets = array.array("Q", [0])
+    for user_id in history_users:
+        count = history.count(user_id) if isinstance(history, LazyIPHistory) else len(history.get(user_id, ()))
+        if user_id in spilled:
+            count += spill.count(user_id)
+        offsets.append(offsets[-1] + count)
+    
+    interval_users = sorted(data.user_intervals)
+    timer_users = sorted(data.active_timers)
+    last_delivery_users = sorted(data.last_delivery)
+    expiry_ips = list(data.ip_expiry)
+    tier_users = sorted(user_id for user_id, tier in data.receiver_tiers.items() if tier in SNAPSHOT_TIERS)
+    sections = [
+        ("senders", [array.array("q", sorted(data.senders))]),
+        ("receivers", [array.array("q", sorted(data.receivers))]),
+        ("queue", [pack_ips(data.queued_ips())]),
+        ("history_users", [array.array("q", history_users)]),
+        ("history_offsets", [offsets]),
+        # One chunk per user (per spilled extent) keeps peak memory at the largest single history
+        ("history_ips", (chunk for user_id in history_users for chunk in packed_history(user_id))),
+        ("interval_users", [array.array("q", interval_users)]),
+        ("interval_values", [array.array("I", (data.user_intervals[u] for u in interval_users))]),
+        ("timer_users", [array.array("q", timer_users)]),
+        ("timer_flags", [array.array("B", (1 if data.active_timers[u] else 0 for u in timer_users))]),
+        ("blocked", [array.array("q", sorted(data.blocked_users))]),
+        ("last_delivery_users", [array.array("q", last_delivery_users)]),
+        ("last_delivery_times", [array.array("d", (data.last_delivery[u] for u in last_delivery_users))]),
+        ("tier_users", [array.array("q", tier_users)]),
+        ("tier_values", [array.array("B", (SNAPSHOT_TIERS.index(data.receiver_tiers[u]) for u in tier_users))]),
+        ("expiry_ips", [pack_ips(expiry_ips)]),
+        ("expiry_times", [array.array("d", (data.ip_expiry[ip] for ip in expiry_ips))]),
+    ]
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        table_offset = SNAPSHOT_HEADER.size
+        f.write(b"\x00" * (table_offset + SNAPSHOT_SECTION.size * len(sections)))
+        table = []
+        for name, chunks in sections:
+            f.write(b"\x00" * (-f.tell() % 8))
+            section_id, typecode = SNAPSHOT_SECTIONS[name]
+            item_size = array.array(typecode).itemsize
+            offset = f.tell()
+            count = 0
+            for chunk in chunks:
+                if sys.byteorder != "little":
+                    chunk = array.array(typecode, chunk)
+                    chunk.byteswap()
+                f.write(chunk)
+                count += len(chunk)
+            table.append((section_id, item_size, offset, count))
+        
+        f.seek(0)
+        flags = SNAPSHOT_FLAG_SENDING_ACTIVE if data.sending_active else 0
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, time.time(), len(table), 0))
+        for entry in table:
+            f.write(SNAPSHOT_SECTION.pack(*entry))
+    # Readers keep their mapping of the old file, so replacing it is safe
+    os.replace(tmp_path, path)
+
+# ==============================
+# 🧾 DELIVERY AUDIT LOG
+# ==============================
+
+# Segment lines: "timestamp\tuser_id\tip\tsource\n"
+# Index files:   header magic(8) min_ts(f64) max_ts(f64) ip_count(u64) user_count(u64)
+#                then (ip uint32, offset uint64) entries sorted by ip
+#                then (user int64, offset uint64) entries sorted by user
+AUDIT_INDEX_MAGIC = b"ADIDX001"
+AUDIT_INDEX_HEADER = struct.Struct("<8sddQQ")
+AUDIT_IP_ENTRY = struct.Struct("<IQ")
+AUDIT_USER_ENTRY = struct.Struct("<qQ")
+
+class PackedKeys:
+    """Sequence view over the keys of a packed (key, offset) table, for bisect"""
+    
+    def __init__(self, buffer, base: int, entry: struct.Struct, count: int):
+        self.buffer = buffer
+        self.base = base
+        self.entry = entry
+        self.count = count
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, i: int) -> int:
+        return self.entry.unpack_from(self.buffer, self.base + i * self.entry.size)[0]
+    
+    def offsets(self, key: int) -> List[int]:
+        """Record offsets stored under key"""
+        start = bisect.bisect_left(self, key)
+        end = bisect.bisect_right(self, key, start)
+        return [
+            self.entry.unpack_from(self.buffer, self.base + i * self.entry.size)[1]
+            for i in range(start, end)
+        ]
+
+class AuditSegment:
+    """One append-only log file, indexed in memory while active and on disk once sealed"""
+    
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.index_path = log_path[:-len(".log")] + ".idx"
+        self.min_ts = 0.0
+        self.max_ts = 0.0
+        self.size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        # In-memory index (active or not yet sealed)
+        self.ip_offsets: Optional[Dict[int, List[int]]] = {}
+        self.user_offsets: Optional[Dict[int, List[int]]] = {}
+        # On-disk index (sealed)
+        self.index_map: Optional[mmap.mmap] = None
+        self.ip_keys: Optional[PackedKeys] = None
+        self.user_keys: Optional[PackedKeys] = None
+    
+    @property
+    def sealed(self) -> bool:
+        return self.ip_offsets is None
+    
+    def add(self, ts: float, user_id: int, ip: str, offset: int, length: int):
+        """Index a record appended at offset"""
+        self.min_ts = self.min_ts or ts
+        self.max_ts = ts
+        self.size = offset + length
+        self.ip_offsets.setdefault(ip_to_int(ip), []).append(offset)
+        self.user_offsets.setdefault(user_id, []).append(offset)
+    
+    def scan(self):
+        """Rebuild the in-memory index from the log file (recovery/compaction)"""
+        self.ip_offsets, self.user_offsets = {}, {}
+        with open(self.log_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                parts = line.decode('utf-8').rstrip("\n").split("\t")
+                if len(parts) == 4:
+                    self.add(float(parts[0]), int(parts[1]), parts[2], offset, len(line))
+                offset += len(line)
+    
+    def write_index(self):
+        """Persist the in-memory index next to the log"""
+        ip_entries = sorted((ip, offset) for ip, offsets in self.ip_offsets.items() for offset in offsets)
+        user_entries = sorted((user, offset) for user, offsets in self.user_offsets.items() for offset in offsets)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(AUDIT_INDEX_HEADER.pack(
+                AUDIT_INDEX_MAGIC, self.min_ts, self.max_ts, len(ip_entries), len(user_entries)
+            ))
+            f.write(b"".join(AUDIT_IP_ENTRY.pack(*entry) for entry in ip_entries))
+            f.write(b"".join(AUDIT_USER_ENTRY.pack(*entry) for entry in user_entries))
+        os.replace(tmp_path, self.index_path)
+    
+    def load_index(self) -> Tuple[mmap.mmap, float, float, PackedKeys, PackedKeys]:
+        """Map the on-disk index without touching the segment (safe to call from a thread)"""
+        with open(self.index_path, 'rb') as f:
+            index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, min_ts, max_ts, ip_count, user_count = AUDIT_INDEX_HEADER.unpack_from(index_map, 0)
+        if magic != AUDIT_INDEX_MAGIC:
+            index_map.close()
+            raise ValueError(f"{self.index_path} is not an audit index")
+        ip_base = AUDIT_INDEX_HEADER.size
+        user_base = ip_base + ip_count * AUDIT_IP_ENTRY.size
+        return (
+            index_map, min_ts, max_ts,
+            PackedKeys(index_map, ip_base, AUDIT_IP_ENTRY, ip_count),
+            PackedKeys(index_map, user_base, AUDIT_USER_ENTRY, user_count),
+        )
+    
+    def install_index(self, index: Tuple[mmap.mmap, float, float, PackedKeys, PackedKeys]):
+        """Switch lookups to a mapped index and drop the in-memory one"""
+        self.index_map, self.min_ts, self.max_ts, self.ip_keys, self.user_keys = index
+        self.ip_offsets = None
+        self.user_offsets = None
+    
+    def open_index(self):
+        """Map the on-disk index and drop the in-memory one"""
+        self.install_index(self.load_index())
+    
+    def close(self):
+        """Unmap the index"""
+        self.ip_keys = self.user_keys = None
+        if self.index_map:
+            self.index_map.close()
+            self.index_map = None
+    
+    def remove(self):
+        """Delete the segment's files"""
+        self.close()
+        for path in (self.log_path, self.index_path):
+            if os.path.exists(path):
+                os.unlink(path)
+    
+    def lookup(self, ip: Optional[str] = None, user_id: Optional[int] = None) -> List[int]:
+        """Offsets of records matching an IP or a user, in write order"""
+        if self.sealed:
+            if self.index_map is None:
+                self.open_index()
+            keys, key = (self.ip_keys, ip_to_int(ip)) if ip is not None else (self.user_keys, user_id)
+            return keys.offsets(key)
+        if ip is not None:
+            return list(self.ip_offsets.get(ip_to_int(ip), []))
+        return list(self.user_offsets.get(user_id, []))
+    
+    def read(self, offsets: List[int]) -> List[Tuple[float, int, str, str]]:
+        """Read records at offsets"""
+        records = []
+        with open(self.log_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                ts, user_id, ip, source = f.readline().decode('utf-8').rstrip("\n").split("\t")
+                records.append((float(ts), int(user_id), ip, source))
+        return records
+
+class AuditLog:
+    """Append-only, segment-based delivery log with per-segment IP and user indexes
+    
+    The active segment is indexed in memory; when it reaches AUDIT_SEGMENT_MAX_BYTES
+    or AUDIT_SEGMENT_MAX_AGE it is sealed by writing a sorted index file next to it
+    (in a worker thread). Lookups binary-search the mmapped indexes newest-first and
+    only read the matching lines. Expiry and compaction run on a schedule.
+    """
+    
+    def __init__(self, directory: str = AUDIT_DIR):
+        self.directory = directory
+        self.segments: List[AuditSegment] = []  # Oldest first, last one is active
+        self.active_file = None
+        self.active_opened_at = 0.0
+        self.sequence = 0
+    
+    @property
+    def active(self) -> Optional[AuditSegment]:
+        return self.segments[-1] if self.active_file else None
+    
+    def open(self):
+        """Load sealed segments, seal any left over from a crash and start a new one"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".log"):
+                continue
+            segment = AuditSegment(os.path.join(self.directory, name))
+            if not os.path.exists(segment.index_path):
+                segment.scan()
+                segment.write_index()
+            segment.open_index()
+            self.segments.append(segment)
+        self.start_segment()
+        logger.info("Audit log opened with %s sealed segments", len(self.segments) - 1)
+    
+    def start_segment(self):
+        """Open a new active segment"""
+        self.sequence += 1
+        name = f"seg-{int(clock.time() * 1000):015d}-{self.sequence:04d}.log"
+        segment = AuditSegment(os.path.join(self.directory, name))
+        self.active_file = open(segment.log_path, 'ab')
+        self.active_opened_at = clock.time()
+        self.segments.append(segment)
+    
+    def record(self, user_id: int, ip: str, source: str):
+        """Append a delivery record"""
+        if not self.active_file:
+            return
+        ts = clock.time()
+        segment = self.active
+        line = f"{ts:.3f}\t{user_id}\t{ip}\t{source}\n".encode('utf-8')
+        offset = segment.size
+        self.active_file.write(line)
+        segment.add(ts, user_id, ip, offset, len(line))
+        if segment.size >= AUDIT_SEGMENT_MAX_BYTES:
+            self.rotate()
+    
+    def rotate(self):
+        """Seal the active segment and start a new one"""
+        segment = self.active
+        self.active_file.close()
+        self.active_file = None
+        if segment.size == 0:
+            self.segments.pop()
+            os.unlink(segment.log_path)
+        else:
+            # The in-memory index keeps serving lookups until the file index is written
+            self.seal_in_background(segment)
+        self.start_segment()
+    
+    def seal_in_background(self, segment: AuditSegment):
+        """Write and map a segment's index off the event loop
+        
+        The thread only builds the index; swapping it into the segment happens in
+        the future's done callback, on the loop, so lookups never see it half-replaced.
+        """
+        def seal():
+            segment.write_index()
+            return segment.load_index()
+        
+        def install(future: asyncio.Future):
+            if future.cancelled():
+                return
+            if future.exception():
+                logger.error("Sealing %s failed: %s", segment.log_path, future.exception())
+                return
+            if segment in self.segments:
+                segment.install_index(future.result())
+            else:
+                future.result()[0].close()  # Closed or compacted away meanwhile
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            segment.install_index(seal())
+            return
+        loop.run_in_executor(None, seal).add_done_callback(install)
+    
+    def flush(self):
+        """Flush buffered records to disk"""
+        if self.active_file:
+            self.active_file.flush()
+    
+    def close(self):
+        """Flush and seal the active segment"""
+        if not self.active_file:
+            return
+        segment = self.active
+        self.active_file.close()
+        self.active_file = None
+        if segment.size:
+            segment.write_index()
+        else:
+            self.segments.pop()
+            os.unlink(segment.log_path)
+        for segment in self.segments:
+            segment.close()
+        self.segments.clear()
+    
+    def lookup(self, ip: Optional[str] = None, user_id: Optional[int] = None,
+               limit: int = AUDIT_LOOKUP_LIMIT) -> List[Tuple[float, int, str, str]]:
+        """Newest records for an IP or a user"""
+        self.flush()
+        results = []
+        for segment in reversed(self.segments):
+            offsets = segment.lookup(ip=ip, user_id=user_id)
+            if offsets:
+                results.extend(reversed(segment.read(offsets[-(limit - len(results)):])))
+            if len(results) >= limit:
+                break
+        return results
+    
+    def expire(self, now: float) -> int:
+        """Delete sealed segments past retention"""
+        cutoff = now - AUDIT_RETENTION_DAYS * 86400
+        expired = [
+            segment for segment in self.segments[:-1]
+            if segment.sealed and segment.max_ts and segment.max_ts < cutoff
+        ]
+        for segment in expired:
+            segment.remove()
+            self.segments.remove(segment)
+        return len(expired)
+    
+    def compaction_groups(self) -> List[List[AuditSegment]]:
+        """Runs of neighbouring small sealed segments worth merging"""
+        groups, current, size = [], [], 0
+        for segment in self.segments[:-1]:
+            small = segment.sealed and segment.size < AUDIT_COMPACT_MAX_BYTES
+            if small and size + segment.size <= AUDIT_COMPACT_MAX_BYTES:
+                current.append(segment)
+                size += segment.size
+                continue
+            if len(current) > 1:
+                groups.append(current)
+            current, size = ([segment], segment.size) if small else ([], 0)
+        if len(current) > 1:
+            groups.append(current)
+        return groups
+    
+    @staticmethod
+    def merge(group: List[AuditSegment]) -> AuditSegment:
+        """Concatenate segments into a new indexed segment (runs in a thread)"""
+        first = group[0].log_path[:-len(".log")]
+        merged = AuditSegment(f"{first}-m{int(time.time() * 1000)}.log")
+        with open(merged.log_path + ".tmp", 'wb') as out:
+            for segment in group:
+                with open(segment.log_path, 'rb') as f:
+                    while chunk := f.read(1024 * 1024):
+                        out.write(chunk)
+        os.replace(merged.log_path + ".tmp", merged.log_path)
+        merged.scan()
+        merged.write_index()
+        merged.open_index()
+        return merged
+    
+    async def compact(self) -> int:
+        """Merge small neighbouring sealed segments"""
+        merged_count = 0
+        for group in self.compaction_groups():
+            merged = await asyncio.to_thread(self.merge, group)
+            position = self.segments.index(group[0])
+            for segment in group:
+                self.segments.remove(segment)
+                segment.remove()
+            self.segments.insert(position, merged)
+            merged_count += len(group)
+        return merged_count
+    
+    async def run(self):
+        """Flush every second, rotate by age, expire and compact on schedule"""
+        last_maintenance = clock.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            self.flush()
+            if self.active_file and self.active.size and clock.time() - self.active_opened_at >= AUDIT_SEGMENT_MAX_AGE:
+                self.rotate()
+            if clock.monotonic() - last_maintenance >= AUDIT_MAINTENANCE_INTERVAL:
+                last_maintenance = clock.monotonic()
+                try:
+                    expired = self.expire(clock.time())
+                    merged = await self.compact()
+                    if expired or merged:
+                        logger.info("Audit maintenance: %s segments expired, %s merged", expired, merged)
+                except Exception as e:
+                    logger.error("Audit maintenance error: %s", e)
+
+# Global audit log (opened by the primary process only)
+audit_log = AuditLog()
 
 # ==============================
-# 🔧 CONFIGURATION
+# 📊 DATA MANAGEMENT CLASS
 # ==============================
 
-# Set your bot token here (get from @BotFather)
-BOT_TOKEN = "8222403305:AAHJ9ewwYYNa3lWFm3fZhgBplCP65e6g054"
+class RollingCounters:
+    """Fixed-memory event counts per time bucket
+    
+    A ring of size buckets of width seconds, indexed by (time // width) % size; each
+    slot remembers which period it holds and is zeroed when the ring wraps onto it.
+    """
+    
+    KINDS = ("pushed", "delivered", "failed", "flood_waited", "expired")
+    
+    def __init__(self, width: int, size: int, kinds: Tuple[str, ...] = KINDS):
+        self.width = width
+        self.size = size
+        self.periods = array.array("q", [-1] * size)
+        self.counts = {kind: array.array("Q", [0] * size) for kind in kinds}
+    
+    def add(self, kind: str, now: float, count: int = 1):
+        period = int(now // self.width)
+        slot = period % self.size
+        if self.periods[slot] != period:
+            self.periods[slot] = period
+            for counts in self.counts.values():
+                counts[slot] = 0
+        self.counts[kind][slot] += count
+    
+    def total(self, kind: str, now: float, buckets: int) -> int:
+        """Events in the last `buckets` buckets, the current partial one included"""
+        current = int(now // self.width)
+        counts = self.counts[kind]
+        return sum(
+            counts[period % self.size]
+            for period in range(current - min(buckets, self.size) + 1, current + 1)
+            if self.periods[period % self.size] == period
+        )
 
-# Data file for persistence
-DATA_FILE = "bot_data.json"
+def tier_priority(tier: str) -> int:
+    """Send priority of a receiver tier (unknown tiers get the default's)"""
+    return RECEIVER_TIERS.get(tier, RECEIVER_TIERS[DEFAULT_TIER])["priority"]
 
-# Timer limits
-MIN_INTERVAL = 30      # Minimum 30 seconds
-MAX_INTERVAL = 86400   # Maximum 24 hours
+class SlaTracker:
+    """Scheduled vs actual delivery delay per receiver tier
+    
+    A delivery is late when it lands more than its tier's sla seconds after it was due
+    (timer tick or button press). Keeps an hour of per-minute counts and the worst delay
+    of the last window per tier; the full distribution goes to delivery_delay_seconds.
+    """
+    
+    def __init__(self):
+        self.counts = {tier: RollingCounters(60, 60, kinds=("delivered", "late")) for tier in RECEIVER_TIERS}
+        self.worst = {tier: WindowMax(window=3600) for tier in RECEIVER_TIERS}
+    
+    def record(self, tier: str, delay: float):
+        if tier not in RECEIVER_TIERS:
+            tier = DEFAULT_TIER
+        now = clock.time()
+        late = delay > RECEIVER_TIERS[tier]["sla"]
+        metrics.observe("delivery_delay_seconds", delay, tier=tier)
+        self.counts[tier].add("delivered", now)
+        if late:
+            metrics.inc("sla_late_deliveries_total", tier=tier)
+            self.counts[tier].add("late", now)
+        self.worst[tier].record(delay)
+    
+    def summary(self, minutes: int = 60) -> Dict[str, Tuple[int, int, float]]:
+        """tier -> (deliveries, late deliveries, worst recent delay)"""
+        now = clock.time()
+        return {
+            tier: (counts.total("delivered", now, minutes), counts.total("late", now, minutes), self.worst[tier].value())
+            for tier, counts in self.counts.items()
+        }
 
-# ==============================
-# 📊 DATA MANAGEMENT CLASS
-# ==============================
+class ReceiverIndex:
+    """Receivers sorted by delivery count and by last delivery, for cursor pagination
+    
+    Keys are (-count, user_id) and (-last_delivery_ms, user_id) so both orders list the
+    top consumers first; a page is one bisect plus a slice.
+    """
+    
+    ORDERS = ("count", "recent")
+    
+    def __init__(self):
+        self.built = False
+        self.keys: Dict[int, Tuple[int, int]] = {}  # user_id -> (count, last_delivery_ms)
+        self.sorted: Dict[str, List[Tuple[int, int]]] = {order: [] for order in self.ORDERS}
+    
+    @staticmethod
+    def sort_key(order: str, user_id: int, count: int, last_ms: int) -> Tuple[int, int]:
+        return (-count if order == "count" else -last_ms, user_id)
+    
+    def invalidate(self):
+        """Rebuild on next use (bulk changes)"""
+        self.built = False
+    
+    def rebuild(self, data: "BotData"):
+        self.keys = {
+            user_id: (data.delivery_count(user_id), int(data.last_delivery.get(user_id, 0) * 1000))
+            for user_id in data.receivers
+        }
+        for order in self.ORDERS:
+            self.sorted[order] = sorted(self.sort_key(order, user_id, *key) for user_id, key in self.keys.items())
+        self.built = True
+    
+    def discard(self, user_id: int):
+        key = self.keys.pop(user_id, None)
+        if key is None:
+            return
+        for order in self.ORDERS:
+            entries = self.sorted[order]
+            del entries[bisect.bisect_left(entries, self.sort_key(order, user_id, *key))]
+    
+    def update(self, user_id: int, count: int, last_delivery: float):
+        """Move one receiver to its new position (O(log n) search plus a memmove)"""
+        if not self.built:
+            return
+        self.discard(user_id)
+        key = (count, int(last_delivery * 1000))
+        self.keys[user_id] = key
+        for order in self.ORDERS:
+            bisect.insort(self.sorted[order], self.sort_key(order, user_id, *key))
+    
+    def page(self, order: str, after: Optional[Tuple[int, int]] = None,
+             before: Optional[Tuple[int, int]] = None, size: int = RECEIVER_PAGE_SIZE) -> Tuple[int, List[Tuple[int, int]]]:
+        """Start position and (sort_key...) entries of the page after/before a cursor key"""
+        entries = self.sorted[order]
+        if before is not None:
+            end = bisect.bisect_left(entries, before)
+            start = max(0, end - size)
+        else:
+            start = bisect.bisect_right(entries, after) if after is not None else 0
+        return start, entries[start:start + size]
 
 class BotData:
     """Manages all bot data with persistence"""
     
-    def __init__(self):
+    def __init__(self, data_file: Optional[str] = DATA_FILE, data_format: str = "json", autoload: bool = True):
+        self.data_file = data_file  # None = in-memory only (shard worker mirrors)
+        self.data_format = data_format  # Format written by save_data, load detects it
+        self.save_deferred = 0  # Nesting depth of deferred_save()
+        self.save_pending = False
+        self.version = 0  # Bumped on every mutation, invalidates cached views
         self.senders: Set[int] = set()
         self.receivers: Set[int] = set()
         self.ip_queue: List[str] = []
-        self.distributed_ips: Dict[int, List[str]] = {}  # user_id -> [ips]
+        self.distributed_ips: Dict[int, List[str]] = {}  # user_id -> [ips] (LazyIPHistory for snapshots)
         self.sending_active: bool = False
         self.user_intervals: Dict[int, int] = {}  # user_id -> interval_seconds
         self.active_timers: Dict[int, bool] = {}  # user_id -> is_timer_active
-        self.load_data()
+        self.blocked_users: Set[int] = set()  # Receivers whose chat rejects the bot
+        self.reservations: Dict[int, List[str]] = {}  # user_id -> [ips] taken from the queue, not yet sent
+        self.last_delivery: Dict[int, float] = {}  # user_id -> unix time of the last delivered IP
+        self.receiver_tiers: Dict[int, str] = {}  # user_id -> tier, DEFAULT_TIER receivers are not listed
+        self.ip_expiry: Dict[str, float] = {}  # ip -> unix time it expires (IPs pushed with a TTL)
+        self.expiry_heap: List[Tuple[float, str]] = []  # (expires_at, ip), stale once ip_expiry disagrees
+        self.queue_front_inserts = 0  # Bumped by rollback_ip, keeps drop_expired's cursor in place
+        self.receiver_index = ReceiverIndex()
+        # Throughput history since start: one-minute buckets for an hour, one-hour buckets for two days
+        self.per_minute = RollingCounters(60, 60)
+        self.per_hour = RollingCounters(3600, 48)
+        if autoload:
+            self.load_data()
     
     def load_data(self):
-        """Load data from JSON file"""
+        """Load data from JSON or snapshot file"""
         try:
-            if os.path.exists(DATA_FILE):
-                with open(DATA_FILE, 'r', encoding='utf-8') as f:
+            if self.data_file and os.path.exists(self.data_file) and is_snapshot_file(self.data_file):
+                self.load_snapshot(self.data_file)
+            elif self.data_file and os.path.exists(self.data_file):
+                with open(self.data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.senders = set(data.get('senders', []))
                     self.receivers = set(data.get('receivers', []))
@@ -92,27 +2008,152 @@ class BotData:
                     self.sending_active = data.get('sending_active', False)
                     self.user_intervals = {int(k): v for k, v in data.get('user_intervals', {}).items()}
                     self.active_timers = {int(k): v for k, v in data.get('active_timers', {}).items()}
-                logger.info(f"Data loaded: {len(self.senders)} senders, {len(self.receivers)} receivers, {len(self.ip_queue)} IPs")
+                    self.blocked_users = set(data.get('blocked_users', []))
+                    self.last_delivery = {int(k): v for k, v in data.get('last_delivery', {}).items()}
+                    self.receiver_tiers = {int(k): v for k, v in data.get('receiver_tiers', {}).items()}
+                    self.ip_expiry = data.get('ip_expiry', {})
+            self.receiver_index.invalidate()
+            self.expiry_heap = [(expires_at, ip) for ip, expires_at in self.ip_expiry.items()]
+            heapq.heapify(self.expiry_heap)
+            if self.data_file and os.path.exists(self.data_file):
+                logger.info(
+                    "Data loaded: %s senders, %s receivers, %s IPs",
+                    len(self.senders), len(self.receivers), len(self.ip_queue)
+                )
         except Exception as e:
-            logger.error(f"Error loading data: {e}")
+            logger.error("Error loading data: %s", e)
     
+    def load_snapshot(self, path: str):
+        """Load a binary snapshot, delivery history stays in the mmap until used"""
+        snapshot = Snapshot(path)
+        self.senders = set(snapshot.array("senders"))
+        self.receivers = set(snapshot.array("receivers"))
+        self.ip_queue = unpack_ips(snapshot.array("queue"))
+        self.distributed_ips = LazyIPHistory(snapshot)
+        self.sending_active = snapshot.sending_active
+        self.user_intervals = dict(zip(snapshot.array("interval_users"), snapshot.array("interval_values")))
+        self.active_timers = {
+            user_id: bool(flag)
+            for user_id, flag in zip(snapshot.array("timer_users"), snapshot.array("timer_flags"))
+        }
+        self.blocked_users = set(snapshot.array("blocked"))
+        self.last_delivery = dict(zip(snapshot.array("last_delivery_users"), snapshot.array("last_delivery_times")))
+        self.receiver_tiers = {
+            user_id: SNAPSHOT_TIERS[index]
+            for user_id, index in zip(snapshot.array("tier_users"), snapshot.array("tier_values"))
+            if index < len(SNAPSHOT_TIERS)
+        }
+        self.ip_expiry = dict(zip(unpack_ips(snapshot.array("expiry_ips")), snapshot.array("expiry_times")))
+    
+    @timed("operation_latency_seconds", operation="save_data")
     def save_data(self):
-        """Save data to JSON file"""
+        """Save data to JSON or snapshot file"""
+        self.version += 1  # Every mutation ends in save_data()
+        if not self.data_file:
+            return
+        if self.save_deferred:
+            self.save_pending = True
+            return
+        self.save_pending = False
+        metrics.inc("saves_total")
         try:
+            if self.data_format == "snapshot":
+                write_snapshot(self.data_file, self)
+                return
             data = {
                 'senders': list(self.senders),
                 'receivers': list(self.receivers),
-                'ip_queue': self.ip_queue,
+                'ip_queue': self.queued_ips(),
                 'distributed_ips': {str(k): v for k, v in self.distributed_ips.items()},
                 'sending_active': self.sending_active,
                 'user_intervals': {str(k): v for k, v in self.user_intervals.items()},
                 'active_timers': {str(k): v for k, v in self.active_timers.items()},
+                'blocked_users': list(self.blocked_users),
+                'last_delivery': {str(k): v for k, v in self.last_delivery.items()},
+                'receiver_tiers': {str(k): v for k, v in self.receiver_tiers.items()},
+                'ip_expiry': self.ip_expiry,
                 'last_updated': datetime.now().isoformat()
             }
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
+            with open(self.data_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
         except Exception as e:
-            logger.error(f"Error saving data: {e}")
+            logger.error("Error saving data: %s", e)
+            metrics.inc("save_errors_total")
+    
+    @contextmanager
+    def deferred_save(self, flush: bool = True):
+        """Batch mutations into a single save when the outermost block exits
+        
+        With flush=False the save stays pending for the next save_data() or flush_pending().
+        """
+        self.save_deferred += 1
+        try:
+            yield
+        finally:
+            self.save_deferred -= 1
+            if not self.save_deferred and self.save_pending and flush:
+                self.save_data()
+    
+    def flush_pending(self):
+        """Write mutations left pending by deferred_save(flush=False)"""
+        if self.save_pending and not self.save_deferred:
+            self.save_data()
+    
+    def queued_ips(self) -> List[str]:
+        """Queue as persisted: reserved IPs go first so a crash mid-send can't lose them"""
+        if not self.reservations:
+            return self.ip_queue
+        return [ip for ips in self.reservations.values() for ip in ips] + self.ip_queue
+    
+    def iter_delivered(self, user_id: int) -> Iterator[str]:
+        """Stream IPs delivered to user"""
+        if isinstance(self.distributed_ips, LazyIPHistory):
+            return self.distributed_ips.iter_ips(user_id)
+        return iter(self.distributed_ips.get(user_id, []))
+    
+    def delivery_count(self, user_id: int) -> int:
+        """Number of IPs delivered to user"""
+        if isinstance(self.distributed_ips, LazyIPHistory):
+            return self.distributed_ips.count(user_id)
+        return len(self.distributed_ips.get(user_id, []))
+    
+    def total_distributed(self) -> int:
+        """Number of IPs delivered to all users"""
+        return sum(self.delivery_count(user_id) for user_id in self.distributed_ips)
+    
+    def record_event(self, kind: str, count: int = 1):
+        """Count pushed/delivered/failed/flood_waited events in the rolling windows"""
+        now = clock.time()
+        self.per_minute.add(kind, now, count)
+        self.per_hour.add(kind, now, count)
+    
+    def event_rate(self, kind: str, minutes: int) -> float:
+        """Events per minute over the last `minutes` minutes (hour buckets beyond one hour)"""
+        now = clock.time()
+        if minutes <= 60:
+            return self.per_minute.total(kind, now, minutes) / minutes
+        hours = -(-minutes // 60)
+        return self.per_hour.total(kind, now, hours) / (hours * 60)
+    
+    def event_total(self, kind: str, hours: int) -> int:
+        """Events in the last `hours` hours"""
+        return self.per_hour.total(kind, clock.time(), hours)
+    
+    def queue_eta(self, minutes: int = 15) -> Optional[float]:
+        """Seconds until the queue runs dry at the recent net drain rate (None = not draining)"""
+        drain = self.event_rate("delivered", minutes) - self.event_rate("pushed", minutes)
+        if not self.ip_queue:
+            return 0.0
+        if drain <= 0:
+            return None
+        return len(self.ip_queue) / drain * 60
+    
+    def receiver_page(self, order: str = "count", after: Optional[Tuple[int, int]] = None,
+                      before: Optional[Tuple[int, int]] = None) -> Tuple[int, List[Tuple[int, int]]]:
+        """One page of receivers from the sorted index (see ReceiverIndex.page)"""
+        if not self.receiver_index.built:
+            self.receiver_index.rebuild(self)
+        return self.receiver_index.page(order, after, before)
     
     def add_sender(self, user_id: int) -> bool:
         """Add user as sender"""
@@ -120,6 +2161,7 @@ class BotData:
             self.senders.add(user_id)
             # Remove from receivers if exists
             self.receivers.discard(user_id)
+            self.receiver_index.discard(user_id)
             self.save_data()
             return True
         return False
@@ -133,6 +2175,7 @@ class BotData:
             # Initialize empty IP list
             if user_id not in self.distributed_ips:
                 self.distributed_ips[user_id] = []
+            self.receiver_index.update(user_id, self.delivery_count(user_id), self.last_delivery.get(user_id, 0))
             self.save_data()
             return True
         return False
@@ -147,36 +2190,221 @@ class BotData:
             del self.user_intervals[user_id]
         if user_id in self.active_timers:
             del self.active_timers[user_id]
+        self.blocked_users.discard(user_id)
+        self.last_delivery.pop(user_id, None)
+        self.receiver_tiers.pop(user_id, None)
+        self.receiver_index.discard(user_id)
         self.save_data()
     
-    def add_ips(self, ips: List[str]):
-        """Add IPs to queue"""
+    def add_ips(self, ips: List[str], ttl: Optional[float] = None):
+        """Add IPs to queue, expiring after ttl seconds (None = DEFAULT_IP_TTL, 0 = never)
+        
+        A re-push replaces any expiry left from an earlier push of the same IP.
+        """
         self.ip_queue.extend(ips)
+        ttl = DEFAULT_IP_TTL if ttl is None else ttl
+        expires_at = clock.time() + ttl
+        for ip in ips:
+            self.ip_expiry.pop(ip, None)  # Its heap entry goes stale and is skipped by the purge
+            if ttl > 0:
+                self.set_expiry(ip, expires_at)
+        self.record_event("pushed", len(ips))
         self.save_data()
     
+    def set_expiry(self, ip: str, expires_at: float):
+        """Expire a queued IP at a unix time (a later push of the same IP replaces it)"""
+        self.ip_expiry[ip] = expires_at
+        heapq.heappush(self.expiry_heap, (expires_at, ip))
+    
+    def is_expired(self, ip: str, now: Optional[float] = None) -> bool:
+        expires_at = self.ip_expiry.get(ip)
+        return expires_at is not None and expires_at <= (clock.time() if now is None else now)
+    
+    def has_expired(self, now: Optional[float] = None) -> bool:
+        """Whether the expiry heap has entries due for purging"""
+        return bool(self.expiry_heap) and self.expiry_heap[0][0] <= (clock.time() if now is None else now)
+    
+    def collect_expired(self, limit: Optional[int] = IP_PURGE_CHUNK, now: Optional[float] = None) -> Dict[str, float]:
+        """Pop up to limit due entries off the expiry heap, returns {ip: expires_at}
+        
+        Their ip_expiry entries stay until drop_expired(), so reserve_ip keeps skipping them.
+        """
+        now = clock.time() if now is None else now
+        due = {}
+        while self.expiry_heap and self.expiry_heap[0][0] <= now and (limit is None or len(due) < limit):
+            expires_at, ip = heapq.heappop(self.expiry_heap)
+            if self.ip_expiry.get(ip) == expires_at:
+                due[ip] = expires_at
+        return due
+    
+    def drop_expired(self, due: Dict[str, float], chunk: Optional[int] = None) -> Iterator[int]:
+        """Remove collected IPs from the queue chunk entries at a time, yielding the entries removed per step
+        
+        The queue is walked from the back, so reserve_ip's pops never shift unvisited
+        entries past the cursor; rollback_ip's front inserts move the cursor along. Each
+        step re-checks ip_expiry, so IPs pushed again between steps stay. Expiry entries
+        are dropped and the state saved once, after the last step: until then reserve_ip
+        keeps skipping the copies not reached yet. IPs reserved for an in-flight send keep
+        their expiry entry, rollback_ip drops the IP instead of requeueing it.
+        """
+        if not due:
+            return
+        removed = 0
+        cursor = len(self.ip_queue)
+        front_inserts = self.queue_front_inserts
+        while cursor > 0:
+            cursor = min(cursor + self.queue_front_inserts - front_inserts, len(self.ip_queue))
+            front_inserts = self.queue_front_inserts
+            start = max(0, cursor - chunk) if chunk else 0
+            window = self.ip_queue[start:cursor]
+            kept = [ip for ip in window if ip not in due or self.ip_expiry.get(ip) != due[ip]]
+            if len(kept) != len(window):
+                self.ip_queue[start:cursor] = kept
+                removed += len(window) - len(kept)
+                self.version += 1
+            cursor = start
+            yield len(window) - len(kept)
+        held = {ip for ips in self.reservations.values() for ip in ips}
+        for ip, expires_at in due.items():
+            if self.ip_expiry.get(ip) == expires_at and ip not in held:
+                del self.ip_expiry[ip]
+        if removed:
+            self.record_event("expired", removed)
+            self.save_data()
+    
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Drop every expired IP from the queue at once, returns queue entries removed"""
+        return sum(self.drop_expired(self.collect_expired(None, now)))
+    
     def get_next_ip_for_user(self, user_id: int) -> Optional[str]:
-        """Get next available IP for specific user"""
+        """Get next available IP for specific user (reserve and commit in one step)"""
+        ip = self.reserve_ip(user_id)
+        if ip:
+            self.commit_ip(user_id, ip)
+        return ip
+    
+    @timed("operation_latency_seconds", operation="reserve_ip")
+    def reserve_ip(self, user_id: int, exclude: Collection[str] = ()) -> Optional[str]:
+        """Take the next IP this user hasn't received (nor excludes) out of the queue, until commit or rollback"""
         if not self.ip_queue:
             return None
         
-        # Find an IP that hasn't been given to this user
+        # Find an IP that hasn't been given to (or isn't already held for) this user
+        reserved = self.reservations.get(user_id, ())
+        now = clock.time()
         for i, ip in enumerate(self.ip_queue):
+            if ip in self.ip_expiry and self.ip_expiry[ip] <= now:
+                continue  # Expired, left for the background purge
             if user_id not in self.distributed_ips:
                 self.distributed_ips[user_id] = []
             
-            if ip not in self.distributed_ips[user_id]:
-                # Remove IP from queue and add to user's distributed list
-                self.distributed_ips[user_id].append(ip)
+            if ip not in self.distributed_ips[user_id] and ip not in reserved and ip not in exclude:
                 self.ip_queue.pop(i)
-                self.save_data()
+                self.reservations.setdefault(user_id, []).append(ip)
+                self.version += 1
                 return ip
         
         return None  # No new IPs available for this user
     
+    def release_reservation(self, user_id: int, ip: str) -> bool:
+        """Drop a reservation, returns whether it was held"""
+        reserved = self.reservations.get(user_id)
+        if not reserved or ip not in reserved:
+            return False
+        reserved.remove(ip)
+        if not reserved:
+            del self.reservations[user_id]
+        return True
+    
+    @timed("operation_latency_seconds", operation="commit_ip")
+    def commit_ip(self, user_id: int, ip: str):
+        """Record a reserved IP as delivered once the send succeeded"""
+        # The expiry entry stays: other copies of the IP may still be queued or held, and the
+        # purge forgets it once due (a re-push replaces it before then)
+        self.release_reservation(user_id, ip)
+        if user_id not in self.distributed_ips:
+            self.distributed_ips[user_id] = []
+        self.distributed_ips[user_id].append(ip)
+        self.last_delivery[user_id] = clock.time()
+        self.record_event("delivered")
+        if user_id in self.receivers:
+            self.receiver_index.update(user_id, self.delivery_count(user_id), self.last_delivery[user_id])
+        self.save_data()
+    
+    def rollback_ip(self, user_id: int, ip: str):
+        """Return a reserved IP to the front of the queue after a failed send"""
+        if not self.release_reservation(user_id, ip):
+            return
+        if self.is_expired(ip):
+            # Expired while in flight: drop it, and rewrite the queue that still lists it
+            del self.ip_expiry[ip]
+            self.record_event("expired")
+            self.save_data()
+            return
+        # The persisted queue already lists reserved IPs first, no save needed
+        self.ip_queue.insert(0, ip)
+        self.queue_front_inserts += 1
+        self.version += 1
+    
+    def block_user(self, user_id: int):
+        """Stop deliveries to a receiver whose chat rejects the bot"""
+        self.blocked_users.add(user_id)
+        self.active_timers[user_id] = False
+        self.save_data()
+    
+    def unblock_user(self, user_id: int) -> bool:
+        """Allow deliveries again once the user talks to the bot"""
+        if user_id in self.blocked_users:
+            self.blocked_users.discard(user_id)
+            self.save_data()
+            return True
+        return False
+    
+    def tier_of(self, user_id: int) -> str:
+        """Receiver tier of a user"""
+        return self.receiver_tiers.get(user_id, DEFAULT_TIER)
+    
+    def set_tier(self, user_id: int, tier: str):
+        """Set a receiver's tier (DEFAULT_TIER removes the override)"""
+        if tier == DEFAULT_TIER:
+            self.receiver_tiers.pop(user_id, None)
+        else:
+            self.receiver_tiers[user_id] = tier
+        self.save_data()
+    
+    def record_deliveries(self, user_id: int, ips: List[str]):
+        """Append IPs to a user's delivery history (imports)"""
+        if user_id not in self.distributed_ips:
+            self.distributed_ips[user_id] = []
+        self.distributed_ips[user_id].extend(ips)
+        self.receiver_index.invalidate()
+        self.save_data()
+    
+    def clear_all(self):
+        """Drop all users, queue and history"""
+        self.senders.clear()
+        self.receivers.clear()
+        self.ip_queue.clear()
+        self.distributed_ips.clear()
+        self.user_intervals.clear()
+        self.active_timers.clear()
+        self.blocked_users.clear()
+        self.last_delivery.clear()
+        self.receiver_tiers.clear()
+        self.ip_expiry.clear()
+        self.expiry_heap.clear()
+        self.receiver_index.invalidate()
+        self.sending_active = False
+        self.save_data()
+    
     def clear_queue(self):
         """Clear IP queue and distributed IPs"""
         self.ip_queue.clear()
+        self.ip_expiry.clear()
+        self.expiry_heap.clear()
         self.distributed_ips.clear()
+        self.last_delivery.clear()
+        self.receiver_index.invalidate()
         self.save_data()
     
     def set_user_interval(self, user_id: int, interval: int):
@@ -188,25 +2416,39 @@ class BotData:
         """Set timer active status for user"""
         self.active_timers[user_id] = active
         self.save_data()
+    
+    def timer_assignments(self, shard_index: int, shard_count: int) -> Dict[int, int]:
+        """Get active timers (user_id -> interval) owned by a shard worker"""
+        return {
+            user_id: self.user_intervals.get(user_id, MIN_INTERVAL)
+            for user_id, active in self.active_timers.items()
+            if active and user_id in self.receivers and user_id not in self.blocked_users
+            and shard_for_user(user_id, shard_count) == shard_index
+        }
 
 # ==============================
 # 🌐 GLOBAL VARIABLES
 # ==============================
 
-# Global data instance
-bot_data = BotData()
+# Global data instance, main() loads the state file in the background while connecting
+bot_data = BotData(STATE_FILE, DATA_FORMAT, autoload=False)
 user_timers: Dict[int, asyncio.Task] = {}  # user_id -> timer_task
+send_limiter = SendLimiter(SEND_CONCURRENCY or HTTP_POOL_SIZE)
+delivery_sla = SlaTracker()
+delivery_bots = DeliveryBotPool()
+state_client: Optional["StateClient"] = None  # Set inside shard worker processes
+shard_processes: List[multiprocessing.Process] = []  # Worker processes started by the primary
 
-# Setup logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
-logger = logging.getLogger(__name__)
+# Gauges read from the live state when metrics are scraped
+metrics.register_gauge("queue_size", lambda: len(bot_data.ip_queue))
+metrics.register_gauge("active_timers", lambda: sum(1 for active in bot_data.active_timers.values() if active))
+metrics.register_gauge("timer_tasks", lambda: len(user_timers))
+metrics.register_gauge("receivers", lambda: len(bot_data.receivers))
+metrics.register_gauge("sends_in_flight", lambda: send_limiter.in_flight)
+metrics.register_gauge("sends_waiting", lambda: send_limiter.waiting)
+metrics.register_gauge("blocked_receivers", lambda: len(bot_data.blocked_users))
+metrics.register_gauge("expiring_ips", lambda: len(bot_data.ip_expiry))
+metrics.register_gauge("reserved_ips", lambda: sum(len(ips) for ips in bot_data.reservations.values()))
 
 # ==============================
 # 🎛️ USER INTERFACE KEYBOARDS
@@ -253,87 +2495,786 @@ def get_receiver_menu_keyboard(user_id: int = None):
         ]
     ]
     
-    # Add timer controls if user has active timer
-    if user_id and user_id in bot_data.active_timers and bot_data.active_timers[user_id]:
-        keyboard.append([
-            InlineKeyboardButton("⏹️ Stop Timer", callback_data="stop_timer")
-        ])
+    # Add timer controls if user has active timer
+    if user_id and user_id in bot_data.active_timers and bot_data.active_timers[user_id]:
+        keyboard.append([
+            InlineKeyboardButton("⏹️ Stop Timer", callback_data="stop_timer")
+        ])
+    
+    keyboard.append([
+        InlineKeyboardButton("🔙 Back", callback_data="main_menu")
+    ])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+# ==============================
+# ⏰ TIMER FUNCTIONS
+# ==============================
+
+async def start_user_timer(user_id: int, interval: int, app: Application):
+    """Start automatic IP delivery timer for user"""
+    held_ip: Optional[str] = None  # Reserved IP not yet committed (in flight or awaiting retry)
+    due_at = 0.0  # Tick the held IP was scheduled for, retries count against its SLA
+    attempts = 0
+    parked: Set[str] = set()  # IPs this timer gave up on, left to other receivers
+    try:
+        logger.info("Starting timer for user %s with %ss interval", user_id, interval)
+        
+        delay = interval
+        while bot_data.active_timers.get(user_id, False) and not shutdown.draining:
+            scheduled_at = clock.monotonic() + delay
+            await clock.sleep(delay)
+            drift = clock.monotonic() - scheduled_at
+            metrics.observe("timer_dispatch_lag_seconds", drift)
+            watchdog.note_timer_drift(drift)
+            delay = interval
+            
+            # Check if timer is still active and user is still receiver
+            if not bot_data.active_timers.get(user_id, False) or user_id not in bot_data.receivers:
+                break
+            
+            # Check if sending is active
+            if not bot_data.sending_active:
+                continue
+            
+            # Retry the held IP first, otherwise reserve the next one
+            if not held_ip:
+                held_ip = await reserve_ip(user_id, parked)
+                due_at = scheduled_at
+            
+            if held_ip:
+                shutdown.sending.add(user_id)
+                try:
+                    await send_message(app.bot, user_id, held_ip, kind="ip")
+                except Exception as e:
+                    await record_send_failure(user_id, e)
+                    attempts += 1
+                    if is_permanent_send_error(e):
+                        logger.warning("Chat %s rejects the bot (%s), stopping its timer", user_id, e)
+                        ip, held_ip = held_ip, None
+                        await rollback_delivery(user_id, ip, blocked=True)
+                        break
+                    if attempts >= DELIVERY_MAX_ATTEMPTS:
+                        logger.warning("Giving up on %s for user %s after %s attempts", held_ip, user_id, attempts)
+                        ip, held_ip, attempts = held_ip, None, 0
+                        # Requeued for other receivers, this timer moves on to the next IP
+                        parked.add(ip)
+                        await rollback_delivery(user_id, ip)
+                    else:
+                        metrics.inc("delivery_retries_total")
+                        delay = retry_delay(attempts, e)
+                    continue
+                else:
+                    ip, held_ip = held_ip, None
+                    await commit_delivery(user_id, ip, "timer", source="retry" if attempts else "queue", due_at=due_at)
+                    attempts = 0
+                finally:
+                    shutdown.sending.discard(user_id)
+            else:
+                # No more IPs available
+                try:
+                    await send_message(
+                        app.bot,
+                        user_id,
+                        "⚠️ **Timer Active but No IPs Available**\n\nWaiting for more IPs to be added...",
+                        kind="notice"
+                    )
+                except Exception as e:
+                    if is_permanent_send_error(e):
+                        logger.warning("Chat %s rejects the bot (%s), stopping its timer", user_id, e)
+                        await block_receiver(user_id)
+                        break
+                    logger.error("Failed to send no-IP message to %s: %s", user_id, e)
+        
+        # Timer stopped
+        logger.info("Timer stopped for user %s", user_id)
+        
+    except asyncio.CancelledError:
+        logger.info("Timer cancelled for user %s", user_id)
+        raise
+    except Exception as e:
+        logger.error("Timer error for user %s: %s", user_id, e)
+    finally:
+        # A send interrupted by cancellation may or may not have arrived, requeue rather than lose it
+        if held_ip:
+            try:
+                await rollback_delivery(user_id, held_ip)
+            except Exception as e:
+                logger.error("Failed to requeue %s for user %s: %s", held_ip, user_id, e)
+
+def is_permanent_send_error(error: Exception) -> bool:
+    """Whether a send failure means the chat will never accept messages from the bot"""
+    if isinstance(error, Forbidden):
+        return True  # Bot blocked, user deactivated or kicked
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+def retry_delay(attempts: int, error: Exception) -> float:
+    """Backoff before retrying a failed send"""
+    if isinstance(error, RetryAfter):
+        retry_after = error.retry_after
+        return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+    return min(DELIVERY_RETRY_MAX_DELAY, DELIVERY_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+async def send_message(bot, chat_id: int, text: str, kind: str = "notice", **kwargs):
+    """Send a message, IPs through the receiver's delivery bot when a pool is configured
+    
+    A delivery bot in a flood wait or answering Forbidden is routed around right away,
+    ending with the primary bot (bot), whose errors are raised as usual.
+    """
+    if kind == "ip" and delivery_bots.active:
+        while (sender := delivery_bots.bot_for(chat_id, bot)) is not bot:
+            try:
+                return await send_via(sender, chat_id, text, kind, **kwargs)
+            except Forbidden:
+                delivery_bots.forbid(sender, chat_id)
+            except RetryAfter as e:
+                delivery_bots.pause(sender, retry_delay(1, e))
+    return await send_via(bot, chat_id, text, kind, **kwargs)
+
+async def send_via(bot, chat_id: int, text: str, kind: str = "notice", **kwargs):
+    """Send with one bot: tier-prioritised concurrency limiting, rate budget, latency, failure and flood-wait accounting
+    
+    The budget is taken inside the slot, so when a bot's rate is the bottleneck sends still
+    reach it in tier priority order rather than in the budget's arrival order.
+    """
+    async with send_limiter.slot(tier_priority(bot_data.tier_of(chat_id))):
+        budget = delivery_bots.budget(bot)
+        if budget:
+            await budget.acquire()
+        start = time.perf_counter()
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter:
+            metrics.inc("flood_waits_total")
+            metrics.inc("send_failures_total", kind=kind)
+            raise
+        except Exception:
+            metrics.inc("send_failures_total", kind=kind)
+            raise
+        finally:
+            metrics.observe("send_latency_seconds", time.perf_counter() - start, kind=kind)
+
+async def reserve_ip(user_id: int, exclude: Collection[str] = ()) -> Optional[str]:
+    """Reserve next IP for user from the state service (shard worker) or local data"""
+    if state_client:
+        return await state_client.reserve(user_id, exclude)
+    return bot_data.reserve_ip(user_id, exclude)
+
+async def commit_delivery(user_id: int, ip: str, path: str, source: str = "queue",
+                          due_at: Optional[float] = None):
+    """Commit a sent IP and account for it in metrics, logs, the audit log and the tier SLA"""
+    metrics.inc("deliveries_total", path=path)
+    delivery_log.delivered(user_id, ip, path)
+    delay = None if due_at is None else max(0.0, clock.monotonic() - due_at)
+    if state_client:
+        await state_client.request("commit", user_id=user_id, ip=ip, source=source, delay=delay)
+    else:
+        bot_data.commit_ip(user_id, ip)
+        audit_log.record(user_id, ip, source)
+        if delay is not None:
+            delivery_sla.record(bot_data.tier_of(user_id), delay)
+
+async def deliver_reserved(bot, chat_id: int, user_id: int, ip: str, path: str):
+    """Send a reserved IP now: commit on success, requeue and re-raise on failure"""
+    due_at = clock.monotonic()  # On-demand deliveries are due immediately
+    try:
+        await send_message(bot, chat_id, ip, kind="ip")
+    except Exception as e:
+        await record_send_failure(user_id, e)
+        await rollback_delivery(user_id, ip, blocked=is_permanent_send_error(e))
+        raise
+    await commit_delivery(user_id, ip, path, due_at=due_at)
+
+async def record_send_failure(user_id: int, error: Exception):
+    """Account for a failed IP send in logs and the rolling throughput counters"""
+    delivery_log.failed(user_id, error)
+    flood_wait = isinstance(error, RetryAfter)
+    if state_client:
+        await state_client.request("failed", flood_wait=flood_wait)
+        return
+    bot_data.record_event("failed")
+    if flood_wait:
+        bot_data.record_event("flood_waited")
+
+async def rollback_delivery(user_id: int, ip: str, blocked: bool = False):
+    """Requeue an IP whose send failed, blocking the receiver on permanent failures"""
+    metrics.inc("delivery_rollbacks_total")
+    if blocked:
+        metrics.inc("blocked_receivers_total")
+    if state_client:
+        await state_client.request("rollback", user_id=user_id, ip=ip, blocked=blocked)
+        return
+    bot_data.rollback_ip(user_id, ip)
+    if blocked:
+        bot_data.block_user(user_id)
+
+async def block_receiver(user_id: int):
+    """Stop deliveries to a receiver whose chat rejects the bot when no IP is held"""
+    metrics.inc("blocked_receivers_total")
+    if state_client:
+        await state_client.request("block", user_id=user_id)
+        return
+    bot_data.block_user(user_id)
+
+async def purge_expired_ips():
+    """Background task: collect expired IPs, then remove them from the queue, both in bounded chunks"""
+    while True:
+        await clock.sleep(IP_PURGE_INTERVAL)
+        try:
+            due: Dict[str, float] = {}
+            while bot_data.has_expired():
+                due.update(bot_data.collect_expired())
+                await asyncio.sleep(0)  # Let handlers and timers run between chunks
+            removed = 0
+            for count in bot_data.drop_expired(due, IP_COMPACT_CHUNK):
+                removed += count
+                await asyncio.sleep(0)
+            if removed:
+                metrics.inc("ips_expired_total", removed)
+                logger.info("Purged %s expired IPs, %s left in queue", removed, len(bot_data.ip_queue))
+        except Exception as e:
+            logger.error("Error purging expired IPs: %s", e)
+
+async def stop_user_timer(user_id: int):
+    """Stop timer for user"""
+    try:
+        # Mark timer as inactive - it will stop naturally
+        bot_data.set_timer_active(user_id, False)
+        
+        # Remove from active timers dict
+        if user_id in user_timers:
+            del user_timers[user_id]
+        
+        logger.info("Timer stopped for user %s", user_id)
+    except Exception as e:
+        logger.error("Error stopping timer for user %s: %s", user_id, e)
+
+# ==============================
+# 🧩 SHARDED DEPLOYMENT
+# ==============================
+
+def shard_for_user(user_id: int, shard_count: int) -> int:
+    """Map a receiver to the worker process that owns its timer"""
+    return zlib.crc32(str(user_id).encode()) % shard_count
+
+class StateService:
+    """Local state service that hands out IPs to shard workers
+    
+    Runs inside the primary process on a Unix socket. Requests are handled one at a
+    time on the primary's event loop against the single BotData instance, so every
+    IP is handed out exactly once no matter how many workers ask for it.
+    
+    Worker mutations are saved every save_interval seconds instead of per request, so
+    commits don't serialize on full state rewrites. A crash loses at most that window:
+    those IPs are still listed as queued on disk and get delivered again.
+    """
+    
+    def __init__(self, path: str = STATE_SOCKET_PATH, save_interval: float = STATE_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.flusher: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start listening on the Unix socket"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        if self.save_interval > 0:
+            self.flusher = asyncio.create_task(self.flush_periodically())
+        logger.info("State service listening on %s", self.path)
+    
+    async def stop(self):
+        """Stop listening, write pending mutations and remove the socket"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        bot_data.flush_pending()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+    
+    async def flush_periodically(self):
+        """Save batched worker mutations every save_interval"""
+        while True:
+            await asyncio.sleep(self.save_interval)
+            bot_data.flush_pending()
+    
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve newline-delimited JSON requests from one worker"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                with bot_data.deferred_save(flush=not self.save_interval):
+                    response = self.handle_request(request)
+                response["id"] = request.get("id")
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error("State service client error: %s", e)
+        finally:
+            writer.close()
+    
+    def handle_request(self, request: dict) -> dict:
+        """Execute a single state request"""
+        op = request.get("op")
+        if op == "reserve":
+            return {"ip": bot_data.reserve_ip(int(request["user_id"]), set(request.get("exclude", ())))}
+        if op == "commit":
+            bot_data.commit_ip(int(request["user_id"]), request["ip"])
+            audit_log.record(int(request["user_id"]), request["ip"], request.get("source", "queue"))
+            if request.get("delay") is not None:
+                delivery_sla.record(bot_data.tier_of(int(request["user_id"])), float(request["delay"]))
+            return {}
+        if op == "failed":
+            bot_data.record_event("failed")
+            if request.get("flood_wait"):
+                bot_data.record_event("flood_waited")
+            return {}
+        if op == "rollback":
+            bot_data.rollback_ip(int(request["user_id"]), request["ip"])
+            if request.get("blocked"):
+                bot_data.block_user(int(request["user_id"]))
+            return {}
+        if op == "block":
+            bot_data.block_user(int(request["user_id"]))
+            return {}
+        if op == "assignments":
+            timers = bot_data.timer_assignments(int(request["shard"]), int(request["shards"]))
+            return {
+                "sending_active": bot_data.sending_active,
+                "timers": {str(user_id): interval for user_id, interval in timers.items()},
+                "tiers": {str(user_id): bot_data.receiver_tiers[user_id] for user_id in timers if user_id in bot_data.receiver_tiers},
+            }
+        return {"error": f"Unknown op: {op}"}
+
+class StateClient:
+    """Connection from a shard worker to the primary's state service
+    
+    Requests carry an id and one reader task hands each response to the future of its
+    request, so a caller cancelled mid-request can't leave its response for the next one.
+    A reservation whose caller went away is rolled back when its response arrives.
+    """
+    
+    def __init__(self, path: str = STATE_SOCKET_PATH):
+        self.path = path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.ids = itertools.count(1)
+        self.pending: Dict[int, Tuple[dict, asyncio.Future]] = {}  # id -> (request, response future)
+    
+    async def connect(self, timeout: float = 30):
+        """Connect to the state service, waiting for the primary to come up"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                # Assignment snapshots for large shards exceed the default 64 KiB line limit
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=2 ** 24)
+                self.reader_task = asyncio.create_task(self.read_responses())
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                if asyncio.get_running_loop().time() > deadline:
+                    raise
+                await asyncio.sleep(0.5)
+    
+    async def close(self):
+        """Close the connection"""
+        if self.reader_task:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        self.fail_pending(ConnectionError("State client closed"))
+    
+    async def read_responses(self):
+        """Route responses to their requests until the connection closes"""
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                request, future = self.pending.pop(response.pop("id", None), (None, None))
+                if future is None:
+                    continue  # Caller went away, its request was abandoned below
+                if not future.done():
+                    future.set_result(response)
+                elif request["op"] == "reserve" and response.get("ip"):
+                    self.abandon(request, response)
+        finally:
+            self.fail_pending(ConnectionError("State service closed the connection"))
+    
+    def fail_pending(self, error: Exception):
+        pending, self.pending = self.pending, {}
+        for _, future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+    
+    def abandon(self, request: dict, response: dict):
+        """Put back an IP reserved for a caller that was cancelled before the response came"""
+        if self.writer:
+            rollback = {"id": None, "op": "rollback", "user_id": request["user_id"], "ip": response["ip"]}
+            self.writer.write(json.dumps(rollback).encode() + b"\n")
+    
+    async def request(self, op: str, **params) -> dict:
+        """Send one request and wait for its response"""
+        if not self.writer:
+            raise ConnectionError("State client is not connected")
+        request_id = next(self.ids)
+        request = {"id": request_id, "op": op, **params}
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (request, future)
+        try:
+            self.writer.write(json.dumps(request).encode() + b"\n")
+            await self.writer.drain()
+            response = await future
+        except asyncio.CancelledError:
+            if request_id in self.pending:
+                future.cancel()  # Keep the entry: the reader abandons the response when it arrives
+            raise
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+    
+    async def reserve(self, user_id: int, exclude: Collection[str] = ()) -> Optional[str]:
+        """Reserve the next IP for user, skipping exclude"""
+        response = await self.request("reserve", user_id=user_id, exclude=list(exclude))
+        return response["ip"]
+
+def sync_shard_timers(assignments: dict, app: Application):
+    """Mirror this shard's timer state from the primary and start/stop timer tasks"""
+    timers = {int(user_id): interval for user_id, interval in assignments["timers"].items()}
+    
+    bot_data.sending_active = assignments["sending_active"]
+    bot_data.receivers = set(timers)
+    bot_data.active_timers = {user_id: True for user_id in timers}
+    bot_data.receiver_tiers = {int(user_id): tier for user_id, tier in assignments.get("tiers", {}).items()}
+    
+    # Cancel timers that were stopped or restarted with a new interval
+    for user_id in list(user_timers.keys()):
+        if timers.get(user_id) != bot_data.user_intervals.get(user_id) or user_timers[user_id].done():
+            user_timers.pop(user_id).cancel()
+    bot_data.user_intervals = timers
+    
+    for user_id, interval in timers.items():
+        if user_id not in user_timers:
+            user_timers[user_id] = asyncio.create_task(start_user_timer(user_id, interval, app))
+
+async def shard_worker_main(shard_index: int, shard_count: int):
+    """Run the timers and sends of one shard"""
+    global state_client
+    
+    state_client = StateClient()
+    await state_client.connect()
+    
+    # Send-only application, updates are fetched by the primary
+    app = build_application().build()
+    await app.initialize()
+    await delivery_bots.start(share=shard_count + 1)  # Budgets are split with the primary and the other workers
+    logger.info("Shard worker %s/%s started", shard_index + 1, shard_count)
+    
+    metrics_server = MetricsServer(port=METRICS_PORT + 1 + shard_index)
+    if METRICS_PORT:
+        await metrics_server.start()
+    lag_monitor = asyncio.create_task(watchdog.run())
+    watchdog.ready = True
+    
+    # terminate() (SIGTERM) or Ctrl+C unwinds into the drain below instead of killing sends
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, main_task.cancel)
+    
+    try:
+        while True:
+            assignments = await state_client.request("assignments", shard=shard_index, shards=shard_count)
+            sync_shard_timers(assignments, app)
+            await asyncio.sleep(SHARD_SYNC_INTERVAL)
+    finally:
+        # The primary owns persistence: finish in-flight sends, commits go to the state service
+        await shutdown.drain_timers()
+        lag_monitor.cancel()
+        await metrics_server.stop()
+        await delivery_bots.stop()
+        await app.shutdown()
+        await state_client.close()
+
+def run_shard_worker(shard_index: int, shard_count: int):
+    """Entry point of a shard worker process"""
+    global bot_data
+    
+    # Own log file per worker - rotation is not safe across processes
+    root, ext = os.path.splitext(LOG_FILE)
+    setup_logging(f"{root}.shard{shard_index}{ext}")
+    
+    # Local mirror only - the primary owns persistence
+    bot_data = BotData(data_file=None)
+    import_telegram()
+    install_event_loop()
+    try:
+        asyncio.run(shard_worker_main(shard_index, shard_count))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        logger.error("Shard worker %s crashed: %s", shard_index, e)
+    finally:
+        delivery_log.flush(force=True)
+        shutdown_logging()
+
+def start_shard_workers():
+    """Spawn the shard worker processes"""
+    ctx = multiprocessing.get_context("spawn")
+    for shard_index in range(SHARD_WORKERS):
+        process = ctx.Process(
+            target=run_shard_worker,
+            args=(shard_index, SHARD_WORKERS),
+            name=f"autodrop-shard-{shard_index}",
+            daemon=True
+        )
+        process.start()
+        shard_processes.append(process)
+    logger.info("Started %s shard workers", SHARD_WORKERS)
+
+async def stop_shard_workers():
+    """Ask the shard workers to drain and exit (the state service must keep serving meanwhile)"""
+    for process in shard_processes:
+        if process.is_alive():
+            process.terminate()
+    for process in shard_processes:
+        await asyncio.to_thread(process.join, SHUTDOWN_DRAIN_TIMEOUT + 5)
+        if process.is_alive():
+            logger.warning("Shard worker %s did not drain in time, killing it", process.name)
+            process.kill()
+    shard_processes.clear()
+
+# ==============================
+# 🚦 THROTTLING & VIEW CACHE
+# ==============================
+
+class UserThrottle:
+    """Per-user debounce: an action is dropped while it runs or within window seconds of its last start"""
+    
+    def __init__(self, window: float = THROTTLE_WINDOW):
+        self.window = window
+        self.started: Dict[Tuple[int, str], float] = {}  # (user_id, action) -> clock.monotonic()
+        self.running: Set[Tuple[int, str]] = set()
+    
+    def acquire(self, user_id: int, action: str) -> bool:
+        """Whether the action may run now (call release() when it finishes)"""
+        key = (user_id, action)
+        now = clock.monotonic()
+        if key in self.running or now - self.started.get(key, -self.window) < self.window:
+            return False
+        if len(self.started) >= INTERACTIVE_MAX_ENTRIES:
+            self.started = {k: t for k, t in self.started.items() if now - t < self.window}
+        self.started[key] = now
+        self.running.add(key)
+        return True
+    
+    def release(self, user_id: int, action: str):
+        self.running.discard((user_id, action))
+
+class RenderCache:
+    """Rendered views, valid while BotData.version is unchanged and for at most ttl seconds"""
+    
+    def __init__(self, ttl: float = STATUS_CACHE_TTL):
+        self.ttl = ttl
+        self.entries: Dict[object, Tuple[int, float, str]] = {}  # key -> (version, rendered_at, text)
     
-    keyboard.append([
-        InlineKeyboardButton("🔙 Back", callback_data="main_menu")
-    ])
+    def get_or_render(self, key, version: int, render: Callable[[], str]) -> str:
+        """Cached text for key, rendering it again when stale"""
+        entry = self.entries.get(key)
+        now = clock.monotonic()
+        if entry and entry[0] == version and now - entry[1] < self.ttl:
+            metrics.inc("render_cache_hits_total")
+            return entry[2]
+        metrics.inc("render_cache_misses_total")
+        if len(self.entries) >= INTERACTIVE_MAX_ENTRIES:
+            self.entries.clear()
+        text = render()
+        self.entries[key] = (version, now, text)
+        return text
     
-    return InlineKeyboardMarkup(keyboard)
+    def clear(self):
+        self.entries.clear()
+
+def throttled(action: Optional[str] = None):
+    """Drop repeated calls of a handler per user
+    
+    The action defaults to the button's callback data, or to the handler name plus the
+    command arguments - `/get 600` right after `/get 300` is a different request, not a repeat.
+    """
+    def decorator(func):
+        name = action or func.__name__
+        
+        @functools.wraps(func)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user = update.effective_user
+            if not user:
+                return await func(update, context)
+            query = update.callback_query
+            if query and not action:
+                key = label = query.data
+            else:
+                key, label = " ".join([name, *(getattr(context, "args", None) or [])]), name
+            if not user_throttle.acquire(user.id, key):
+                metrics.inc("throttled_total", action=label)
+                if query:
+                    await query.answer()  # Stop the button spinner, skip the work
+                return
+            try:
+                return await func(update, context)
+            finally:
+                user_throttle.release(user.id, key)
+        return wrapper
+    return decorator
+
+async def edit_view(query, text: str, reply_markup=None):
+    """Edit the button's message unless it already shows exactly this view"""
+    message = query.message
+    if message is not None and message.text == text.strip() and getattr(message, "reply_markup", None) == reply_markup:
+        metrics.inc("edits_skipped_total")
+        return
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+        metrics.inc("edits_skipped_total")
+
+# Global throttle and view cache
+user_throttle = UserThrottle()
+render_cache = RenderCache()
 
 # ==============================
-# ⏰ TIMER FUNCTIONS
+# 🛡️ ADMISSION CONTROL
 # ==============================
 
-async def start_user_timer(user_id: int, interval: int, app: Application):
-    """Start automatic IP delivery timer for user"""
-    try:
-        logger.info(f"Starting timer for user {user_id} with {interval}s interval")
+# Command / button (callback data up to ":") -> admission class, anything else is "control"
+ADMISSION_COMMANDS = {"get": "delivery", "stop_timer": "delivery", "status": "view", "help": "view"}
+ADMISSION_BUTTONS = {
+    "get_ip": "delivery", "stop_timer": "delivery",
+    "status": "view", "rcv": "view", "my_status": "view", "help": "view",
+}
+
+def classify_update(update: object) -> str:
+    """Admission class of an update (free text is a push only from a registered sender)"""
+    if not isinstance(update, Update):
+        return "control"
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return ADMISSION_BUTTONS.get(data.split(":", 1)[0], "control")
+    message = update.message
+    if message and message.text:
+        if message.text.startswith("/"):
+            command = (message.text[1:].split() or [""])[0].split("@", 1)[0].lower()
+            return ADMISSION_COMMANDS.get(command, "control")
+        # Only senders' free text is a push, anyone else's is as sheddable as a view
+        user = update.effective_user
+        return "push" if user and user.id in bot_data.senders else "view"
+    return "control"
+
+class AdmissionController:
+    """Queues updates per class and sheds low-value ones under overload
+    
+    Handler slots are handed out highest class priority first (a SendLimiter heap), so in a
+    burst sender pushes and deliveries overtake status views, which simply wait - deferred.
+    A full class queue sheds the update; after ADMISSION_SHED_AFTER seconds above
+    ADMISSION_OVERLOAD_BACKLOG queued updates, sheddable classes are shed on arrival.
+    """
+    
+    def __init__(self, concurrency: int = ADMISSION_CONCURRENCY, classes: Dict[str, dict] = ADMISSION_CLASSES):
+        self.classes = classes
+        self.capacity = concurrency + sum(spec["queue"] for spec in classes.values())
+        self.slots = SendLimiter(concurrency, wait_metric="admission_wait_seconds")
+        self.queued = {name: 0 for name in classes}
+        self.shed = {name: 0 for name in classes}
+        self.overloaded_since: Optional[float] = None
+    
+    def processor(self) -> BaseUpdateProcessor:
+        """python-telegram-bot update processor that admits every update through this controller"""
+        controller = self
         
-        while bot_data.active_timers.get(user_id, False):
-            await asyncio.sleep(interval)
-            
-            # Check if timer is still active and user is still receiver
-            if not bot_data.active_timers.get(user_id, False) or user_id not in bot_data.receivers:
-                break
-            
-            # Check if sending is active
-            if not bot_data.sending_active:
-                continue
+        class AdmissionProcessor(BaseUpdateProcessor):
+            async def do_process_update(self, update: object, coroutine):
+                await controller.admit(update, coroutine)
             
-            # Get next IP for user
-            ip = bot_data.get_next_ip_for_user(user_id)
+            async def initialize(self):
+                pass
             
-            if ip:
-                try:
-                    await app.bot.send_message(
-                        chat_id=user_id,
-                        text=ip
-                    )
-                    logger.info(f"Auto-delivered IP {ip} to user {user_id}")
-                except Exception as e:
-                    logger.error(f"Failed to auto-deliver IP to {user_id}: {e}")
-            else:
-                # No more IPs available
-                try:
-                    await app.bot.send_message(
-                        chat_id=user_id,
-                        text="⚠️ **Timer Active but No IPs Available**\n\nWaiting for more IPs to be added..."
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send no-IP message to {user_id}: {e}")
+            async def shutdown(self):
+                pass
         
-        # Timer stopped
-        logger.info(f"Timer stopped for user {user_id}")
+        # PTB's own semaphore only backstops the sum of our queues
+        return AdmissionProcessor(max_concurrent_updates=self.capacity)
+    
+    @property
+    def backlog(self) -> int:
+        return sum(self.queued.values())
+    
+    def overloaded(self) -> bool:
+        """Whether the backlog has stayed above ADMISSION_OVERLOAD_BACKLOG for ADMISSION_SHED_AFTER"""
+        if self.backlog < ADMISSION_OVERLOAD_BACKLOG:
+            self.overloaded_since = None
+            return False
+        now = time.monotonic()
+        if self.overloaded_since is None:
+            self.overloaded_since = now
+        return now - self.overloaded_since >= ADMISSION_SHED_AFTER
+    
+    async def admit(self, update: object, coroutine):
+        """Run an update's handlers once a slot is free, or shed it"""
+        update_class = classify_update(update)
+        spec = self.classes[update_class]
+        overloaded = self.overloaded()
+        if self.queued[update_class] >= spec["queue"] or (spec["shed"] and overloaded):
+            await self.drop(update, update_class, coroutine)
+            return
         
-    except asyncio.CancelledError:
-        logger.info(f"Timer cancelled for user {user_id}")
-        raise
-    except Exception as e:
-        logger.error(f"Timer error for user {user_id}: {e}")
+        self.queued[update_class] += 1
+        try:
+            await self.slots.acquire(spec["priority"])
+        except BaseException:
+            coroutine.close()
+            raise
+        finally:
+            self.queued[update_class] -= 1
+        try:
+            await coroutine
+        finally:
+            self.slots.release()
+    
+    async def drop(self, update: object, update_class: str, coroutine):
+        """Shed an update without running its handlers"""
+        coroutine.close()
+        self.shed[update_class] += 1
+        metrics.inc("updates_shed_total", update_class=update_class)
+        if not isinstance(update, Update):
+            return
+        try:
+            if update.callback_query:
+                await update.callback_query.answer("⏳ Busy right now, please try again in a moment")
+            elif update.message and not self.classes[update_class]["shed"]:
+                # Pushes and deliveries must not vanish silently
+                await update.message.reply_text("⏳ The bot is overloaded, please resend this in a moment.")
+        except TelegramError as e:
+            logger.debug("Could not notify about a shed update: %s", e)
 
-async def stop_user_timer(user_id: int):
-    """Stop timer for user"""
-    try:
-        # Mark timer as inactive - it will stop naturally
-        bot_data.set_timer_active(user_id, False)
-        
-        # Remove from active timers dict
-        if user_id in user_timers:
-            del user_timers[user_id]
-        
-        logger.info(f"Timer stopped for user {user_id}")
-    except Exception as e:
-        logger.error(f"Error stopping timer for user {user_id}: {e}")
+admission = AdmissionController()
+metrics.register_gauge("admission_backlog", lambda: admission.backlog)
 
 # ==============================
 # 🤖 COMMAND HANDLERS
 # ==============================
 
+@throttled()
+@timed("handler_latency_seconds", handler="start_command")
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     if not update.message:
@@ -341,6 +3282,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     user_name = update.effective_user.first_name if update.effective_user else "User"
+    bot_data.unblock_user(user_id)
     
     welcome_text = f"""
 🤖 **Welcome {user_name}!**
@@ -370,6 +3312,8 @@ Choose your role:
         reply_markup=get_main_menu_keyboard()
     )
 
+@throttled()
+@timed("handler_latency_seconds", handler="get_command")
 async def get_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /get command with interval"""
     if not update.message:
@@ -422,27 +3366,33 @@ async def get_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_id in user_timers:
         await stop_user_timer(user_id)
     
+    # The user is talking to the bot again, so its chat accepts messages
+    bot_data.unblock_user(user_id)
+    
     # Get first IP immediately
-    first_ip = bot_data.get_next_ip_for_user(user_id)
+    first_ip = bot_data.reserve_ip(user_id)
     
     if not first_ip:
         await update.message.reply_text("⚠️ No IPs available in queue!")
         return
     
     # Send first IP - clean format
-    await update.message.reply_text(first_ip)
+    await deliver_reserved(context.bot, update.effective_chat.id, user_id, first_ip, "get_command")
     
     # Save user interval and start timer
     bot_data.set_user_interval(user_id, interval)
     bot_data.set_timer_active(user_id, True)
     
-    # Start background timer
-    user_timers[user_id] = asyncio.create_task(
-        start_user_timer(user_id, interval, context.application)
-    )
+    # Start background timer (in sharded mode the owning worker picks it up on its next sync)
+    if SHARD_WORKERS == 0:
+        user_timers[user_id] = asyncio.create_task(
+            start_user_timer(user_id, interval, context.application)
+        )
     
-    logger.info(f"User {user_id} started timer with {interval}s interval")
+    logger.info("User %s started timer with %ss interval", user_id, interval)
 
+@throttled()
+@timed("handler_latency_seconds", handler="stop_timer_command")
 async def stop_timer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /stop_timer command"""
     if not update.message:
@@ -461,36 +3411,225 @@ async def stop_timer_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "Automatic IP delivery has been cancelled.\n"
         "Use `/get <interval>` to start a new timer."
     )
-    logger.info(f"User {user_id} stopped their timer")
+    logger.info("User %s stopped their timer", user_id)
 
+@throttled()
+@timed("handler_latency_seconds", handler="status_command")
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Quick status command"""
     if not update.message:
         return
     
-    total_distributed = sum(len(ips) for ips in bot_data.distributed_ips.values())
+    text = render_cache.get_or_render("quick_status", bot_data.version, render_quick_status)
+    await update.message.reply_text(text)
+
+def format_duration(seconds: float) -> str:
+    """Compact duration, e.g. 2d 3h, 4h 10m, 12m"""
+    minutes = int(seconds // 60)
+    days, hours, minutes = minutes // 1440, minutes // 60 % 24, minutes % 60
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{max(minutes, 1)}m" if seconds else "0m"
+
+def render_throughput() -> str:
+    """Delivery, push and failure rates plus the queue ETA, from the rolling counters"""
+    eta = bot_data.queue_eta()
+    if eta is None:
+        eta_text = "not draining"
+    elif eta == 0:
+        eta_text = "empty"
+    else:
+        eta_text = f"~{format_duration(eta)}"
+    return f"""📈 **Throughput:**
+• Delivered: {bot_data.event_rate('delivered', 5):.1f}/min (5m), {bot_data.event_rate('delivered', 60):.1f}/min (1h), {bot_data.event_total('delivered', 24)} (24h)
+• Pushed: {bot_data.event_rate('pushed', 5):.1f}/min (5m), {bot_data.event_rate('pushed', 60):.1f}/min (1h), {bot_data.event_total('pushed', 24)} (24h)
+• Failed: {bot_data.event_total('failed', 1)} (1h), flood waits: {bot_data.event_total('flood_waited', 1)} (1h)
+• Expired: {bot_data.event_total('expired', 1)} (1h), {bot_data.event_total('expired', 24)} (24h), {len(bot_data.ip_expiry)} IPs with a TTL
+• Queue empty in: {eta_text}"""
+
+def render_sla() -> str:
+    """Per-tier share of deliveries on time over the last hour"""
+    text = "⏱️ **Delivery SLA (1h):**"
+    for tier, (delivered, late, worst) in delivery_sla.summary().items():
+        on_time = f"{100 * (delivered - late) / delivered:.1f}% on time" if delivered else "no deliveries"
+        text += f"\n• {tier.title()} (≤{RECEIVER_TIERS[tier]['sla']}s): {on_time}, worst {worst:.1f}s"
+    return text
+
+def render_quick_status() -> str:
+    """Text of /status"""
+    total_distributed = bot_data.total_distributed()
     active_timers = sum(1 for active in bot_data.active_timers.values() if active)
     
-    text = f"""
+    return f"""
 📊 **Quick Status**
 
 👥 **Users:**
 • Senders: {len(bot_data.senders)}
 • Receivers: {len(bot_data.receivers)}
 • Active Timers: {active_timers}
+• Unreachable: {len(bot_data.blocked_users)}
 
 📦 **IPs:**
 • In Queue: {len(bot_data.ip_queue)}
 • Distributed: {total_distributed}
 
+{render_throughput()}
+
 🚚 **System:**
 • Sending: {'🟢 Active' if bot_data.sending_active else '🔴 Stopped'}
 
 Use /start for full menu and detailed controls.
     """
+
+def is_admin(user_id: int) -> bool:
+    """Check if user may use diagnostics commands (anyone can become a sender, so only ADMIN_IDS)"""
+    return user_id in ADMIN_IDS
+
+@timed("handler_latency_seconds", handler="metrics_command")
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin metrics summary"""
+    if not update.message:
+        return
     
-    await update.message.reply_text(text)
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Only admins can view metrics!")
+        return
+    
+    await update.message.reply_text(metrics.summary_text())
+
+@timed("handler_latency_seconds", handler="profile_command")
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin on-demand profiling session"""
+    if not update.message:
+        return
+    
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Only admins can start profiling!")
+        return
+    
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("❌ Invalid duration! Please use numbers only.")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    
+    chat_id = update.effective_chat.id
+    bot = context.bot
+    
+    async def report(path: str, summary: str):
+        await send_message(bot, chat_id, summary)
+    
+    if not profiling_session.start(seconds, on_done=report):
+        await update.message.reply_text("⏳ A profiling session is already running!")
+        return
+    
+    await update.message.reply_text(
+        f"🔬 **Profiling Started**\n\n"
+        f"CPU and allocations are recorded for {seconds} seconds.\n"
+        f"The bot keeps running - a summary will follow here."
+    )
+
+def format_audit_records(records: List[Tuple[float, int, str, str]]) -> str:
+    """Format audit records for chat"""
+    return "".join(
+        f"\n• {datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S} - `{ip}` → user {user_id} ({source})"
+        for ts, user_id, ip, source in records
+    )
+
+@timed("handler_latency_seconds", handler="who_got_command")
+async def who_got_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin lookup: who received an IP and when"""
+    if not update.message:
+        return
+    
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Only admins can search the audit log!")
+        return
+    
+    if not context.args:
+        await update.message.reply_text("📖 **Usage:** `/who_got <ip>`")
+        return
+    
+    start = time.perf_counter()
+    try:
+        records = audit_log.lookup(ip=context.args[0])
+    except (ValueError, OSError):
+        await update.message.reply_text("❌ Invalid IP address!")
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+    
+    if records:
+        text = f"🧾 **Deliveries of {context.args[0]}** (newest first){format_audit_records(records)}"
+    else:
+        text = f"🧾 No deliveries of {context.args[0]} in the audit log."
+    await update.message.reply_text(text + f"\n\n⏱️ {elapsed:.1f}ms")
+
+@timed("handler_latency_seconds", handler="history_command")
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin lookup: IPs delivered to a user"""
+    if not update.message:
+        return
+    
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Only admins can search the audit log!")
+        return
+    
+    try:
+        user_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("📖 **Usage:** `/history <user_id>`")
+        return
+    
+    start = time.perf_counter()
+    records = audit_log.lookup(user_id=user_id)
+    elapsed = (time.perf_counter() - start) * 1000
+    
+    if records:
+        text = f"🧾 **Deliveries to user {user_id}** (newest first){format_audit_records(records)}"
+    else:
+        text = f"🧾 No deliveries to user {user_id} in the audit log."
+    await update.message.reply_text(text + f"\n\n⏱️ {elapsed:.1f}ms")
+
+@throttled()
+@timed("handler_latency_seconds", handler="tier_command")
+async def tier_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sender command: show or set a receiver's delivery tier"""
+    if not update.message:
+        return
+    
+    if update.effective_user.id not in bot_data.senders:
+        await update.message.reply_text("❌ Only senders can manage receiver tiers!")
+        return
+    
+    tiers = ", ".join(f"`{tier}`" for tier in RECEIVER_TIERS)
+    try:
+        user_id = int(context.args[0])
+        tier = context.args[1].lower() if len(context.args) > 1 else None
+    except (IndexError, ValueError):
+        await update.message.reply_text(f"📖 **Usage:** `/tier <user_id> [tier]`\n\nTiers: {tiers}")
+        return
+    
+    if user_id not in bot_data.receivers:
+        await update.message.reply_text(f"❌ User {user_id} is not a receiver!")
+        return
+    
+    if tier is None:
+        await update.message.reply_text(f"🏷️ User {user_id} is in the **{bot_data.tier_of(user_id)}** tier.")
+        return
+    
+    if tier not in RECEIVER_TIERS:
+        await update.message.reply_text(f"❌ Unknown tier `{tier}`. Tiers: {tiers}")
+        return
+    
+    bot_data.set_tier(user_id, tier)
+    sla = RECEIVER_TIERS[tier]["sla"]
+    await update.message.reply_text(f"✅ User {user_id} moved to the **{tier}** tier (SLA {sla}s).")
 
+@throttled()
+@timed("handler_latency_seconds", handler="help_command")
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Help command"""
     if not update.message:
@@ -504,6 +3643,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • `/get <seconds>` - Start automatic IP delivery
 • `/stop_timer` - Stop automatic delivery
 • `/status` - Quick system status
+• `/tier <user_id> [tier]` - Show or set a receiver's tier (senders)
 • `/help` - This help message
 
 **How to Use:**
@@ -543,6 +3683,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 🎛️ BUTTON HANDLERS
 # ==============================
 
+@throttled()
+@timed("handler_latency_seconds", handler="button_handler")
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
@@ -562,6 +3704,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await handle_become_receiver(query)
         elif data == "status":
             await show_status(query)
+        elif data.startswith("rcv:"):
+            await show_status(query, data)
         elif data == "help":
             await show_help(query)
         elif data == "push_ips":
@@ -580,7 +3724,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await handle_stop_timer(query)
     
     except Exception as e:
-        logger.error(f"Error in button handler: {e}")
+        logger.error("Error in button handler: %s", e)
         await query.edit_message_text("❌ An error occurred. Please try again.")
 
 async def show_main_menu(query):
@@ -608,7 +3752,7 @@ async def show_main_menu(query):
 Choose an option below:
     """
     
-    await query.edit_message_text(text, reply_markup=get_main_menu_keyboard())
+    await edit_view(query, text, reply_markup=get_main_menu_keyboard())
 
 async def handle_become_sender(query):
     """Handle become sender"""
@@ -665,50 +3809,90 @@ Use the menu below:
     else:
         await query.edit_message_text("ℹ️ You are already a receiver!", reply_markup=get_receiver_menu_keyboard(user_id))
 
-async def show_status(query):
-    """Show system status"""
-    total_distributed = sum(len(ips) for ips in bot_data.distributed_ips.values())
+async def show_status(query, page: str = "rcv:count"):
+    """Show system status with one page of the receiver listing"""
+    order, after, before = parse_receiver_cursor(page)
+    start, entries = bot_data.receiver_page(order, after, before)
+    text = render_cache.get_or_render("status", bot_data.version, render_status)
+    text += render_cache.get_or_render(page, bot_data.version, lambda: render_receiver_page(order, start, entries))
+    
+    # Add back button based on user role
+    user_id = query.from_user.id
+    if user_id in bot_data.senders:
+        keyboard = get_sender_menu_keyboard()
+    elif user_id in bot_data.receivers:
+        keyboard = get_receiver_menu_keyboard(user_id)
+    else:
+        keyboard = get_main_menu_keyboard()
+    
+    rows = get_receiver_page_buttons(order, start, entries) + [list(row) for row in keyboard.inline_keyboard]
+    await edit_view(query, text, reply_markup=InlineKeyboardMarkup(rows))
+
+def parse_receiver_cursor(page: str) -> Tuple[str, Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """Callback data "rcv:<order>[:n|p:<key>:<user_id>]" -> (order, after, before)"""
+    parts = page.split(":")
+    order = parts[1] if len(parts) > 1 and parts[1] in ReceiverIndex.ORDERS else "count"
+    if len(parts) == 5:
+        cursor = (int(parts[3]), int(parts[4]))
+        return (order, cursor, None) if parts[2] == "n" else (order, None, cursor)
+    return order, None, None
+
+def get_receiver_page_buttons(order: str, start: int, entries: List[Tuple[int, int]]) -> List[List[InlineKeyboardButton]]:
+    """Prev/next and sort buttons for a receiver page"""
+    navigation = []
+    if start > 0:
+        navigation.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"rcv:{order}:p:{entries[0][0]}:{entries[0][1]}"))
+    if entries and start + len(entries) < len(bot_data.receiver_index.keys):
+        navigation.append(InlineKeyboardButton("Next ➡️", callback_data=f"rcv:{order}:n:{entries[-1][0]}:{entries[-1][1]}"))
+    sorting = [
+        InlineKeyboardButton("🔝 Top Consumers", callback_data="rcv:count"),
+        InlineKeyboardButton("🕒 Recent", callback_data="rcv:recent"),
+    ]
+    return [navigation, sorting] if navigation else [sorting]
+
+def render_receiver_page(order: str, start: int, entries: List[Tuple[int, int]]) -> str:
+    """Receiver listing for one page of the index"""
+    total = len(bot_data.receiver_index.keys)
+    if not total:
+        return "\nNo receivers registered yet."
+    
+    title = "by IPs received" if order == "count" else "by last delivery"
+    text = f"\n**Receivers {title}** ({start + 1}-{start + len(entries)} of {total}):"
+    for position, (_, receiver_id) in enumerate(entries, start + 1):
+        count, last_ms = bot_data.receiver_index.keys[receiver_id]
+        timer_status = "⏰" if bot_data.active_timers.get(receiver_id, False) else "⏹️"
+        last = datetime.fromtimestamp(last_ms / 1000).strftime("%m-%d %H:%M") if last_ms else "never"
+        tier = f" [{bot_data.receiver_tiers[receiver_id]}]" if receiver_id in bot_data.receiver_tiers else ""
+        text += f"\n{position}. User {receiver_id}{tier}: {count} IPs, last {last} {timer_status}"
+    return text
+
+def render_status() -> str:
+    """Text of the detailed status view"""
+    total_distributed = bot_data.total_distributed()
     active_timers = sum(1 for active in bot_data.active_timers.values() if active)
     
-    text = f"""
+    return f"""
 📊 **Detailed System Status**
 
 **Users:**
 👥 Senders: {len(bot_data.senders)}
 👥 Receivers: {len(bot_data.receivers)}
 ⏰ Active Timers: {active_timers}
+🚫 Unreachable: {len(bot_data.blocked_users)}
 
 **IPs:**
 📦 In Queue: {len(bot_data.ip_queue)}
 📤 Total Distributed: {total_distributed}
 
+{render_throughput()}
+
+{render_sla()}
+
 **System:**
 🚚 Sending Status: {'🟢 Active' if bot_data.sending_active else '🔴 Stopped'}
-
-**Distribution per Receiver:**
-    """
-    
-    if bot_data.receivers:
-        for receiver_id in list(bot_data.receivers)[:10]:  # Show max 10 receivers
-            count = len(bot_data.distributed_ips.get(receiver_id, []))
-            timer_status = "⏰" if bot_data.active_timers.get(receiver_id, False) else "⏹️"
-            text += f"\n• User {receiver_id}: {count} IPs {timer_status}"
-        
-        if len(bot_data.receivers) > 10:
-            text += f"\n... and {len(bot_data.receivers) - 10} more receivers"
-    else:
-        text += "\nNo receivers registered yet."
-    
-    # Add back button based on user role
-    user_id = query.from_user.id
-    if user_id in bot_data.senders:
-        keyboard = get_sender_menu_keyboard()
-    elif user_id in bot_data.receivers:
-        keyboard = get_receiver_menu_keyboard(user_id)
-    else:
-        keyboard = get_main_menu_keyboard()
-    
-    await query.edit_message_text(text, reply_markup=keyboard)
+🛡️ Shed Updates: {sum(admission.shed.values())} (backlog {admission.backlog})
+📨 Delivery Bots: {len(delivery_bots.bots)} of {len(delivery_bots.tokens)} connected
+"""
 
 async def show_help(query):
     """Show help information"""
@@ -749,7 +3933,7 @@ async def show_help(query):
 /help - This help message
     """
     
-    await query.edit_message_text(text, reply_markup=get_main_menu_keyboard())
+    await edit_view(query, text, reply_markup=get_main_menu_keyboard())
 
 async def handle_push_request(query):
     """Handle push IP request"""
@@ -777,6 +3961,7 @@ Send me a message with IPs (one per line):
 • One IP per line
 • IPv4 format only
 • No spaces or extra characters
+• Add a line like `ttl 2h` (s/m/h/d) to expire these IPs if undelivered
 • I'll validate and add them automatically
 
 Just type your IPs and send the message!
@@ -856,7 +4041,7 @@ async def handle_clear_queue(query):
         return
     
     cleared_count = len(bot_data.ip_queue)
-    distributed_count = sum(len(ips) for ips in bot_data.distributed_ips.values())
+    distributed_count = bot_data.total_distributed()
     
     bot_data.clear_queue()
     
@@ -897,16 +4082,16 @@ async def handle_get_ip(query):
         return
     
     # Get next IP for this user
-    ip = bot_data.get_next_ip_for_user(user_id)
+    ip = bot_data.reserve_ip(user_id)
     
     if ip:
         # Send clean IP
-        await query.message.reply_text(ip)
+        await deliver_reserved(query.get_bot(), query.message.chat_id, user_id, ip, "get_ip")
         
         text = f"""
 ✅ **IP Delivered Successfully**
 
-📊 Your total IPs: {len(bot_data.distributed_ips.get(user_id, []))}
+📊 Your total IPs: {bot_data.delivery_count(user_id)}
 � Remraining in queue: {len(bot_data.ip_queue)}
 
 � Use `/get 300` for automatic delivery every 5 minutes!
@@ -938,6 +4123,11 @@ async def show_my_status(query):
         await query.edit_message_text("❌ Only receivers can view this!", reply_markup=get_main_menu_keyboard())
         return
     
+    text = render_cache.get_or_render(("my_status", user_id), bot_data.version, lambda: render_my_status(user_id))
+    await edit_view(query, text, reply_markup=get_receiver_menu_keyboard(user_id))
+
+def render_my_status(user_id: int) -> str:
+    """Text of a receiver's personal status view"""
     my_ips = bot_data.distributed_ips.get(user_id, [])
     timer_active = bot_data.active_timers.get(user_id, False)
     interval = bot_data.user_intervals.get(user_id, 0)
@@ -952,8 +4142,13 @@ async def show_my_status(query):
 
 **Timer Status:**
 ⏰ Timer: {'🟢 Active' if timer_active else '🔴 Stopped'}
+🏷️ Tier: {bot_data.tier_of(user_id)}
     """
     
+    delivery_bot = delivery_bots.bot_for(user_id, None)
+    if delivery_bot:
+        text += f"📨 Your IPs come from @{delivery_bot.username} - open it and press Start once\n"
+    
     if timer_active and interval > 0:
         text += f"📅 Interval: {interval} seconds ({interval//60} minutes)"
     
@@ -971,8 +4166,7 @@ async def show_my_status(query):
         text += "\nNo IPs received yet."
     
     text += f"\n\n**Commands:**\n• `/get 300` - Start 5min timer\n• `/stop_timer` - Stop timer"
-    
-    await query.edit_message_text(text, reply_markup=get_receiver_menu_keyboard(user_id))
+    return text
 
 async def handle_stop_timer(query):
     """Handle stop timer button"""
@@ -998,6 +4192,15 @@ async def handle_stop_timer(query):
 # 📝 MESSAGE HANDLER
 # ==============================
 
+TTL_LINE = re.compile(r"^ttl\s*[:=]?\s*(\d+)\s*([smhd]?)$", re.IGNORECASE)
+TTL_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_ttl(line: str) -> int:
+    """Seconds from a push's "ttl 30m" line (0 = never expire)"""
+    value, unit = TTL_LINE.match(line.strip()).groups()
+    return int(value) * TTL_UNITS[unit.lower()]
+
+@timed("handler_latency_seconds", handler="message_handler")
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages (for IP pushing)"""
     if not update.message or not update.message.text:
@@ -1021,9 +4224,13 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     new_ips = []
     invalid_lines = []
+    ttl = None
     
     for line_num, line in enumerate(lines, 1):
         ip = line.strip()
+        if ttl is None and TTL_LINE.match(ip):
+            ttl = parse_ttl(ip)
+            continue
         # Basic IP validation
         if ip and '.' in ip and len(ip.split('.')) == 4:
             try:
@@ -1038,10 +4245,12 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             invalid_lines.append(f"Line {line_num}: {ip}")
     
     if new_ips:
-        bot_data.add_ips(new_ips)
+        bot_data.add_ips(new_ips, ttl)
         
+        ttl = DEFAULT_IP_TTL if ttl is None else ttl
         response = f"✅ **Successfully Added {len(new_ips)} IPs!**\n\n"
         response += f"📦 Total in queue: {len(bot_data.ip_queue)}\n"
+        response += f"⏳ Expires in: {format_duration(ttl) if ttl else 'never'}\n"
         response += f"👥 Active receivers: {len(bot_data.receivers)}\n"
         response += f"🚚 System status: {'🟢 Active' if bot_data.sending_active else '🔴 Stopped'}"
         
@@ -1057,7 +4266,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_sender_menu_keyboard()
         )
         
-        logger.info(f"Sender {user_id} added {len(new_ips)} IPs ({len(invalid_lines)} invalid)")
+        logger.info("Sender %s added %s IPs (%s invalid)", user_id, len(new_ips), len(invalid_lines))
     else:
         await update.message.reply_text(
             "⚠️ **No Valid IPs Found**\n\n"
@@ -1086,9 +4295,10 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     # Try to notify user about error
     if isinstance(update, Update) and update.effective_chat:
         try:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="❌ **An error occurred**\n\nPlease try again or use /start to return to main menu."
+            await send_message(
+                context.bot,
+                update.effective_chat.id,
+                "❌ **An error occurred**\n\nPlease try again or use /start to return to main menu."
             )
         except Exception:
             pass  # Don't fail on error notification failure
@@ -1097,22 +4307,81 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 # 🚀 MAIN FUNCTION
 # ==============================
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals"""
-    print(f"\n🛑 Received signal {signum}, shutting down gracefully...")
+class ShutdownCoordinator:
+    """Drain-and-flush shutdown
     
-    # Just mark timers as inactive, let them stop naturally
-    try:
-        for user_id in list(user_timers.keys()):
-            bot_data.set_timer_active(user_id, False)
-        logger.info("Marked all timers for shutdown")
-    except Exception as e:
-        logger.error(f"Error in signal handler: {e}")
+    Intake stops first (run_polling stops the updater before post_stop). Idle timers
+    are cancelled together, timers with a send in flight get SHUTDOWN_DRAIN_TIMEOUT
+    to commit it, and state is written once at the end instead of once per receiver.
+    """
+    
+    def __init__(self, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.drained = False
+        self.sending: Set[int] = set()  # Timer users with a send in flight
     
-    sys.exit(0)
+    async def drain_timers(self) -> int:
+        """Stop every timer, letting in-flight sends finish up to the deadline"""
+        self.draining = True
+        timers = dict(user_timers)
+        # Sends still queued for a connection slot haven't reached Telegram, requeue them too
+        queued = send_limiter.waiters
+        busy = {task for user_id, task in timers.items() if user_id in self.sending and task not in queued}
+        for task in timers.values():
+            if task not in busy:
+                task.cancel()
+        if busy:
+            _, pending = await asyncio.wait(busy, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()  # Their reserved IPs are rolled back to the queue
+            if pending:
+                logger.warning("Cancelled %s sends still in flight after %ss", len(pending), self.drain_timeout)
+        await asyncio.gather(*timers.values(), return_exceptions=True)
+        # Shard workers drain their own timers, committing through our state service
+        if shard_processes:
+            await stop_shard_workers()
+        return len(timers)
+    
+    async def drain(self):
+        """Drain timers and sends, then persist state in one write"""
+        if self.draining:
+            return
+        start = time.perf_counter()
+        watchdog.ready = False
+        # Commits of the drained sends and the timer flags land in a single write
+        with bot_data.deferred_save():
+            stopped = await self.drain_timers()
+            for user_id in user_timers:
+                bot_data.set_timer_active(user_id, False)
+            bot_data.save_data()
+        user_timers.clear()
+        delivery_log.flush(force=True)
+        audit_log.flush()
+        self.drained = True
+        logger.info("Shutdown drained %s timers in %.2fs", stopped, time.perf_counter() - start)
+
+# Global shutdown coordinator
+shutdown = ShutdownCoordinator()
+
+def signal_handler(signum, frame):
+    """Handle shutdown signals before polling starts (run_polling installs its own)"""
+    print(f"\n🛑 Received signal {signum}, shutting down gracefully...")
+    # Nothing is in flight yet, unwind like Ctrl+C instead of exiting mid-statement
+    raise KeyboardInterrupt
+
+def load_state():
+    """Load bot_data from the state file (state-loader thread, see main)"""
+    with startup_profile.phase("state load (background)"):
+        bot_data.load_data()
 
-def main():
-    """Main function to start the bot"""
+def main(profile_startup: bool = False):
+    """Main function to start the bot
+    
+    Startup: logging is configured at import, the state file loads on a background
+    thread while the telegram stack is imported and the application connects, and
+    post_init holds update processing until the state is in.
+    """
     
     # Setup signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
@@ -1125,13 +4394,79 @@ def main():
         return
     
     print("🤖 Starting AutoDrop Bot...")
-    print(f"📊 Loaded: {len(bot_data.senders)} senders, {len(bot_data.receivers)} receivers")
-    print(f"📦 Queue: {len(bot_data.ip_queue)} IPs")
-    print(f"🚚 System: {'Active' if bot_data.sending_active else 'Stopped'}")
+    if not ADMIN_IDS:
+        logger.warning("ADMIN_IDS is empty: /metrics, /profile, /who_got and /history are disabled")
+    state_loader = threading.Thread(target=load_state, name="state-loader", daemon=True)
+    state_loader.start()
+    with startup_profile.phase("telegram import"):
+        import_telegram()
+    print(f"🔁 Event loop: {install_event_loop()}")
+    
+    # Background services live alongside the polling loop
+    state_service = StateService()
+    metrics_server = MetricsServer()
+    background_tasks: List[asyncio.Task] = []
+    
+    async def post_init(application: Application):
+        startup_profile.record("connect", connect_started)
+        # Updates are only fetched after post_init, so handlers never see a half-loaded state
+        with startup_profile.phase("wait for state"):
+            await asyncio.to_thread(state_loader.join)
+        print(f"📊 Loaded: {len(bot_data.senders)} senders, {len(bot_data.receivers)} receivers")
+        print(f"📦 Queue: {len(bot_data.ip_queue)} IPs")
+        print(f"🚚 System: {'Active' if bot_data.sending_active else 'Stopped'}")
+        
+        services_started = time.perf_counter()
+        # The primary's own sends (Get IP Now, notices, errors) count against the tokens' limits too
+        await delivery_bots.start(share=SHARD_WORKERS + 1)
+        audit_log.open()
+        background_tasks.append(asyncio.create_task(watchdog.run()))
+        background_tasks.append(asyncio.create_task(delivery_log.run()))
+        background_tasks.append(asyncio.create_task(audit_log.run()))
+        background_tasks.append(asyncio.create_task(purge_expired_ips()))
+        # SIGUSR1 starts a default-length profiling session (report on disk only)
+        if hasattr(signal, "SIGUSR1"):
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR1, profiling_session.start, PROFILE_DEFAULT_SECONDS
+            )
+        if METRICS_PORT:
+            await metrics_server.start()
+        if SHARD_WORKERS > 0:
+            await state_service.start()
+            start_shard_workers()
+        startup_profile.record("start services", services_started)
+        watchdog.ready = True
+        logger.info("Startup finished in %.2fs", time.perf_counter() - startup_profile.started)
+        if profile_startup:
+            print(f"⏱️ Startup profile:\n{startup_profile.report()}")
+    
+    async def post_stop(application: Application):
+        await shutdown.drain()
+    
+    async def post_shutdown(application: Application):
+        # post_stop is skipped when a stop signal arrives during startup
+        await shutdown.drain()
+        for task in background_tasks:
+            task.cancel()
+        await metrics_server.stop()
+        await delivery_bots.stop()
+        if SHARD_WORKERS > 0:
+            await state_service.stop()
+        audit_log.close()
     
     # Create application
+    build_started = time.perf_counter()
     try:
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
+        builder = (
+            build_application()
+            .concurrent_updates(admission.processor())
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+        )
+        if SHARD_WORKERS > 0:
+            print(f"🧩 Sharded mode: {SHARD_WORKERS} worker processes")
+        app = builder.build()
     except Exception as e:
         print(f"❌ Error creating bot application: {e}")
         return
@@ -1142,6 +4477,11 @@ def main():
     app.add_handler(CommandHandler("stop_timer", stop_timer_command))
     app.add_handler(CommandHandler("status", status_command))
     app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("metrics", metrics_command))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("who_got", who_got_command))
+    app.add_handler(CommandHandler("history", history_command))
+    app.add_handler(CommandHandler("tier", tier_command))
     
     # Add button and message handlers
     app.add_handler(CallbackQueryHandler(button_handler))
@@ -1149,8 +4489,10 @@ def main():
     
     # Add error handler
     app.add_error_handler(error_handler)
+    startup_profile.record("build application", build_started)
     
     # Start the bot
+    connect_started = time.perf_counter()  # run_polling: initialize (getMe) then post_init
     try:
         print("🚀 Bot is running... Press Ctrl+C to stop")
         logger.info("AutoDrop Bot started successfully")
@@ -1163,7 +4505,7 @@ def main():
         logger.info("Bot stopped by user")
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
-        logger.error(f"Unexpected bot error: {e}")
+        logger.error("Unexpected bot error: %s", e)
     
     # Cleanup after bot stops (while event loop is still active)
     print("🧹 Cleaning up...")
@@ -1171,21 +4513,357 @@ def main():
     print("✅ Cleanup completed")
 
 def cleanup_timers():
-    """Clean up all active timers"""
+    """Mark leftover timers inactive if the app stopped without draining (single write)"""
+    if shutdown.drained:
+        return
     try:
-        # Mark all timers as inactive in data
-        for user_id in list(user_timers.keys()):
-            bot_data.set_timer_active(user_id, False)
-        
-        # Clear the timers dict (don't cancel as they'll stop naturally)
+        with bot_data.deferred_save():
+            for user_id in list(user_timers.keys()):
+                bot_data.set_timer_active(user_id, False)
         user_timers.clear()
         logger.info("All timers cleaned up successfully")
     except Exception as e:
-        logger.error(f"Error during timer cleanup: {e}")
+        logger.error("Error during timer cleanup: %s", e)
+
+# ==============================
+# 📦 EXPORT / IMPORT
+# ==============================
+
+# Record types, in the order they are written:
+#   {"type": "meta", "format": 1, "sending_active": ...}
+#   {"type": "sender", "user_id": ...}
+#   {"type": "receiver", "user_id": ..., "last_delivery": ..., "tier": ...}   (unix time and tier optional)
+#   {"type": "timer", "user_id": ..., "interval": ..., "active": ...}
+#   {"type": "blocked", "user_id": ...}
+#   {"type": "queue", "ip": ..., "expires_at": ...}   (unix time, optional)
+#   {"type": "delivery", "user_id": ..., "ip": ...}   (per-user history, oldest first)
+NDJSON_FORMAT_VERSION = 1
+
+def open_ndjson(path: str, mode: str, compress: Optional[bool] = None):
+    """Open an NDJSON stream, gzip when asked or when the path ends in .gz"""
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return gzip.open(path, mode + "t", encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def iter_state_records(data: BotData) -> Iterator[dict]:
+    """Stream BotData as NDJSON records, one user's history at a time"""
+    yield {
+        "type": "meta",
+        "format": NDJSON_FORMAT_VERSION,
+        "bot_version": __version__,
+        "exported_at": datetime.now().isoformat(),
+        "sending_active": data.sending_active,
+    }
+    for user_id in data.senders:
+        yield {"type": "sender", "user_id": user_id}
+    for user_id in data.receivers:
+        record = {"type": "receiver", "user_id": user_id}
+        if user_id in data.last_delivery:
+            record["last_delivery"] = data.last_delivery[user_id]
+        if user_id in data.receiver_tiers:
+            record["tier"] = data.receiver_tiers[user_id]
+        yield record
+    for user_id in set(data.user_intervals) | set(data.active_timers):
+        yield {
+            "type": "timer",
+            "user_id": user_id,
+            "interval": data.user_intervals.get(user_id),
+            "active": data.active_timers.get(user_id, False),
+        }
+    for user_id in data.blocked_users:
+        yield {"type": "blocked", "user_id": user_id}
+    for ip in data.queued_ips():
+        if ip in data.ip_expiry:
+            yield {"type": "queue", "ip": ip, "expires_at": data.ip_expiry[ip]}
+        else:
+            yield {"type": "queue", "ip": ip}
+    for user_id in data.distributed_ips:
+        for ip in data.iter_delivered(user_id):
+            yield {"type": "delivery", "user_id": user_id, "ip": ip}
+
+def export_state(args):
+    """Stream state out as NDJSON
+    
+    A snapshot state file streams history straight from its mmap. A JSON state file has
+    to be parsed whole first - convert it with convert-snapshot to export in flat memory.
+    """
+    data = BotData(args.data_file)
+    counts: Dict[str, int] = {}
+    with open_ndjson(args.output, "w", args.gzip or None) as f:
+        for record in iter_state_records(data):
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            counts[record["type"]] = counts.get(record["type"], 0) + 1
+    print(f"✅ Exported {args.data_file} -> {args.output}")
+    for record_type, count in counts.items():
+        print(f"   {record_type}: {count}")
+
+def apply_import_batch(data: BotData, batch: List[dict], spill: Optional[HistorySpill] = None):
+    """Apply one bounded batch of records to BotData, delivery history to spill when given"""
+    queue_ips = []
+    expiry: Dict[str, float] = {}
+    deliveries: Dict[int, List[str]] = {}
+    for record in batch:
+        record_type = record.get("type")
+        if record_type == "sender":
+            data.add_sender(int(record["user_id"]))
+        elif record_type == "receiver":
+            if record.get("last_delivery") is not None:
+                data.last_delivery[int(record["user_id"])] = float(record["last_delivery"])
+            if record.get("tier") in RECEIVER_TIERS:
+                data.receiver_tiers[int(record["user_id"])] = record["tier"]
+            data.add_receiver(int(record["user_id"]))
+        elif record_type == "timer":
+            user_id = int(record["user_id"])
+            if record.get("interval") is not None:
+                data.set_user_interval(user_id, int(record["interval"]))
+            data.set_timer_active(user_id, bool(record.get("active")))
+        elif record_type == "blocked":
+            data.block_user(int(record["user_id"]))
+        elif record_type == "queue":
+            queue_ips.append(record["ip"])
+            if record.get("expires_at") is not None:
+                expiry[record["ip"]] = float(record["expires_at"])
+        elif record_type == "delivery":
+            deliveries.setdefault(int(record["user_id"]), []).append(record["ip"])
+        elif record_type == "meta":
+            if record.get("format", NDJSON_FORMAT_VERSION) > NDJSON_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format {record['format']}")
+            data.sending_active = bool(record.get("sending_active", False))
+    if queue_ips:
+        data.add_ips(queue_ips, ttl=0)  # Imported expiries are absolute
+        for ip, expires_at in expiry.items():
+            data.set_expiry(ip, expires_at)
+    for user_id, ips in deliveries.items():
+        if spill:
+            spill.append(user_id, ips)
+        else:
+            data.record_deliveries(user_id, ips)
+
+def import_state(args):
+    """Stream NDJSON records into the state file in bounded batches with a single save
+    
+    Into a snapshot, delivery history is spilled to a temp file and copied into the
+    snapshot user by user, so memory stays at the size of the users and queue however
+    large the history is. The JSON format has to hold the whole state to write it.
+    """
+    data = BotData(args.data_file, args.format)
+    spill = HistorySpill(os.path.dirname(os.path.abspath(args.data_file))) if args.format == "snapshot" else None
+    imported = 0
+    try:
+        with open_ndjson(args.input, "r", args.gzip or None) as f, data.deferred_save(flush=spill is None):
+            if args.replace:
+                data.clear_all()
+            batch: List[dict] = []
+            for line in f:
+                if not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= args.batch_size:
+                    apply_import_batch(data, batch, spill)
+                    imported += len(batch)
+                    batch = []
+            apply_import_batch(data, batch, spill)
+            imported += len(batch)
+        delivered = data.total_distributed()
+        if spill:
+            write_snapshot(args.data_file, data, spill)
+            delivered += spill.total
+    finally:
+        if spill:
+            spill.close()
+    print(f"✅ Imported {imported} records from {args.input} into {args.data_file}")
+    print(f"   {len(data.receivers)} receivers, {len(data.ip_queue)} queued IPs, {delivered} delivered")
+
+# ==============================
+# ⌨️ COMMAND LINE
+# ==============================
+
+def convert_state_file(args):
+    """One-shot conversion between the JSON state file and a binary snapshot"""
+    if not os.path.exists(args.input):
+        print(f"❌ Error: {args.input} not found")
+        return
+    
+    start = time.perf_counter()
+    data = BotData(data_file=args.input)
+    loaded = time.perf_counter()
+    data.data_file = args.output
+    data.data_format = "json" if args.to_json else "snapshot"
+    data.save_data()
+    
+    print(f"✅ Converted {args.input} -> {args.output} ({data.data_format})")
+    print(f"   {len(data.receivers)} receivers, {len(data.ip_queue)} queued IPs, {data.total_distributed()} delivered")
+    print(f"   Load {loaded - start:.2f}s, write {time.perf_counter() - loaded:.2f}s")
+    if not args.to_json:
+        print(f"   Set DATA_FORMAT = \"snapshot\" to start from {args.output}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="AutoDrop Telegram Bot")
+    parser.add_argument("--startup-profile", action="store_true", help="Print time spent per startup phase")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    run = subparsers.add_parser("run", help="Run the bot (default)")
+    run.add_argument("--startup-profile", action="store_true", default=argparse.SUPPRESS,
+                     help="Print time spent per startup phase")
+    
+    bench = subparsers.add_parser("bench", help="Run the offline benchmark suite against a fake Bot")
+    bench.add_argument("--ips", type=int, default=10000, help="IPs in the synthetic queue")
+    bench.add_argument("--receivers", type=int, default=1000, help="Registered receivers")
+    bench.add_argument("--history", type=int, default=10, help="Previously delivered IPs per receiver")
+    bench.add_argument("--ops", type=int, default=1000, help="Operations per scenario")
+    bench.add_argument("--push-size", type=int, default=100, help="IPs per sender push")
+    bench.add_argument("--scenarios", help="Comma-separated subset of the scenarios (default: all)")
+    bench.add_argument("--persist", action="store_true", help="Include save_data() writes to a temp file")
+    bench.add_argument("--seed", type=int, default=1)
+    bench.add_argument("--log-level", default="WARNING")
+    bench.add_argument("--output", default="bench_results.json", help="JSON results file")
+    bench.add_argument("--baseline", help="Earlier results file to compare against")
+    
+    simulate = subparsers.add_parser("simulate", help="Fast-forward timer traffic on a virtual clock")
+    simulate.add_argument("--receivers", type=int, default=1000, help="Receivers with active timers")
+    simulate.add_argument("--hours", type=float, default=1.0, help="Virtual time to simulate")
+    simulate.add_argument(
+        "--interval-range", type=lambda value: tuple(int(part) for part in value.split(",")),
+        default=(MIN_INTERVAL, 600), help="Min,max timer interval in seconds (e.g. 30,600)"
+    )
+    simulate.add_argument("--ips", type=int, default=0, help="Queue size (default: enough for every tick)")
+    simulate.add_argument("--send-latency", type=float, default=0.05, help="Simulated Bot API latency")
+    simulate.add_argument("--rate-limit", type=float, default=30.0, help="Global sends per second (0 = unlimited)")
+    simulate.add_argument("--seed", type=int, default=1)
+    simulate.add_argument("--log-level", default="WARNING")
+    simulate.add_argument("--output", default="simulation_results.json", help="JSON results file")
+    
+    bench_http = subparsers.add_parser("bench-http", help="Benchmark send throughput against a local fake Bot API")
+    bench_http.add_argument(
+        "--pool-sizes", type=lambda value: [int(part) for part in value.split(",")],
+        default=[1, 4, 8, 16, HTTP_POOL_SIZE], help="Comma-separated connection pool sizes"
+    )
+    bench_http.add_argument("--sends", type=int, default=2000, help="Deliveries per pool size")
+    bench_http.add_argument("--receivers", type=int, default=100, help="Distinct chat IDs")
+    bench_http.add_argument("--latency", type=float, default=0.05, help="Fake Bot API response delay")
+    bench_http.add_argument("--log-level", default="WARNING")
+    bench_http.add_argument("--output", default="http_bench_results.json", help="JSON results file")
+    bench_http.add_argument("--baseline", help="Earlier results file to compare against")
+    
+    bench_bots = subparsers.add_parser("bench-bots", help="Benchmark rate-limited delivery with extra delivery bots")
+    bench_bots.add_argument(
+        "--bots", type=lambda value: [int(part) for part in value.split(",")],
+        default=[0, 1, 2, 4], help="Comma-separated delivery bot counts"
+    )
+    bench_bots.add_argument("--sends", type=int, default=300, help="Deliveries per bot count")
+    bench_bots.add_argument("--receivers", type=int, default=100, help="Distinct chat IDs")
+    bench_bots.add_argument("--latency", type=float, default=0.02, help="Fake Bot API response delay")
+    bench_bots.add_argument("--rate-limit", type=float, default=30.0, help="Fake Bot API sends per second per token")
+    bench_bots.add_argument("--budget", type=float, default=DELIVERY_BOT_RATE, help="Sends per second per bot (0 = unpaced)")
+    bench_bots.add_argument("--forbidden-percent", type=int, default=0, help="Receivers that never started each delivery bot")
+    bench_bots.add_argument("--log-level", default="WARNING")
+    bench_bots.add_argument("--output", default="bots_bench_results.json", help="JSON results file")
+    bench_bots.add_argument("--baseline", help="Earlier results file to compare against")
+    
+    bench_shards = subparsers.add_parser("bench-shards", help="Benchmark delivery throughput as shard workers are added")
+    bench_shards.add_argument(
+        "--workers", type=lambda value: [int(part) for part in value.split(",")],
+        default=[1, 2, 4], help="Comma-separated worker process counts"
+    )
+    bench_shards.add_argument("--seconds", type=float, default=5.0, help="Measured time per worker count")
+    bench_shards.add_argument("--warmup", type=float, default=3.0, help="Seconds for worker start-up before measuring")
+    bench_shards.add_argument("--receivers", type=int, default=400, help="Receivers with active timers (split across workers)")
+    bench_shards.add_argument("--interval", type=int, default=1, help="Timer interval in seconds")
+    bench_shards.add_argument("--concurrency", type=int, default=64, help="In-flight sends in total, split across workers")
+    bench_shards.add_argument("--latency", type=float, default=0.01, help="Fake Bot API response delay")
+    bench_shards.add_argument("--ips", type=int, default=200000, help="Queue size")
+    bench_shards.add_argument("--save-interval", type=float, default=STATE_SAVE_INTERVAL,
+                              help="State service save batching in seconds (0 = save every commit)")
+    bench_shards.add_argument("--log-level", default="WARNING")
+    bench_shards.add_argument("--output", default="shards_bench_results.json", help="JSON results file")
+    bench_shards.add_argument("--baseline", help="Earlier results file to compare against")
+    
+    bench_loop = subparsers.add_parser("bench-loop", help="Compare event loop implementations against a local fake Bot API")
+    bench_loop.add_argument(
+        "--loops", type=lambda value: value.split(","), default=["asyncio", "uvloop"],
+        help="Comma-separated loops to compare (asyncio, uvloop)"
+    )
+    bench_loop.add_argument("--receivers", type=int, default=1000, help="Registered receivers")
+    bench_loop.add_argument("--history", type=int, default=10, help="Previously delivered IPs per receiver")
+    bench_loop.add_argument("--ips", type=int, default=0, help="Queue size (default: enough for the run)")
+    bench_loop.add_argument("--timers", type=int, default=50, help="Receivers with running timers")
+    bench_loop.add_argument("--interval", type=float, default=0.5, help="Timer interval in seconds")
+    bench_loop.add_argument("--seconds", type=float, default=5.0, help="Timer phase duration")
+    bench_loop.add_argument("--ops", type=int, default=1000, help="Concurrent \"Get IP Now\" presses")
+    bench_loop.add_argument("--latency", type=float, default=0.005, help="Fake Bot API response delay")
+    bench_loop.add_argument("--log-level", default="WARNING")
+    bench_loop.add_argument("--output", default="loop_bench_results.json", help="JSON results file")
+    bench_loop.add_argument("--baseline", help="Earlier results file to compare against")
+    
+    convert = subparsers.add_parser("convert-snapshot", help="Convert the JSON state file to a binary snapshot")
+    convert.add_argument("--input", default=DATA_FILE, help="Source state file (JSON or snapshot)")
+    convert.add_argument("--output", default=SNAPSHOT_FILE, help="Destination file")
+    convert.add_argument("--to-json", action="store_true", help="Convert a snapshot back to JSON instead")
+    
+    export = subparsers.add_parser("export", help="Stream state out as NDJSON (.gz = gzip)")
+    export.add_argument("--output", required=True, help="Destination file")
+    export.add_argument("--data-file", default=STATE_FILE, help="State file to export")
+    export.add_argument("--gzip", action="store_true", help="Gzip regardless of extension")
+    
+    import_ = subparsers.add_parser("import", help="Stream NDJSON records into the state file (bot stopped)")
+    import_.add_argument("--input", required=True, help="Source file")
+    import_.add_argument("--data-file", default=STATE_FILE, help="State file to import into")
+    import_.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Records per batch")
+    import_.add_argument("--replace", action="store_true", help="Clear existing state first (default: merge)")
+    import_.add_argument("--format", choices=("json", "snapshot"), default=DATA_FORMAT,
+                         help="State file format to write (snapshot keeps memory flat for large histories)")
+    import_.add_argument("--gzip", action="store_true", help="Gunzip regardless of extension")
+    
+    return parser.parse_args(argv)
+
+def cli(argv: Optional[List[str]] = None):
+    """Command-line entry point"""
+    args = parse_args(argv)
+    if args.command in ("bench", "simulate", "bench-http", "bench-bots", "bench-loop"):
+        import_telegram()  # The benchmarks (bench/ package) drive the real handlers
+    try:
+        if args.command == "bench":
+            from bench.handlers import run_benchmark_suite
+            run_benchmark_suite(args)
+        elif args.command == "simulate":
+            from bench.simulate import run_timer_simulation
+            run_timer_simulation(args)
+        elif args.command == "bench-http":
+            from bench.transport import run_transport_benchmark
+            run_transport_benchmark(args)
+        elif args.command == "bench-bots":
+            from bench.transport import run_delivery_bots_benchmark
+            run_delivery_bots_benchmark(args)
+        elif args.command == "bench-shards":
+            from bench.shards import run_shard_benchmark
+            run_shard_benchmark(args)
+        elif args.command == "bench-loop":
+            from bench.loops import run_loop_benchmark
+            run_loop_benchmark(args)
+        elif args.command == "convert-snapshot":
+            convert_state_file(args)
+        elif args.command == "export":
+            export_state(args)
+        elif args.command == "import":
+            import_state(args)
+        else:
+            main(profile_startup=args.startup_profile)
+    finally:
+        # Drain queued log records before the listener thread dies with the process
+        shutdown_logging()
 
 # ==============================
 # 🎯 ENTRY POINT
 # ==============================
 
+startup_profile.record("module import", IMPORT_STARTED)
+
+# Run as a script (or a spawn child of one): `import main` from bench/ gets this module, not a second copy
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault("main", sys.modules[__name__])
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,44 @@
+"""Shared fixtures - main.py is imported as a module from the repository root"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def snapshot_state(data: "main.BotData") -> dict:
+    """Everything BotData persists, in comparable form"""
+    return {
+        "senders": set(data.senders),
+        "receivers": set(data.receivers),
+        "ip_queue": list(data.queued_ips()),
+        "distributed_ips": {user_id: list(data.iter_delivered(user_id)) for user_id in data.distributed_ips},
+        "sending_active": data.sending_active,
+        "user_intervals": dict(data.user_intervals),
+        "active_timers": dict(data.active_timers),
+        "blocked_users": set(data.blocked_users),
+        "last_delivery": dict(data.last_delivery),
+        "receiver_tiers": dict(data.receiver_tiers),
+        "ip_expiry": dict(data.ip_expiry),
+    }
+
+@pytest.fixture
+def sample_data() -> "main.BotData":
+    """Small in-memory state touching every persisted field"""
+    data = main.BotData(data_file=None)
+    data.senders = {1, 2}
+    data.receivers = {10, 11, 12}
+    data.ip_queue = ["10.0.0.1", "10.0.0.2", "192.168.1.254"]
+    data.distributed_ips = {10: ["172.16.0.1", "172.16.0.2"], 11: ["8.8.8.8"], 12: []}
+    data.sending_active = True
+    data.user_intervals = {10: 60, 11: 300}
+    data.active_timers = {10: True, 11: False, 12: False}  # Blocking stops the timer
+    data.blocked_users = {12}
+    data.last_delivery = {10: 1700000000.5, 11: 1700000100.25}
+    data.receiver_tiers = {10: "premium", 11: "basic"}
+    data.ip_expiry = {"10.0.0.2": 1800000000.0}
+    return data
@@ -0,0 +1,77 @@
+"""Admission control: update classification and load shedding"""
+
+import asyncio
+from datetime import datetime
+
+import main
+
+main.import_telegram()
+from telegram import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+SENDER_ID = 1
+STRANGER_ID = 2
+
+
+def text_update(user_id: int, text: str) -> Update:
+    user = User(id=user_id, first_name="Test", is_bot=False)
+    message = Message(
+        message_id=1, date=datetime.now(), chat=Chat(id=user_id, type="private"), from_user=user, text=text,
+    )
+    return Update(update_id=1, message=message)
+
+def button_update(user_id: int, data: str) -> Update:
+    user = User(id=user_id, first_name="Test", is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=user, chat_instance="1", data=data))
+
+def test_classify_update(monkeypatch):
+    data = main.BotData(data_file=None)
+    data.senders = {SENDER_ID}
+    monkeypatch.setattr(main, "bot_data", data)
+    
+    assert main.classify_update(text_update(SENDER_ID, "10.0.0.1\n10.0.0.2")) == "push"
+    assert main.classify_update(text_update(STRANGER_ID, "hello?")) == "view"
+    assert main.classify_update(text_update(STRANGER_ID, "/get 300")) == "delivery"
+    assert main.classify_update(text_update(STRANGER_ID, "/status@AutoDropBot")) == "view"
+    assert main.classify_update(text_update(STRANGER_ID, "/start")) == "control"
+    assert main.classify_update(button_update(STRANGER_ID, "rcv:2")) == "view"
+    assert main.classify_update(button_update(STRANGER_ID, "get_ip")) == "delivery"
+    assert main.classify_update(object()) == "control"
+
+def test_overload_sheds_views_but_queues_pushes(monkeypatch):
+    data = main.BotData(data_file=None)
+    data.senders = {SENDER_ID}
+    monkeypatch.setattr(main, "bot_data", data)
+    monkeypatch.setattr(main, "ADMISSION_OVERLOAD_BACKLOG", 3)
+    monkeypatch.setattr(main, "ADMISSION_SHED_AFTER", 0)
+    classes = {name: dict(spec) for name, spec in main.ADMISSION_CLASSES.items()}
+    classes["view"]["queue"] = 2
+    ran = []
+    
+    async def handle(name: str, release: asyncio.Event = None):
+        if release:
+            await release.wait()
+        ran.append(name)
+    
+    async def run():
+        controller = main.AdmissionController(concurrency=1, classes=classes)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(controller.admit(object(), handle("busy", release)))]
+        
+        async def admit(update: Update, name: str):
+            tasks.append(asyncio.create_task(controller.admit(update, handle(name))))
+            await asyncio.sleep(0)
+        
+        await admit(text_update(STRANGER_ID, "spam 1"), "view1")
+        await admit(text_update(STRANGER_ID, "spam 2"), "view2")
+        await admit(text_update(STRANGER_ID, "spam 3"), "view3")  # View queue full
+        await admit(text_update(SENDER_ID, "10.0.0.1"), "push1")
+        await admit(text_update(STRANGER_ID, "spam 4"), "view4")  # Overloaded: shed on arrival
+        await admit(text_update(SENDER_ID, "10.0.0.2"), "push2")  # Pushes are never shed
+        assert controller.shed["view"] == 2
+        assert controller.shed["push"] == 0
+        
+        release.set()
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(run())
+    assert ran == ["busy", "push1", "push2", "view1", "view2"]
@@ -0,0 +1,71 @@
+"""Delivery audit log: segment indexes, sealing and lookups across reopen"""
+
+import asyncio
+
+import main
+
+
+def record_deliveries(log: "main.AuditLog", count: int):
+    for n in range(count):
+        log.record(100 + n % 3, f"10.0.{n // 256}.{n % 256}", "queue" if n % 2 else "timer")
+
+def test_audit_index_matches_in_memory_index(tmp_path):
+    log = main.AuditLog(str(tmp_path))
+    log.open()
+    record_deliveries(log, 50)
+    log.flush()
+    segment = log.active
+    ip_offsets = {ip: list(offsets) for ip, offsets in segment.ip_offsets.items()}
+    user_offsets = {user: list(offsets) for user, offsets in segment.user_offsets.items()}
+    
+    segment.write_index()
+    segment.open_index()
+    
+    assert segment.sealed
+    assert segment.index_map[:len(main.AUDIT_INDEX_MAGIC)] == main.AUDIT_INDEX_MAGIC
+    for ip, offsets in ip_offsets.items():
+        assert segment.ip_keys.offsets(ip) == offsets
+    for user, offsets in user_offsets.items():
+        assert segment.user_keys.offsets(user) == offsets
+    assert segment.ip_keys.offsets(main.ip_to_int("9.9.9.9")) == []
+    segment.close()
+
+def test_audit_log_reopen_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_SEGMENT_MAX_BYTES", 400)  # Several sealed segments
+    log = main.AuditLog(str(tmp_path))
+    log.open()
+    record_deliveries(log, 40)
+    expected_ip = log.lookup(ip="10.0.0.7")
+    expected_user = log.lookup(user_id=101, limit=100)
+    log.close()
+    
+    reopened = main.AuditLog(str(tmp_path))
+    reopened.open()
+    try:
+        assert len(reopened.segments) > 2
+        assert all(segment.sealed for segment in reopened.segments[:-1])
+        assert reopened.lookup(ip="10.0.0.7") == expected_ip == [expected_ip[0]]
+        assert reopened.lookup(user_id=101, limit=100) == expected_user
+        assert len(expected_user) == 13
+        timestamps = [record[0] for record in expected_user]
+        assert timestamps == sorted(timestamps, reverse=True)  # Newest first
+    finally:
+        reopened.close()
+
+def test_audit_seal_in_background_keeps_lookups_working(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_SEGMENT_MAX_BYTES", 400)
+    log = main.AuditLog(str(tmp_path))
+    
+    async def run():
+        log.open()
+        record_deliveries(log, 40)
+        before = log.lookup(user_id=102, limit=100)
+        for _ in range(100):
+            if all(segment.sealed for segment in log.segments[:-1]):
+                break
+            await asyncio.sleep(0.01)
+        assert all(segment.sealed for segment in log.segments[:-1])
+        assert log.lookup(user_id=102, limit=100) == before
+        log.close()
+    
+    asyncio.run(run())
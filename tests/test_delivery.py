@@ -0,0 +1,103 @@
+"""Reliable delivery: reserve / commit / rollback, blocking receivers and giving up on an IP"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+main.import_telegram()
+from telegram.error import Forbidden, NetworkError  # noqa: E402
+
+USER_ID = 7
+
+
+@pytest.fixture
+def data(monkeypatch) -> "main.BotData":
+    data = main.BotData(data_file=None)
+    data.receivers = {USER_ID}
+    data.active_timers[USER_ID] = True
+    data.sending_active = True
+    monkeypatch.setattr(main, "bot_data", data)
+    monkeypatch.setattr(main, "send_limiter", main.SendLimiter(4))
+    monkeypatch.setattr(main, "DELIVERY_RETRY_BASE_DELAY", 0.001)
+    return data
+
+class FailingBot:
+    """Bot whose sends of the IPs in fail raise error, others succeed"""
+    
+    def __init__(self, data: "main.BotData", fail=(), error: Exception = NetworkError("connection reset")):
+        self.data = data
+        self.fail = set(fail)
+        self.error = error
+        self.sent = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent.append(text)
+        if text in self.fail or not self.fail:
+            raise self.error
+        self.data.active_timers[chat_id] = False  # One good delivery ends the test
+        return SimpleNamespace(message_id=len(self.sent))
+
+def run_timer(bot: FailingBot):
+    asyncio.run(asyncio.wait_for(main.start_user_timer(USER_ID, 0.001, SimpleNamespace(bot=bot)), 5))
+
+def test_reserve_holds_the_ip_until_commit(data):
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    
+    ip = data.reserve_ip(USER_ID)
+    assert ip == "10.0.0.1"
+    assert data.ip_queue == ["10.0.0.2"]
+    assert data.queued_ips() == ["10.0.0.1", "10.0.0.2"]  # Persisted first, a crash can't lose it
+    
+    data.commit_ip(USER_ID, ip)
+    assert data.reservations == {}
+    assert data.distributed_ips[USER_ID] == ["10.0.0.1"]
+    assert data.reserve_ip(USER_ID) == "10.0.0.2"
+
+def test_rollback_requeues_at_the_front(data):
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    ip = data.reserve_ip(USER_ID)
+    
+    data.rollback_ip(USER_ID, ip)
+    
+    assert data.ip_queue == ["10.0.0.1", "10.0.0.2"]
+    assert data.reservations == {}
+    assert data.distributed_ips[USER_ID] == []
+
+def test_reserve_skips_excluded_ips(data):
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    
+    assert data.reserve_ip(USER_ID, exclude={"10.0.0.1"}) == "10.0.0.2"
+    assert data.reserve_ip(USER_ID, exclude={"10.0.0.1"}) is None
+
+def test_forbidden_delivery_blocks_the_receiver(data):
+    data.add_ips(["10.0.0.1"], ttl=0)
+    
+    run_timer(FailingBot(data, error=Forbidden("bot was blocked by the user")))
+    
+    assert USER_ID in data.blocked_users
+    assert data.active_timers[USER_ID] is False
+    assert data.ip_queue == ["10.0.0.1"]  # Requeued for other receivers
+
+def test_forbidden_no_ips_notice_blocks_the_receiver(data):
+    bot = FailingBot(data, error=Forbidden("bot was blocked by the user"))
+    
+    run_timer(bot)
+    
+    assert len(bot.sent) == 1
+    assert USER_ID in data.blocked_users
+    assert data.active_timers[USER_ID] is False
+
+def test_timer_gives_up_on_an_ip_and_moves_on(data, monkeypatch):
+    monkeypatch.setattr(main, "DELIVERY_MAX_ATTEMPTS", 3)
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    bot = FailingBot(data, fail={"10.0.0.1"})
+    
+    run_timer(bot)
+    
+    assert bot.sent == ["10.0.0.1"] * 3 + ["10.0.0.2"]
+    assert data.distributed_ips[USER_ID] == ["10.0.0.2"]
+    assert data.ip_queue == ["10.0.0.1"]  # Left for other receivers
+    assert USER_ID not in data.blocked_users
@@ -0,0 +1,38 @@
+"""Delivery bot fan-out: HashRing placement with minimal remapping, per-process rate budgets"""
+
+from types import SimpleNamespace
+
+import main
+
+
+def test_hash_ring_spreads_receivers_evenly():
+    ring = main.HashRing(["a", "b", "c", "d"])
+    owners = [ring.lookup(user_id) for user_id in range(20000)]
+    
+    for node in "abcd":
+        assert 0.15 < owners.count(node) / len(owners) < 0.35
+
+def test_hash_ring_adding_a_node_only_moves_its_share():
+    before = main.HashRing(["a", "b", "c", "d"])
+    after = main.HashRing(["a", "b", "c", "d", "e"])
+    moved = [user_id for user_id in range(20000) if before.lookup(user_id) != after.lookup(user_id)]
+    
+    assert all(after.lookup(user_id) == "e" for user_id in moved)
+    assert 0.1 < len(moved) / 20000 < 0.3
+
+def test_hash_ring_skips_nodes():
+    ring = main.HashRing(["a", "b", "c"])
+    for user_id in range(1000):
+        owner = ring.lookup(user_id)
+        fallback = ring.lookup(user_id, skip={owner})
+        assert fallback not in (owner, None)
+    assert ring.lookup(1, skip={"a", "b", "c"}) is None
+    assert main.HashRing([]).lookup(1) is None
+
+def test_delivery_bot_budgets_are_split_between_sending_processes():
+    pool = main.DeliveryBotPool(["200001:A"], rate=24, primary_rate=12)
+    pool.share = 3  # Primary plus two shard workers
+    pool.bots = {"200001": object()}
+    
+    assert pool.budget(SimpleNamespace(token="200001:A")).rate == 8
+    assert pool.budget(SimpleNamespace(token="100000:PRIMARY")).rate == 4
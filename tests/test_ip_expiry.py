@@ -0,0 +1,81 @@
+"""IP TTLs: expired queue entries are skipped, purged in chunks and never delivered"""
+
+import main
+
+
+def expiring_data() -> "main.BotData":
+    data = main.BotData(data_file=None)
+    data.receivers = {1, 2}
+    return data
+
+def test_purge_drops_only_expired_ips():
+    data = expiring_data()
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=60)
+    data.add_ips(["10.0.0.3"], ttl=0)
+    now = main.clock.time()
+    
+    assert data.purge_expired(now + 30) == 0
+    assert data.purge_expired(now + 120) == 2
+    assert data.ip_queue == ["10.0.0.3"]
+    assert data.ip_expiry == {}
+
+def test_reserve_skips_expired_ips():
+    data = expiring_data()
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    data.set_expiry("10.0.0.1", main.clock.time() - 1)
+    
+    assert data.reserve_ip(1) == "10.0.0.2"
+    assert data.reserve_ip(1) is None
+
+def test_delivering_one_copy_keeps_the_ttl_of_the_other():
+    data = expiring_data()
+    data.add_ips(["10.0.0.1"], ttl=60)
+    data.add_ips(["10.0.0.1"], ttl=60)
+    now = main.clock.time()
+    
+    ip = data.reserve_ip(1)
+    data.commit_ip(1, ip)
+    
+    assert data.ip_queue == ["10.0.0.1"]
+    assert data.purge_expired(now + 120) == 1
+    assert data.ip_queue == []
+    assert data.ip_expiry == {}
+
+def test_repush_without_ttl_clears_the_expiry():
+    data = expiring_data()
+    data.add_ips(["10.0.0.1"], ttl=60)
+    data.add_ips(["10.0.0.1"], ttl=0)
+    
+    assert data.purge_expired(main.clock.time() + 120) == 0
+    assert data.ip_queue == ["10.0.0.1", "10.0.0.1"]
+
+def test_rollback_drops_an_ip_that_expired_in_flight():
+    data = expiring_data()
+    data.add_ips(["10.0.0.1"], ttl=60)
+    ip = data.reserve_ip(1)
+    data.set_expiry(ip, main.clock.time() - 1)
+    
+    data.rollback_ip(1, ip)
+    
+    assert data.ip_queue == []
+    assert ip not in data.ip_expiry
+
+def test_chunked_drop_survives_queue_changes_between_steps():
+    data = expiring_data()
+    data.add_ips([f"10.0.0.{n}" for n in range(20)], ttl=0)
+    expires_at = main.clock.time() - 1
+    for n in range(0, 20, 2):
+        data.set_expiry(f"10.0.0.{n}", expires_at)
+    due = data.collect_expired(None)
+    
+    steps = data.drop_expired(due, chunk=3)
+    removed = next(steps)
+    held = data.reserve_ip(1)  # Pops from the front of the queue
+    removed += next(steps)
+    data.rollback_ip(1, held)  # Inserts at the front of the queue
+    data.add_ips(["10.0.0.100"], ttl=0)  # Appends behind the cursor
+    removed += sum(steps)
+    
+    assert removed == 10
+    assert data.ip_queue == [f"10.0.0.{n}" for n in range(1, 20, 2)] + ["10.0.0.100"]
+    assert data.ip_expiry == {}
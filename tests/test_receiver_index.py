@@ -0,0 +1,52 @@
+"""ReceiverIndex: cursor pagination behind the show_status receiver listing"""
+
+import main
+
+
+def receiver_index_data() -> "main.BotData":
+    data = main.BotData(data_file=None)
+    data.receivers = set(range(100, 125))
+    data.distributed_ips = {user_id: ["1.1.1.1"] * (user_id % 7) for user_id in data.receivers}
+    data.last_delivery = {user_id: 1700000000 + (user_id * 37) % 50 for user_id in data.receivers}
+    return data
+
+def test_receiver_index_pages_cover_every_receiver_in_order():
+    data = receiver_index_data()
+    index = main.ReceiverIndex()
+    index.rebuild(data)
+    
+    for order in main.ReceiverIndex.ORDERS:
+        seen, after = [], None
+        while True:
+            start, entries = index.page(order, after=after, size=4)
+            if not entries:
+                break
+            assert start == len(seen)
+            seen.extend(entries)
+            after = entries[-1]
+        assert seen == sorted(seen)
+        assert sorted(user_id for _, user_id in seen) == sorted(data.receivers)
+    
+    by_count = [user_id for _, user_id in index.sorted["count"]]
+    assert by_count == sorted(data.receivers, key=lambda user_id: (-(user_id % 7), user_id))
+
+def test_receiver_index_pages_backwards():
+    data = receiver_index_data()
+    index = main.ReceiverIndex()
+    index.rebuild(data)
+    
+    _, first = index.page("count", size=5)
+    start, second = index.page("count", after=first[-1], size=5)
+    assert start == 5
+    assert index.page("count", before=second[0], size=5) == (0, first)
+
+def test_receiver_index_update_moves_one_receiver():
+    data = receiver_index_data()
+    index = main.ReceiverIndex()
+    index.rebuild(data)
+    
+    index.update(100, 50, 1800000000)
+    
+    assert index.page("count", size=1)[1] == [(-50, 100)]
+    assert index.page("recent", size=1)[1] == [(-1800000000000, 100)]
+    assert len(index.sorted["count"]) == len(data.receivers)
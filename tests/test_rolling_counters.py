@@ -0,0 +1,25 @@
+"""RollingCounters: fixed-memory throughput windows"""
+
+import main
+
+
+def test_rolling_counters_windows():
+    counters = main.RollingCounters(width=60, size=3)
+    counters.add("delivered", 0)
+    counters.add("delivered", 61, count=2)
+    counters.add("delivered", 125, count=4)
+    counters.add("failed", 125)
+    
+    assert counters.total("delivered", 125, buckets=1) == 4
+    assert counters.total("delivered", 125, buckets=2) == 6
+    assert counters.total("delivered", 125, buckets=3) == 7
+    assert counters.total("delivered", 125, buckets=10) == 7  # Clamped to the ring size
+    assert counters.total("failed", 125, buckets=3) == 1
+
+def test_rolling_counters_forget_wrapped_periods():
+    counters = main.RollingCounters(width=60, size=3)
+    counters.add("delivered", 0, count=5)
+    counters.add("delivered", 180)  # Same slot, next lap: the old count is dropped
+    
+    assert counters.total("delivered", 180, buckets=3) == 1
+    assert counters.total("delivered", 600, buckets=3) == 0  # Nothing recent
@@ -0,0 +1,70 @@
+"""SendLimiter: bounded in-flight sends over the pooled transport, served by tier priority"""
+
+import asyncio
+
+import main
+
+
+def test_send_limiter_caps_in_flight_sends():
+    peak = 0
+    
+    async def run():
+        limiter = main.SendLimiter(3)
+        
+        async def send():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.001)
+        
+        await asyncio.gather(*(send() for _ in range(20)))
+        assert limiter.in_flight == 0 and not limiter.queue
+    
+    asyncio.run(run())
+    assert peak == 3
+
+def test_send_limiter_skips_cancelled_waiters():
+    order = []
+    
+    async def run():
+        limiter = main.SendLimiter(1)
+        await limiter.acquire()
+        
+        async def send(name: str, priority: int):
+            async with limiter.slot(priority):
+                order.append(name)
+        
+        cancelled = asyncio.create_task(send("cancelled", 2))
+        waiting = asyncio.create_task(send("waiting", 0))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        await waiting
+        assert limiter.in_flight == 0
+    
+    asyncio.run(run())
+    assert order == ["waiting"]
+
+def test_send_limiter_serves_higher_priority_first():
+    order = []
+    
+    async def run():
+        limiter = main.SendLimiter(1)
+        await limiter.acquire()  # Hold the only slot while the others queue up
+        
+        async def send(name: str, priority: int):
+            async with limiter.slot(priority):
+                order.append(name)
+        
+        tasks = []
+        for name, priority in [("basic1", 0), ("premium1", 2), ("standard", 1), ("premium2", 2), ("basic2", 0)]:
+            tasks.append(asyncio.create_task(send(name, priority)))
+            await asyncio.sleep(0)
+        assert limiter.waiting == 5
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert limiter.in_flight == 0
+    
+    asyncio.run(run())
+    assert order == ["premium1", "premium2", "standard", "basic1", "basic2"]
@@ -0,0 +1,73 @@
+"""Drain-and-flush shutdown: in-flight sends commit, the rest is requeued, one final write"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+SENDING, IDLE = 1, 2
+
+
+class SlowBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+@pytest.fixture
+def data(tmp_path, monkeypatch) -> "main.BotData":
+    data = main.BotData(str(tmp_path / "state.json"))
+    data.receivers = {SENDING, IDLE}
+    data.active_timers = {SENDING: True, IDLE: True}
+    data.sending_active = True
+    data.add_ips(["10.0.0.1", "10.0.0.2"], ttl=0)
+    monkeypatch.setattr(main, "bot_data", data)
+    monkeypatch.setattr(main, "send_limiter", main.SendLimiter(4))
+    monkeypatch.setattr(main, "user_timers", {})
+    return data
+
+def saves() -> int:
+    return main.metrics.counters.get("saves_total", {}).get((), 0)
+
+def drain_with_send_in_flight(monkeypatch, latency: float, drain_timeout: float) -> SlowBot:
+    coordinator = main.ShutdownCoordinator(drain_timeout=drain_timeout)
+    monkeypatch.setattr(main, "shutdown", coordinator)
+    bot = SlowBot(latency)
+    app = SimpleNamespace(bot=bot)
+    
+    async def run():
+        main.user_timers[SENDING] = asyncio.create_task(main.start_user_timer(SENDING, 0.001, app))
+        main.user_timers[IDLE] = asyncio.create_task(main.start_user_timer(IDLE, 3600, app))
+        while SENDING not in coordinator.sending:
+            await asyncio.sleep(0.001)
+        before = saves()
+        await coordinator.drain()
+        assert saves() - before == 1  # Commits and timer flags land in one write
+    
+    asyncio.run(run())
+    assert coordinator.drained
+    assert main.user_timers == {}
+    return bot
+
+def test_drain_lets_the_send_in_flight_commit(data, monkeypatch):
+    bot = drain_with_send_in_flight(monkeypatch, latency=0.05, drain_timeout=5)
+    
+    assert bot.sent == [(SENDING, "10.0.0.1")]
+    assert data.distributed_ips[SENDING] == ["10.0.0.1"]
+    assert data.ip_queue == ["10.0.0.2"]
+    assert data.active_timers == {SENDING: False, IDLE: False}
+    assert main.BotData(data.data_file).active_timers == {SENDING: False, IDLE: False}
+
+def test_drain_requeues_a_send_past_the_deadline(data, monkeypatch):
+    bot = drain_with_send_in_flight(monkeypatch, latency=10, drain_timeout=0.05)
+    
+    assert bot.sent == []
+    assert data.distributed_ips.get(SENDING, []) == []
+    assert data.ip_queue == ["10.0.0.1", "10.0.0.2"]
+    assert main.BotData(data.data_file).ip_queue == ["10.0.0.1", "10.0.0.2"]
@@ -0,0 +1,35 @@
+"""Binary snapshot format: write_snapshot / BotData.load_snapshot round-trips"""
+
+import pytest
+
+import main
+from conftest import snapshot_state
+
+
+def test_snapshot_round_trip(tmp_path, sample_data):
+    path = str(tmp_path / "state.snap")
+    main.write_snapshot(path, sample_data)
+    
+    assert main.is_snapshot_file(path)
+    loaded = main.BotData(path)
+    assert isinstance(loaded.distributed_ips, main.LazyIPHistory)
+    assert snapshot_state(loaded) == snapshot_state(sample_data)
+
+def test_snapshot_rewrite_from_lazy_history(tmp_path, sample_data):
+    first, second = str(tmp_path / "first.snap"), str(tmp_path / "second.snap")
+    main.write_snapshot(first, sample_data)
+    loaded = main.BotData(first)
+    loaded.distributed_ips[10].append("172.16.0.3")  # One user materialised, the other stays packed
+    main.write_snapshot(second, loaded)
+    
+    expected = snapshot_state(sample_data)
+    expected["distributed_ips"][10].append("172.16.0.3")
+    assert snapshot_state(main.BotData(second)) == expected
+
+def test_snapshot_rejects_json_state(tmp_path, sample_data):
+    path = str(tmp_path / "state.json")
+    sample_data.data_file = path
+    sample_data.save_data()
+    assert not main.is_snapshot_file(path)
+    with pytest.raises(ValueError):
+        main.Snapshot(path)
@@ -0,0 +1,83 @@
+"""Interactive throttling and view caching: repeats are dropped, distinct requests are not"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+USER_ID = 5
+
+
+@pytest.fixture(autouse=True)
+def fresh_throttle(monkeypatch):
+    monkeypatch.setattr(main, "user_throttle", main.UserThrottle(window=60))
+
+def command(args):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=USER_ID), callback_query=None), SimpleNamespace(args=args)
+
+class Query:
+    def __init__(self, data: str):
+        self.data = data
+        self.answered = 0
+    
+    async def answer(self, *args, **kwargs):
+        self.answered += 1
+
+def test_command_throttle_key_includes_arguments():
+    calls = []
+    
+    @main.throttled()
+    async def get_command(update, context):
+        calls.append(list(context.args))
+    
+    async def run():
+        for args in (["300"], ["600"], ["600"], ["300"], []):
+            await get_command(*command(args))
+    
+    asyncio.run(run())
+    assert calls == [["300"], ["600"], []]
+
+def test_repeated_button_is_answered_and_dropped():
+    calls = []
+    
+    @main.throttled()
+    async def button_handler(update, context):
+        calls.append(update.callback_query.data)
+    
+    async def run():
+        queries = [Query("status"), Query("status"), Query("rcv:2")]
+        for query in queries:
+            await button_handler(SimpleNamespace(effective_user=SimpleNamespace(id=USER_ID), callback_query=query), None)
+        return queries
+    
+    queries = asyncio.run(run())
+    assert calls == ["status", "rcv:2"]
+    assert [query.answered for query in queries] == [0, 1, 0]
+
+def test_running_action_is_not_started_twice():
+    throttle = main.UserThrottle(window=0)
+    
+    async def run():
+        assert throttle.acquire(USER_ID, "get_command 300")
+        assert not throttle.acquire(USER_ID, "get_command 300")
+        throttle.release(USER_ID, "get_command 300")
+        assert throttle.acquire(USER_ID, "get_command 300")
+    
+    asyncio.run(run())
+
+def test_render_cache_reuses_text_until_the_version_changes():
+    cache = main.RenderCache(ttl=60)
+    renders = []
+    
+    def render():
+        renders.append(1)
+        return f"render {len(renders)}"
+    
+    async def run():
+        assert cache.get_or_render("status", 1, render) == "render 1"
+        assert cache.get_or_render("status", 1, render) == "render 1"
+        assert cache.get_or_render("status", 2, render) == "render 2"
+    
+    asyncio.run(run())